@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'portfolio.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,6 +70,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Pagination of the market list is carried in headers
+CORS_EXPOSE_HEADERS = ["X-Total-Count", "Link"]
 
 ROOT_URLCONF = 'CryptoBase.urls'
 
@@ -92,6 +95,10 @@ TEMPLATES = [
 ASGI_APPLICATION = 'CryptoBase.asgi.application'
 WSGI_APPLICATION = 'CryptoBase.wsgi.application'
 
+# Route the market list, detail and portfolio summary endpoints to the async views
+# (portfolio.async_views); only worthwhile when serving CryptoBase.asgi.application
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -173,3 +180,55 @@ CHANNEL_LAYERS = {
         },
     },
 }
+
+# CoinGecko upstream client (portfolio.coingecko)
+COINGECKO_BASE_URL = config('COINGECKO_BASE_URL', default='https://api.coingecko.com/api/v3')
+COINGECKO_MAX_CONNECTIONS = config('COINGECKO_MAX_CONNECTIONS', default=20, cast=int)
+COINGECKO_MAX_KEEPALIVE_CONNECTIONS = config('COINGECKO_MAX_KEEPALIVE_CONNECTIONS', default=10, cast=int)
+COINGECKO_KEEPALIVE_EXPIRY = config('COINGECKO_KEEPALIVE_EXPIRY', default=60, cast=float)
+COINGECKO_TIMEOUT = config('COINGECKO_TIMEOUT', default=10, cast=float)
+COINGECKO_CONNECT_TIMEOUT = config('COINGECKO_CONNECT_TIMEOUT', default=5, cast=float)
+COINGECKO_HTTP2 = config('COINGECKO_HTTP2', default=True, cast=bool)
+
+# Cluster-wide CoinGecko quota (portfolio.ratelimit), shared by all workers through Redis
+COINGECKO_RATE_LIMIT_PER_MINUTE = config('COINGECKO_RATE_LIMIT_PER_MINUTE', default=30, cast=int)
+COINGECKO_RATE_LIMIT_BURST = config('COINGECKO_RATE_LIMIT_BURST', default=10, cast=int)
+# Tokens background prefetch leaves for user-facing requests
+COINGECKO_RATE_LIMIT_RESERVE = config('COINGECKO_RATE_LIMIT_RESERVE', default=3, cast=int)
+# Longest a user-facing request queues for quota before failing
+COINGECKO_RATE_LIMIT_MAX_WAIT = config('COINGECKO_RATE_LIMIT_MAX_WAIT', default=5, cast=float)
+COINGECKO_MAX_RETRIES = config('COINGECKO_MAX_RETRIES', default=2, cast=int)
+COINGECKO_BACKOFF_BASE = config('COINGECKO_BACKOFF_BASE', default=1, cast=float)
+
+# Soft/hard TTLs in seconds per cache key family (portfolio.caching). After the soft TTL
+# the stale value is served while one background refresh runs; after the hard TTL the
+# entry is gone and the next request waits for CoinGecko.
+CACHE_TTLS = {
+    "crypto_list": (5 * 60, 60 * 60),
+    "crypto_detail": (5 * 60, 60 * 60),
+    "coingecko_prices": (60, 60 * 60),
+    "chart_data_5min": (5 * 60, 60 * 60),          # 5 minutes for 5-minute chart
+    "chart_data_hourly": (60 * 60, 6 * 60 * 60),   # 1 hour for the time schedule
+    "chart_data_daily": (24 * 60 * 60, 2 * 24 * 60 * 60),  # 1 day for daily schedule
+    "portfolio_history": (5 * 60, 60 * 60),  # keyed by ledger version, so new transactions never wait for it
+    "coin_list": (6 * 60 * 60, 2 * 24 * 60 * 60),  # every coin CoinGecko knows, behind coin search
+    "fx_rates": (10 * 60, 24 * 60 * 60),  # one USD based rate table behind every non-USD response
+}
+
+# In-process LRU in front of Redis for the hottest key families (portfolio.localcache).
+# Entries live at most LOCAL_CACHE_TTL seconds; rewrites are broadcast over Redis pub/sub
+# so other processes drop their copy immediately.
+LOCAL_CACHE_FAMILIES = ["crypto_list", "crypto_detail", "chart_data_5min", "chart_data_hourly", "chart_data_daily", "fx_rates"]
+LOCAL_CACHE_TTL = config('LOCAL_CACHE_TTL', default=10, cast=float)
+LOCAL_CACHE_MAX_ENTRIES = config('LOCAL_CACHE_MAX_ENTRIES', default=256, cast=int)
+
+# Coins in the cached /coins/markets snapshot behind the list endpoint, fetched 250 per call
+MARKET_SNAPSHOT_SIZE = config('MARKET_SNAPSHOT_SIZE', default=2000, cast=int)
+
+# Background market data poller (python manage.py poll_market_data)
+POLLER_TOP_N = config('POLLER_TOP_N', default=50, cast=int)
+POLLER_CALLS_PER_MINUTE = config('POLLER_CALLS_PER_MINUTE', default=25, cast=int)
+POLLER_INTERVAL = config('POLLER_INTERVAL', default=60, cast=int)
+
+# Prometheus scrape endpoint (/metrics); when set, scrapers must send "Authorization: Bearer <token>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
@@ -0,0 +1,211 @@
+import logging
+import math
+import time
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from .metrics import price_alerts_fired
+from .models import PriceAlert
+
+# Rows per chunk while the book is loaded, and ids per confirm/update query when alerts fire
+LOAD_CHUNK_SIZE = 20000
+FIRE_BATCH_SIZE = 5000
+# Deleted alerts stay in the book until they are crossed or the book is rebuilt
+RELOAD_INTERVAL = 60 * 60
+
+
+def alert_group_name(user_id):
+    return f"alerts.{user_id}"
+
+
+class Thresholds:
+    """Alerts of one coin and direction as parallel arrays sorted by threshold."""
+
+    def __init__(self, prices, ids, users):
+        order = np.argsort(prices, kind="stable")
+        self.prices, self.ids, self.users = prices[order], ids[order], users[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def merge(self, other):
+        # Both sides are sorted, so the new alerts go in at their search positions without a resort
+        at = np.searchsorted(self.prices, other.prices, side="right")
+        self.prices = np.insert(self.prices, at, other.prices)
+        self.ids = np.insert(self.ids, at, other.ids)
+        self.users = np.insert(self.users, at, other.users)
+
+    def cross(self, price, direction):
+        """Remove and return (thresholds, ids, users) of the alerts `price` crosses."""
+        # "above" alerts fire at or under the price, a prefix of the sorted thresholds; "below" ones a suffix
+        if direction == "above":
+            split = np.searchsorted(self.prices, price, side="right")
+            crossed, kept = slice(None, split), slice(split, None)
+        else:
+            split = np.searchsorted(self.prices, price, side="left")
+            crossed, kept = slice(split, None), slice(None, split)
+        taken = (self.prices[crossed], self.ids[crossed], self.users[crossed])
+        self.prices, self.ids, self.users = self.prices[kept], self.ids[kept], self.users[kept]
+        return taken
+
+
+class AlertBook:
+    """Every active alert, grouped per (coin_id, direction) and sorted by threshold.
+
+    A price only ever touches the alerts it crosses: one binary search per coin and
+    direction finds them, and they leave the book as a slice.
+    """
+
+    def __init__(self):
+        self.thresholds = {}
+        self.max_id = 0
+
+    def __len__(self):
+        return sum(len(thresholds) for thresholds in self.thresholds.values())
+
+    def coin_ids(self):
+        return sorted({coin_id for (coin_id, _), thresholds in self.thresholds.items() if len(thresholds)})
+
+    def add(self, rows):
+        """Add (id, user_id, coin_id, direction, price_usd) rows."""
+        grouped = {}
+        for alert_id, user_id, coin_id, direction, price_usd in rows:
+            columns = grouped.setdefault((coin_id, direction), ([], [], []))
+            columns[0].append(float(price_usd))
+            columns[1].append(alert_id)
+            columns[2].append(user_id)
+            self.max_id = max(self.max_id, alert_id)
+
+        for key, (prices, ids, users) in grouped.items():
+            added = Thresholds(np.array(prices, dtype=float), np.array(ids, dtype=np.int64), np.array(users, dtype=np.int64))
+            if key in self.thresholds:
+                self.thresholds[key].merge(added)
+            else:
+                self.thresholds[key] = added
+
+    def cross(self, prices):
+        """Alerts crossed by a {coin_id: usd price} batch, as (coin_id, direction, price, (thresholds, ids, users)).
+
+        Crossed alerts are removed from the book.
+        """
+        crossed = []
+        for coin_id, price in prices.items():
+            # A missing or NaN price would sort past every threshold
+            if not isinstance(price, (int, float)) or not math.isfinite(price):
+                continue
+            for direction in ("above", "below"):
+                thresholds = self.thresholds.get((coin_id, direction))
+                if thresholds is None or not len(thresholds):
+                    continue
+                taken = thresholds.cross(price, direction)
+                if len(taken[1]):
+                    crossed.append((coin_id, direction, price, taken))
+        return crossed
+
+
+class AlertEngine:
+    """Evaluates every active PriceAlert against each refreshed price batch and pushes fired alerts.
+
+    The book is built once and then only extended with alerts newer than the last one
+    loaded. The database stays the authority: a crossed alert only fires if its row is
+    still active, which drops alerts deleted since they were loaded. Rows locked by
+    another transaction are skipped rather than waited on and go back into the book.
+    """
+
+    def __init__(self):
+        self.book = None
+        self.loaded_at = None
+
+    def sync(self):
+        if self.book is None or time.monotonic() - self.loaded_at > RELOAD_INTERVAL:
+            book = AlertBook()
+            self.loaded_at = time.monotonic()
+        else:
+            book = self.book
+        rows = (
+            PriceAlert.objects.filter(is_active=True, id__gt=book.max_id)
+            .values_list("id", "user_id", "coin_id", "direction", "price_usd")
+            .iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+        book.add(rows)
+        self.book = book
+        return book
+
+    def coin_ids(self):
+        return self.sync().coin_ids()
+
+    def confirm(self, ids, price):
+        """The ids of `ids` that were still active and are now marked triggered at `price`."""
+        fired = []
+        now = timezone.now()
+        for start in range(0, len(ids), FIRE_BATCH_SIZE):
+            chunk = ids[start:start + FIRE_BATCH_SIZE].tolist()
+            with transaction.atomic():
+                active = list(
+                    PriceAlert.objects.select_for_update(skip_locked=True)
+                    .filter(id__in=chunk, is_active=True)
+                    .values_list("id", flat=True)
+                )
+                PriceAlert.objects.filter(id__in=active).update(is_active=False, triggered_at=now, triggered_price_usd=price)
+            fired.extend(active)
+        return fired, now
+
+    def restore(self, ids):
+        """Put crossed alerts that did not fire but are still active back into the book.
+
+        Those are rows another transaction held locked, so a later batch gets to retry them
+        instead of losing them if that transaction rolls back.
+        """
+        for start in range(0, len(ids), FIRE_BATCH_SIZE):
+            chunk = ids[start:start + FIRE_BATCH_SIZE].tolist()
+            self.book.add(
+                PriceAlert.objects.filter(id__in=chunk, is_active=True)
+                .values_list("id", "user_id", "coin_id", "direction", "price_usd")
+            )
+
+    def evaluate(self, prices):
+        """Fire the alerts crossed by a {coin_id: usd price} batch; returns their notifications."""
+        fired = []
+        for coin_id, direction, price, (thresholds, ids, users) in self.sync().cross(prices):
+            confirmed, triggered_at = self.confirm(ids, price)
+            mask = np.isin(ids, confirmed)
+            if not mask.all():
+                self.restore(ids[~mask])
+            fired.extend(
+                {
+                    "id": alert_id,
+                    "user_id": user_id,
+                    "coin_id": coin_id,
+                    "direction": direction,
+                    "price_usd": threshold,
+                    "triggered_price_usd": price,
+                    "triggered_at": triggered_at.isoformat(),
+                }
+                for alert_id, user_id, threshold in zip(ids[mask].tolist(), users[mask].tolist(), thresholds[mask].tolist())
+            )
+        price_alerts_fired.inc(len(fired))
+        return fired
+
+    async def notify(self, fired):
+        # One message per user per batch, to every socket the user has open
+        by_user = {}
+        for alert in fired:
+            by_user.setdefault(alert["user_id"], []).append({key: value for key, value in alert.items() if key != "user_id"})
+
+        channel_layer = get_channel_layer()
+        for user_id, alerts in by_user.items():
+            await channel_layer.group_send(alert_group_name(user_id), {"type": "alert.fired", "alerts": alerts})
+
+    async def process(self, prices):
+        try:
+            fired = await sync_to_async(self.evaluate)(prices)
+        except Exception:
+            # Crossed alerts have already left the book; a reload brings back the ones that never fired
+            self.book = None
+            raise
+        if fired:
+            logging.info(f"{len(fired)} price alerts fired")
+            await self.notify(fired)
+        return fired
@@ -0,0 +1,188 @@
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from . import coingecko
+from .broadcast import CHART_REFRESH_INTERVALS, snapshot_message
+from .caching import aentry_version, aget_or_fetch, is_error
+from .fx import afx_version, ausd_rate, convert_points, parse_currency, usd_bounds
+from .history import aget_portfolio_history
+from .holdings import aggregate_holdings
+from .markets import MARKETS_CACHE_KEY, aget_market_snapshot, arefresh_market_snapshot, market_index, parse_market_query
+from .models import PortfolioTransaction, PortfolioHolding
+from .prices import aget_prices
+from .search import aget_search_index, parse_search_query
+from .services import getChartDataAsync
+from .views import (
+    add_page_headers, add_version_headers, not_modified, format_crypto_list, format_crypto_detail, parse_chart_query,
+    summary_from_holdings, summary_from_ledger, summarize_portfolio,
+)
+
+# Async counterparts of the market and portfolio views. Under ASGI they await the cache, the
+# ORM and CoinGecko directly instead of holding a sync_to_async thread for the whole round-trip.
+# They are plain Django views because DRF's APIView is sync only; routing is in urls.py.
+
+
+async def get_cached_data_async(cache_key, url, params=None):
+    async def fetch():
+        try:
+            response = await coingecko.aget(url, params=params)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": "Failed to fetch data from CoinGecko"}
+        except httpx.RequestError as e:
+            return {"error": f"Request failed: {str(e)}"}
+
+    return await aget_or_fetch(cache_key, fetch)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    # DRF's encoder so Decimals and dates serialize exactly as the sync views render them
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """The JWT user of the request, or None; the same check the DRF views run."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def unauthorized():
+    return json_response({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class AsyncCryptoListView(View):
+    async def get(self, request):
+        try:
+            query = parse_market_query(request.GET)
+            currency = parse_currency(request.GET.get("currency"))
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.GET.get("refresh") == "true":
+            await arefresh_market_snapshot()
+
+        snapshot_version = await aentry_version(MARKETS_CACHE_KEY)
+        version = await afx_version(snapshot_version, currency)
+        data = await aget_market_snapshot()
+
+        if "error" in data:
+            return json_response(data, status=status.HTTP_502_BAD_GATEWAY)
+
+        try:
+            rate = await ausd_rate(currency)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return json_response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        response = not_modified(request, version)
+        if response is not None:
+            return response
+
+        query["filters"] = usd_bounds(query["filters"], rate)
+        total, coins = market_index(data, snapshot_version).query(**query)
+        response = add_version_headers(json_response(format_crypto_list(coins, rate)), version)
+        return add_page_headers(response, request, total, query["page"], query["page_size"])
+
+
+class AsyncCryptoDetailView(View):
+    async def get(self, request, slug):
+        try:
+            currency = parse_currency(request.GET.get("currency"))
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f"crypto_detail_{slug}"
+        version = await afx_version(await aentry_version(cache_key), currency)
+        data = await get_cached_data_async(cache_key, f"/coins/{slug}")
+
+        if "error" in data:
+            return json_response(data, status=status.HTTP_502_BAD_GATEWAY)
+
+        try:
+            rate = await ausd_rate(currency)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return json_response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        return not_modified(request, version) or add_version_headers(json_response(format_crypto_detail(data, rate)), version)
+
+
+class AsyncChartView(View):
+    async def get(self, request, slug):
+        try:
+            interval_type, chart_type, max_points = parse_chart_query(request.GET)
+            rate = await ausd_rate(parse_currency(request.GET.get("currency")))
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return json_response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        chart_data = await getChartDataAsync(slug, interval_type, chart_type, max_points)
+
+        if is_error(chart_data):
+            return json_response(chart_data, status=status.HTTP_502_BAD_GATEWAY)
+
+        return json_response(snapshot_message(slug, interval_type, chart_type, convert_points(chart_data, rate, chart_type)))
+
+
+class AsyncCoinSearchView(View):
+    async def get(self, request):
+        try:
+            query, limit = parse_search_query(request.GET)
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        index = await aget_search_index()
+        if is_error(index):
+            return json_response(index, status=status.HTTP_502_BAD_GATEWAY)
+
+        return json_response({"query": query, "results": index.search(query, limit)})
+
+
+class AsyncPortfolioSummaryView(View):
+    async def get(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        try:
+            rate = await ausd_rate(parse_currency(request.GET.get("currency")))
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return json_response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        if request.GET.get("source") == "ledger":
+            rows = aggregate_holdings(PortfolioTransaction.objects.filter(user=user))
+            summary = summary_from_ledger([row async for row in rows])
+        else:
+            holdings = PortfolioHolding.objects.filter(user=user).order_by("id")
+            summary = summary_from_holdings([holding async for holding in holdings])
+
+        prices = await aget_prices(summary.keys())
+
+        return json_response(summarize_portfolio(summary, prices, rate))
+
+
+class AsyncPortfolioHistoryView(View):
+    async def get(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        interval_type = request.GET.get("interval_type", "daily")
+        if interval_type not in CHART_REFRESH_INTERVALS:
+            return json_response({"error": f"Invalid interval_type: {interval_type}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return json_response(await aget_portfolio_history(user, interval_type))
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from portfolio import broadcast
+from portfolio.holdings import rebuild_holdings
+from portfolio.models import PortfolioTransaction
+from portfolio.routing import websocket_urlpatterns
+from .stub import coin_ids
+
+# Results are compared on these; the rest of a result is context
+COMPARED_METRICS = {"p99_ms": "higher", "throughput_rps": "lower"}
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles of one scenario; latencies in seconds."""
+    latencies = np.array(latencies, dtype=float) * 1000
+    if not len(latencies):
+        return {"requests": 0, "errors": errors, "throughput_rps": 0.0, "mean_ms": None, "p50_ms": None, "p99_ms": None}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def compare(results, baseline, max_regression=0.2):
+    """Scenarios of `results` that are more than max_regression worse than `baseline` on a compared metric.
+
+    Returns (scenario, metric, baseline value, current value) tuples; scenarios missing on either side are skipped.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, worse in COMPARED_METRICS.items():
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            if worse == "higher" and after > before * (1 + max_regression):
+                regressions.append((name, metric, before, after))
+            elif worse == "lower" and after < before * (1 - max_regression):
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+def is_ok(status_code):
+    return status_code < 400
+
+
+def run_threaded(url, headers, total, concurrency):
+    """Issue `total` GETs from `concurrency` threads, each with its own test client."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def worker():
+        nonlocal errors
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                response = client.get(url, headers=headers)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    errors += not is_ok(response.status_code)
+        finally:
+            # Worker threads open their own connections; the test database cannot be dropped while they live
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def run_concurrent(url, headers, total, concurrency):
+    """Async counterpart of run_threaded for ASYNC_VIEWS: `concurrency` tasks on one event loop."""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+    client = AsyncClient()
+
+    async def worker():
+        nonlocal errors
+        while next(remaining, None) is not None:
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            errors += not is_ok(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    await sync_to_async(connections.close_all)()
+    return summarize(latencies, elapsed, errors)
+
+
+def run_load(url, headers=None, total=200, concurrency=10):
+    headers = headers or {}
+    if settings.ASYNC_VIEWS:
+        return asyncio.run(run_concurrent(url, headers, total, concurrency))
+    return run_threaded(url, headers, total, concurrency)
+
+
+def view_targets():
+    return {
+        "crypto-list": reverse("crypto-list"),
+        "crypto-details": reverse("crypto-details", kwargs={"slug": "bitcoin"}),
+        "crypto-chart": reverse("crypto-chart", kwargs={"slug": "bitcoin"}) + "?interval_type=hourly&max_points=200",
+        "coin-search": reverse("coin-search") + "?q=coi",
+    }
+
+
+def create_ledger(size, coins=20, seed=0):
+    """A user with `size` transactions over `coins` coins, spread over the past year. Returns the user."""
+    rng = random.Random(seed + size)
+    user = get_user_model().objects.create_user(
+        username=f"benchmark_{size}", email=f"benchmark_{size}@example.com", password=None
+    )
+    now = timezone.now()
+    ids = coin_ids()[:coins]
+    transactions = [
+        PortfolioTransaction(
+            user=user,
+            coin_id=ids[i % coins],
+            # Mostly buys, so positions stay open and every coin needs a price
+            type="sell" if i % 5 == 4 else "buy",
+            amount=Decimal("0.1") if i % 5 == 4 else Decimal(rng.randint(1, 100)) / 100,
+            price_usd=Decimal(rng.randint(100, 100000)),
+            fee=Decimal("0.5"),
+        )
+        for i in range(size)
+    ]
+    transactions = PortfolioTransaction.objects.bulk_create(transactions)
+
+    # timestamp is auto_now_add, so the spread is applied after the insert
+    for i, tx in enumerate(transactions):
+        tx.timestamp = now - timedelta(days=365) + timedelta(days=365) * i / max(size, 1)
+    PortfolioTransaction.objects.bulk_update(transactions, ["timestamp"], batch_size=1000)
+    rebuild_holdings(user)
+    return user
+
+
+def auth_headers(user):
+    return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+
+async def consumer_fanout(subscribers, publishes=10, slug="bitcoin"):
+    """Join `subscribers` WebSocket clients to one chart stream, then time snapshot joins and publish delivery."""
+    application = URLRouter(websocket_urlpatterns)
+    communicators = [WebsocketCommunicator(application, f"/ws/crypto/{slug}/") for _ in range(subscribers)]
+
+    joins = []
+    start = time.perf_counter()
+    for communicator in communicators:
+        joined = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=10)
+        if not connected:
+            raise RuntimeError("WebSocket connection was refused")
+        await communicator.receive_from(timeout=10)
+        joins.append(time.perf_counter() - joined)
+    join_elapsed = time.perf_counter() - start
+
+    producer = broadcast._producers[(slug, "daily", "line")]
+    deliveries, fanouts, sizes = [], [], []
+
+    async def receive(communicator, published):
+        message = await communicator.receive_from(timeout=10)
+        deliveries.append(time.perf_counter() - published)
+        sizes.append(len(message))
+
+    start = time.perf_counter()
+    for _ in range(publishes):
+        published = time.perf_counter()
+        await producer.publish()
+        await asyncio.gather(*[receive(communicator, published) for communicator in communicators])
+        fanouts.append(time.perf_counter() - published)
+    delivery_elapsed = time.perf_counter() - start
+
+    for communicator in communicators:
+        await communicator.disconnect()
+    await sync_to_async(connections.close_all)()
+
+    result = summarize(deliveries, delivery_elapsed)
+    fanout = summarize(fanouts, delivery_elapsed)
+    result.update({
+        "subscribers": subscribers,
+        "publishes": publishes,
+        "fanout_p50_ms": fanout["p50_ms"],
+        "fanout_p99_ms": fanout["p99_ms"],
+        "join": summarize(joins, join_elapsed),
+        "message_bytes": int(np.mean(sizes)) if sizes else 0,
+    })
+    return result
+
+
+def write_results(report, path=None):
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as output:
+            output.write(text + "\n")
+    return text
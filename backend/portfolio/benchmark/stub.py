@@ -0,0 +1,192 @@
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DAY_MS = 24 * 60 * 60 * 1000
+COIN_COUNT = 300
+
+# Point spacing CoinGecko uses for a market_chart window of this many days
+def chart_step_ms(days):
+    if days <= 1:
+        return 5 * 60 * 1000
+    if days <= 90:
+        return 60 * 60 * 1000
+    return DAY_MS
+
+
+def candle_step_ms(days):
+    if days <= 2:
+        return 30 * 60 * 1000
+    if days <= 30:
+        return 4 * 60 * 60 * 1000
+    return 4 * DAY_MS
+
+
+def coin_ids():
+    return ["bitcoin", "ethereum"] + [f"coin{i}" for i in range(COIN_COUNT - 2)]
+
+
+def price_at(coin_id, timestamp):
+    """Deterministic, smoothly varying price so every run sees the same data."""
+    base = 10 + (sum(map(ord, coin_id)) % 1000) * 10
+    return round(base * (1 + 0.1 * math.sin(timestamp / (7 * DAY_MS))), 6)
+
+
+def market(coin_id, rank):
+    return {
+        "id": coin_id, "symbol": coin_id[:4], "name": coin_id.title(),
+        "image": f"https://example.invalid/{coin_id}.png",
+        "current_price": price_at(coin_id, time.time() * 1000),
+        "market_cap": 10 ** 12 // rank, "market_cap_rank": rank,
+    }
+
+
+def detail(coin_id):
+    price = price_at(coin_id, time.time() * 1000)
+    return {
+        "id": coin_id, "symbol": coin_id[:4], "name": coin_id.title(), "market_cap_rank": 1,
+        "image": {"thumb": f"https://example.invalid/{coin_id}.png"},
+        "market_data": {
+            "current_price": {"usd": price}, "price_change_percentage_24h": 1.5,
+            "market_cap": {"usd": 10 ** 11}, "total_volume": {"usd": 10 ** 9},
+            "total_supply": 21000000, "max_supply": 21000000, "circulating_supply": 19000000,
+            "fully_diluted_valuation": {"usd": 10 ** 11}, "high_24h": {"usd": price * 1.02},
+            "low_24h": {"usd": price * 0.98}, "ath": {"usd": price * 2},
+        },
+    }
+
+
+def line(coin_id, start, end, step):
+    first = start - start % step + step
+    return {"prices": [[ts, price_at(coin_id, ts)] for ts in range(first, end + 1, step)]}
+
+
+def candles(coin_id, days):
+    step = candle_step_ms(days)
+    end = int(time.time() * 1000)
+    first = end - days * DAY_MS
+    return [
+        [ts, price_at(coin_id, ts), price_at(coin_id, ts) * 1.01, price_at(coin_id, ts) * 0.99, price_at(coin_id, ts + step)]
+        for ts in range(first - first % step + step, end + 1, step)
+    ]
+
+
+ROUTES = [
+    (re.compile(r"^/coins/markets$"), "markets"),
+    (re.compile(r"^/coins/list$"), "coins_list"),
+    (re.compile(r"^/coins/(?P<coin_id>[\w-]+)/market_chart/range$"), "chart_range"),
+    (re.compile(r"^/coins/(?P<coin_id>[\w-]+)/market_chart$"), "chart"),
+    (re.compile(r"^/coins/(?P<coin_id>[\w-]+)/ohlc$"), "ohlc"),
+    (re.compile(r"^/coins/(?P<coin_id>[\w-]+)$"), "detail"),
+    (re.compile(r"^/simple/price$"), "simple_price"),
+    (re.compile(r"^/exchange_rates$"), "exchange_rates"),
+]
+
+# BTC based like CoinGecko's table
+EXCHANGE_RATES = {
+    "btc": {"name": "Bitcoin", "unit": "BTC", "value": 1.0, "type": "crypto"},
+    "usd": {"name": "US Dollar", "unit": "$", "value": 60000.0, "type": "fiat"},
+    "eur": {"name": "Euro", "unit": "€", "value": 55000.0, "type": "fiat"},
+    "gbp": {"name": "British Pound Sterling", "unit": "£", "value": 47000.0, "type": "fiat"},
+    "jpy": {"name": "Japanese Yen", "unit": "¥", "value": 9000000.0, "type": "fiat"},
+}
+
+
+def respond(path, params):
+    """(status, body) for one stubbed CoinGecko request."""
+    for pattern, name in ROUTES:
+        match = pattern.match(path)
+        if match:
+            break
+    else:
+        return 404, {"error": "Not found"}
+
+    now = int(time.time() * 1000)
+    coin_id = match.groupdict().get("coin_id")
+    if name == "markets":
+        per_page, page = int(params.get("per_page", 100)), int(params.get("page", 1))
+        ids = coin_ids()[(page - 1) * per_page:page * per_page]
+        return 200, [market(coin, (page - 1) * per_page + i + 1) for i, coin in enumerate(ids)]
+    if name == "coins_list":
+        return 200, [{"id": coin, "symbol": coin[:4], "name": coin.title()} for coin in coin_ids()]
+    if name == "detail":
+        return 200, detail(coin_id)
+    if name == "chart":
+        days = float(params.get("days", 1))
+        return 200, line(coin_id, now - int(days * DAY_MS), now, chart_step_ms(days))
+    if name == "chart_range":
+        start, end = int(params["from"]) * 1000, int(params["to"]) * 1000
+        return 200, line(coin_id, start, end, chart_step_ms((end - start) / DAY_MS))
+    if name == "ohlc":
+        return 200, candles(coin_id, int(params.get("days", 1)))
+    if name == "exchange_rates":
+        return 200, {"rates": EXCHANGE_RATES}
+    ids = [coin for coin in params.get("ids", "").split(",") if coin]
+    return 200, {coin: {"usd": price_at(coin, now)} for coin in ids}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path
+        if path.startswith(self.server.prefix):
+            path = path[len(self.server.prefix):]
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status, body = respond(path, params)
+        self.server.record(path)
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CoinGeckoStub(ThreadingHTTPServer):
+    """Local stand-in for the CoinGecko endpoints the app calls, with a fixed added latency.
+
+    Usable as a context manager; ``base_url`` goes into COINGECKO_BASE_URL.
+    """
+
+    daemon_threads = True
+    prefix = "/api/v3"
+
+    def __init__(self, latency_ms=0, host="127.0.0.1", port=0):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def record(self, path):
+        # Counted per route shape, so /coins/bitcoin and /coins/ethereum land together
+        route = next((name for pattern, name in ROUTES if pattern.match(path)), "unknown")
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="coingecko-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
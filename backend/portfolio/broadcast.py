@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import time
+import uuid
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from .caching import is_error
+from .encoding import encode_chart_message
+from .fx import BASE_CURRENCY, aget_fx_rates, ausd_rate, convert_points
+from .services import getChartDataAsync
+
+# How often each chart stream is republished
+CHART_REFRESH_INTERVALS = {
+    "5min": 5 * 60,
+    "hourly": 60 * 60,
+    "daily": 24 * 60 * 60,
+}
+
+# Only one process publishes a given stream; it holds this lease in Redis
+PRODUCER_LEASE_TIMEOUT = 30
+PRODUCER_LEASE_RENEW = 10
+
+
+def chart_group_name(slug, interval_type, chart_type, currency=BASE_CURRENCY):
+    if currency == BASE_CURRENCY:
+        return f"chart.{slug}.{interval_type}.{chart_type}"
+    return f"chart.{slug}.{interval_type}.{chart_type}.{currency}"
+
+
+def last_timestamp(chart_data):
+    if isinstance(chart_data, list) and chart_data:
+        return chart_data[-1]["timestamp"]
+    return None
+
+
+def snapshot_message(slug, interval_type, chart_type, chart_data):
+    return {
+        "type": "snapshot",
+        "slug": slug,
+        "interval_type": interval_type,
+        "chart_type": chart_type,
+        "chart_data": chart_data
+    }
+
+
+def delta_message(slug, interval_type, chart_type, replace_from, points, trim_before):
+    """Clients drop their points older than trim_before and from replace_from on, then append points."""
+    return {
+        "type": "delta",
+        "slug": slug,
+        "interval_type": interval_type,
+        "chart_type": chart_type,
+        "replace_from": replace_from,
+        "trim_before": trim_before,
+        "chart_data": points
+    }
+
+
+def chart_delta(previous, current):
+    """Return (replace_from, points) that turn `previous` into `current`.
+
+    Points before the first difference are shared; replace_from is None when nothing changed.
+    """
+    if current:
+        previous = [point for point in previous if point["timestamp"] >= current[0]["timestamp"]]
+
+    shared = 0
+    while shared < min(len(previous), len(current)) and previous[shared] == current[shared]:
+        shared += 1
+
+    candidates = [series[shared]["timestamp"] for series in (previous, current) if shared < len(series)]
+    return (min(candidates) if candidates else None), current[shared:]
+
+
+class ChartProducer:
+    """Publishes one (slug, interval_type, chart_type) stream to its channel layer groups, one per currency.
+
+    Every process with local subscribers runs a producer, but only the lease holder
+    fetches and publishes, so upstream work does not grow with viewers or workers.
+    The USD series is fetched once and converted for each currency in use in any process.
+    """
+
+    def __init__(self, slug, interval_type, chart_type):
+        self.slug = slug
+        self.interval_type = interval_type
+        self.chart_type = chart_type
+        self.group_name = chart_group_name(slug, interval_type, chart_type)
+        self.lease_key = f"chart_producer_{slug}_{interval_type}_{chart_type}"
+        self.token = uuid.uuid4().hex
+        self.subscribers = 0
+        # Local subscribers per currency
+        self.currencies = {}
+        self.task = None
+        self.previous = None
+        # Last series sent per currency other than USD, the base for its next delta
+        self.sent = {}
+        # Downsampled frames of the last update, per (currency, max_points, format), shared by local subscribers
+        self.downsampled_at = None
+        self.downsampled = {}
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        if await cache.aget(self.lease_key) == self.token:
+            await cache.adelete(self.lease_key)
+
+    async def hold_lease(self):
+        if await cache.aadd(self.lease_key, self.token, PRODUCER_LEASE_TIMEOUT):
+            return True
+        if await cache.aget(self.lease_key) == self.token:
+            await cache.atouch(self.lease_key, PRODUCER_LEASE_TIMEOUT)
+            return True
+        return False
+
+    def currency_key(self, currency):
+        return f"{self.lease_key}_{currency}"
+
+    async def advertise(self):
+        # Subscribers may be in another process than the lease holder, so currencies in use are shared through the cache
+        currencies = [currency for currency in self.currencies if currency != BASE_CURRENCY]
+        if currencies:
+            keys = {self.currency_key(currency): True for currency in currencies}
+            # Lets the publisher skip the rate table entirely while every subscriber is on USD
+            keys[self.currency_key("any")] = True
+            await cache.aset_many(keys, PRODUCER_LEASE_TIMEOUT)
+
+    async def published_rates(self):
+        """USD rate of every currency with subscribers in any process; USD is always published."""
+        local = {currency for currency in self.currencies if currency != BASE_CURRENCY}
+        if not local and not await cache.aget(self.currency_key("any")):
+            return {BASE_CURRENCY: 1.0}
+        rates = await aget_fx_rates()
+        if is_error(rates):
+            logging.error(f"Chart producer for {self.group_name} publishes USD only: {rates['error']}")
+            return {BASE_CURRENCY: 1.0}
+        keys = {self.currency_key(currency): currency for currency in rates if currency != BASE_CURRENCY}
+        in_use = {keys[key] for key in await cache.aget_many(list(keys))} | local
+        return {BASE_CURRENCY: 1.0, **{currency: rates[currency] for currency in in_use if currency in rates}}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        delay = CHART_REFRESH_INTERVALS.get(self.interval_type, 60)
+        # Subscribers get a snapshot when they join, so the first publish waits a full interval
+        next_publish = loop.time() + delay
+        try:
+            # What joining subscribers were sent, the base for the first delta
+            self.previous = await getChartDataAsync(self.slug, self.interval_type, self.chart_type)
+        except Exception as e:
+            logging.error(f"Chart producer for {self.group_name} could not load its base series: {str(e)}")
+
+        while True:
+            holder = False
+            try:
+                await self.advertise()
+                holder = await self.hold_lease()
+                if holder and loop.time() >= next_publish:
+                    # A failed publish is retried at the next renewal, not straight away
+                    next_publish = loop.time() + PRODUCER_LEASE_RENEW
+                    await self.publish()
+                    next_publish = loop.time() + delay
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Chart producer for {self.group_name} failed: {str(e)}")
+
+            # Without the lease there is nothing to publish, only the lease to poll
+            wait = min(PRODUCER_LEASE_RENEW, next_publish - loop.time()) if holder else PRODUCER_LEASE_RENEW
+            await asyncio.sleep(max(0, wait))
+
+    async def publish(self):
+        chart_data = await getChartDataAsync(self.slug, self.interval_type, self.chart_type)
+        previous, self.previous = self.previous, chart_data
+        rates = await self.published_rates()
+
+        sent = {}
+        for currency, rate in rates.items():
+            converted = convert_points(chart_data, rate, self.chart_type)
+            # What this currency's subscribers hold; converted at the old rate if they got it from this producer
+            base = self.sent.get(currency) or convert_points(previous, rate, self.chart_type)
+            if currency != BASE_CURRENCY:
+                sent[currency] = converted
+            await get_channel_layer().group_send(
+                chart_group_name(self.slug, self.interval_type, self.chart_type, currency), self.event(converted, base)
+            )
+        self.sent = sent
+
+    def event(self, chart_data, previous):
+        key = (self.slug, self.interval_type, self.chart_type)
+        # Each payload is encoded once per wire format here, never per subscriber
+        event = {
+            "type": "chart.update",
+            "frames": {"full": encode_chart_message(snapshot_message(*key, chart_data), self.chart_type)},
+            "last_timestamp": last_timestamp(chart_data),
+            # Wall clock, as subscribers may be in another process
+            "published_at": time.time(),
+        }
+
+        # Subscribers in delta mode that already hold the previous series only get what changed
+        if isinstance(chart_data, list) and isinstance(previous, list) and previous:
+            replace_from, points = chart_delta(previous, chart_data)
+            trim_before = chart_data[0]["timestamp"] if chart_data else None
+            event["base_timestamp"] = last_timestamp(previous)
+            event["frames"]["delta"] = encode_chart_message(
+                delta_message(*key, replace_from, points, trim_before), self.chart_type
+            )
+        return event
+
+    def downsampled_frame(self, published_at, currency, max_points, chart_format):
+        """Task for the frame of one update at a subscriber's resolution, currency and format.
+
+        Built once per process however many local subscribers share those settings.
+        """
+        if self.downsampled_at != published_at:
+            self.downsampled_at, self.downsampled = published_at, {}
+        key = (currency, max_points, chart_format)
+        if key not in self.downsampled:
+            self.downsampled[key] = asyncio.create_task(self.build_downsampled(currency, max_points, chart_format))
+        return self.downsampled[key]
+
+    async def build_downsampled(self, currency, max_points, chart_format):
+        # Downsampled buckets shift as points arrive, so these subscribers always get a snapshot
+        chart_data = await getChartDataAsync(self.slug, self.interval_type, self.chart_type, max_points)
+        rate = await ausd_rate(currency)
+        chart_data = rate if is_error(rate) else convert_points(chart_data, rate, self.chart_type)
+        message = snapshot_message(self.slug, self.interval_type, self.chart_type, chart_data)
+        return encode_chart_message(message, self.chart_type, [chart_format]), last_timestamp(chart_data)
+
+
+_producers = {}
+
+
+async def subscribe(channel_layer, channel_name, slug, interval_type, chart_type, currency=BASE_CURRENCY):
+    key = (slug, interval_type, chart_type)
+    await channel_layer.group_add(chart_group_name(*key, currency), channel_name)
+
+    producer = _producers.get(key)
+    if producer is None:
+        producer = _producers[key] = ChartProducer(*key)
+        producer.start()
+    producer.subscribers += 1
+    producer.currencies[currency] = producer.currencies.get(currency, 0) + 1
+    if producer.currencies[currency] == 1:
+        await producer.advertise()
+
+
+async def unsubscribe(channel_layer, channel_name, slug, interval_type, chart_type, currency=BASE_CURRENCY):
+    key = (slug, interval_type, chart_type)
+    await channel_layer.group_discard(chart_group_name(*key, currency), channel_name)
+
+    producer = _producers.get(key)
+    if producer is None:
+        return
+    producer.subscribers -= 1
+    producer.currencies[currency] = producer.currencies.get(currency, 0) - 1
+    if producer.currencies[currency] <= 0:
+        del producer.currencies[currency]
+    if producer.subscribers <= 0:
+        del _producers[key]
+        await producer.stop()
+
+
+async def downsampled_frame(event, slug, interval_type, chart_type, currency, max_points, chart_format):
+    """(frames, last timestamp) of a published update for a downsampled subscriber of this process."""
+    producer = _producers[(slug, interval_type, chart_type)]
+    # Shielded, so a subscriber disconnecting mid-build never cancels it for the others
+    return await asyncio.shield(producer.downsampled_frame(event["published_at"], currency, max_points, chart_format))
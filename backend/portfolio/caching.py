@@ -0,0 +1,472 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from .localcache import ensure_listener, local_cache, publish_invalidation
+from .metrics import cache_lookups, cache_tier_lookups, family_label
+
+# Upper bound for one upstream fetch; the Redis lock expires after it even if the holder dies
+LOCK_TIMEOUT = 30
+# How long callers wait for someone else's fetch before giving up
+WAIT_TIMEOUT = 15
+POLL_INTERVAL = 0.05
+
+# (soft, hard) TTL in seconds when a key family has no entry in settings.CACHE_TTLS
+DEFAULT_TTLS = (5 * 60, 60 * 60)
+
+
+def is_error(data):
+    return isinstance(data, dict) and "error" in data
+
+
+def lock_key(cache_key):
+    return f"lock_{cache_key}"
+
+
+def key_family(cache_key):
+    """The longest CACHE_TTLS family that prefixes the key, e.g. crypto_detail for crypto_detail_bitcoin."""
+    matches = [family for family in settings.CACHE_TTLS if cache_key.startswith(family)]
+    return max(matches, key=len) if matches else cache_key
+
+
+def family_ttls(family):
+    return settings.CACHE_TTLS.get(family, DEFAULT_TTLS)
+
+
+# Values are stored with their fetch time; after the soft TTL they are served stale while one
+# background refresh runs, and only the hard TTL (the Redis expiry) forces a blocking fetch
+def make_entry(value, family):
+    now = time.time()
+    return {"value": value, "fetched_at": now, "stale_at": now + family_ttls(family)[0]}
+
+
+def is_entry(cached):
+    return isinstance(cached, dict) and cached.keys() == {"value", "fetched_at", "stale_at"}
+
+
+def unwrap(cached):
+    """(value, is_stale) for a cached entry; bare values written before envelopes count as fresh."""
+    if is_entry(cached):
+        return cached["value"], time.time() >= cached["stale_at"]
+    return cached, False
+
+
+def is_local(family):
+    return family in settings.LOCAL_CACHE_FAMILIES
+
+
+class TierStats:
+    """Hit/miss counts per cache tier (in-process LRU, then Redis) and key family."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiers = {}
+
+    def record(self, tier, family, hit):
+        with self.lock:
+            stats = self.tiers.setdefault(tier, {}).setdefault(family, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+        cache_tier_lookups.labels(tier, family_label(family), "hit" if hit else "miss").inc()
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {
+                tier: {
+                    family: dict(stats, hit_ratio=stats["hits"] / (stats["hits"] + stats["misses"]))
+                    for family, stats in families.items()
+                }
+                for tier, families in self.tiers.items()
+            }
+        snapshot["local_lru"] = local_cache.snapshot()
+        return snapshot
+
+
+tier_stats = TierStats()
+
+
+# Hot families are read from the in-process LRU first and only go to Redis on a local miss
+def _read_local(cache_key, family):
+    if not is_local(family):
+        return None
+    ensure_listener()
+    cached = local_cache.get(cache_key)
+    tier_stats.record("local", family, cached is not None)
+    return cached
+
+
+def _read_redis(cache_key, family, cached):
+    tier_stats.record("redis", family, cached is not None)
+    if cached is not None and is_local(family):
+        local_cache.set(cache_key, cached)
+    return cached
+
+
+def read(cache_key, family):
+    cached = _read_local(cache_key, family)
+    if cached is not None:
+        return cached
+    return _read_redis(cache_key, family, cache.get(cache_key))
+
+
+async def aread(cache_key, family):
+    cached = _read_local(cache_key, family)
+    if cached is not None:
+        return cached
+    return _read_redis(cache_key, family, await cache.aget(cache_key))
+
+
+def entry_version(cache_key):
+    """fetched_at of the current entry, or None.
+
+    Read it before the value: the value is then never older than the version, so a
+    response tagged with it can at worst be re-sent, never wrongly answered with 304.
+    """
+    cached = local_cache.get(cache_key)
+    if cached is None:
+        cached = cache.get(cache_key)
+    return cached["fetched_at"] if is_entry(cached) else None
+
+
+async def aentry_version(cache_key):
+    cached = local_cache.get(cache_key)
+    if cached is None:
+        cached = await cache.aget(cache_key)
+    return cached["fetched_at"] if is_entry(cached) else None
+
+
+def store(cache_key, value, family):
+    store_many({cache_key: value}, family)
+
+
+async def astore(cache_key, value, family):
+    await astore_many({cache_key: value}, family)
+
+
+def store_many(values, family):
+    """Write several keys of one family in a single round-trip."""
+    entries = {cache_key: make_entry(value, family) for cache_key, value in values.items()}
+    cache.set_many(entries, timeout=family_ttls(family)[1])
+    if is_local(family):
+        _store_local(entries)
+        for cache_key in entries:
+            publish_invalidation(cache_key)
+
+
+async def astore_many(values, family):
+    entries = {cache_key: make_entry(value, family) for cache_key, value in values.items()}
+    await cache.aset_many(entries, timeout=family_ttls(family)[1])
+    if is_local(family):
+        _store_local(entries)
+        for cache_key in entries:
+            await sync_to_async(publish_invalidation)(cache_key)
+
+
+def _store_local(entries):
+    # Only hot families are held locally, so only their rewrites need to reach other processes
+    for cache_key, entry in entries.items():
+        local_cache.set(cache_key, entry)
+
+
+def invalidate(cache_key):
+    """Drop a key from this process's LRU and every other one; callers delete it from Redis themselves."""
+    local_cache.discard(cache_key)
+    publish_invalidation(cache_key)
+
+
+async def ainvalidate(cache_key):
+    local_cache.discard(cache_key)
+    await sync_to_async(publish_invalidation)(cache_key)
+
+
+# get_or_fetch outcomes that are also exported as cache_lookups_total
+LOOKUP_RESULTS = {"fresh_hits": "fresh_hit", "stale_hits": "stale_hit", "misses": "miss"}
+
+
+class RefreshStats:
+    """Per key family counters, to tune soft/hard TTLs from how often and how slowly entries refresh."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+
+    def record(self, family, event, duration=None):
+        with self.lock:
+            stats = self.families.setdefault(family, {
+                "fresh_hits": 0, "stale_hits": 0, "misses": 0,
+                "refreshes": 0, "refresh_errors": 0, "refresh_ms_total": 0.0, "refresh_ms_max": 0.0,
+            })
+            stats[event] += 1
+            if duration is not None:
+                ms = duration * 1000
+                stats["refresh_ms_total"] += ms
+                stats["refresh_ms_max"] = max(stats["refresh_ms_max"], ms)
+        if event in LOOKUP_RESULTS:
+            cache_lookups.labels(family_label(family), LOOKUP_RESULTS[event]).inc()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                family: dict(
+                    stats,
+                    soft_ttl=family_ttls(family)[0],
+                    hard_ttl=family_ttls(family)[1],
+                    refresh_ms_avg=stats["refresh_ms_total"] / stats["refreshes"] if stats["refreshes"] else None,
+                )
+                for family, stats in self.families.items()
+            }
+
+
+refresh_stats = RefreshStats()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_async_inflight = {}
+
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_async_refresh_tasks = set()
+
+
+def get_or_fetch(cache_key, fetch, family=None):
+    """Return the cached value for ``cache_key`` or fetch it exactly once.
+
+    Concurrent callers in this process wait on the thread already fetching, and
+    other processes are held off by a Redis lock. Stale values are returned at once
+    while a background thread refreshes them. Error results are not cached.
+    """
+    family = family or key_family(cache_key)
+    cached = read(cache_key, family)
+    if cached is not None:
+        value, stale = unwrap(cached)
+        if stale:
+            logging.info(f"Stale cache hit for {cache_key}, refreshing in background.")
+            refresh_stats.record(family, "stale_hits")
+            _schedule_refresh(cache_key, fetch, family)
+        else:
+            logging.info(f"Cache hit for {cache_key}")
+            refresh_stats.record(family, "fresh_hits")
+        return value
+
+    refresh_stats.record(family, "misses")
+
+    with _inflight_lock:
+        call = _inflight.get(cache_key)
+        leader = call is None
+        if leader:
+            call = _inflight[cache_key] = _InFlight()
+
+    if not leader:
+        logging.info(f"Cache miss for {cache_key}, waiting for in-flight fetch.")
+        if not call.done.wait(WAIT_TIMEOUT):
+            return {"error": f"Timed out waiting for {cache_key}"}
+        if call.exception:
+            raise call.exception
+        return call.result
+
+    logging.info(f"Cache miss for {cache_key}. Fetching from API.")
+    try:
+        call.result = _fetch_locked(cache_key, fetch, family)
+        return call.result
+    except Exception as e:
+        call.exception = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+        call.done.set()
+
+
+def _fetch_locked(cache_key, fetch, family):
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + WAIT_TIMEOUT
+
+    while not cache.add(lock_key(cache_key), token, LOCK_TIMEOUT):
+        # Another worker is fetching, its result lands in the cache
+        time.sleep(POLL_INTERVAL)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return unwrap(cached)[0]
+        if time.monotonic() > deadline:
+            return {"error": f"Timed out waiting for {cache_key}"}
+
+    try:
+        # The previous lock holder may have filled the cache while we waited
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return unwrap(cached)[0]
+
+        return _timed_fetch(cache_key, fetch, family)
+    finally:
+        if cache.get(lock_key(cache_key)) == token:
+            cache.delete(lock_key(cache_key))
+
+
+def _timed_fetch(cache_key, fetch, family):
+    started = time.monotonic()
+    data = fetch()
+    if is_error(data):
+        refresh_stats.record(family, "refresh_errors", time.monotonic() - started)
+    else:
+        store(cache_key, data, family)
+        refresh_stats.record(family, "refreshes", time.monotonic() - started)
+        logging.info(f"Refreshed {cache_key} ({family}) in {(time.monotonic() - started) * 1000:.0f} ms")
+    return data
+
+
+def run_in_background(task_key, func, *args):
+    """Run ``func`` on the refresh pool unless a task with the same key is already running."""
+    with _refreshing_lock:
+        if task_key in _refreshing:
+            return
+        _refreshing.add(task_key)
+    _refresh_executor.submit(_run_background, task_key, func, *args)
+
+
+def _run_background(task_key, func, *args):
+    try:
+        func(*args)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(task_key)
+
+
+def _schedule_refresh(cache_key, fetch, family):
+    run_in_background(cache_key, _refresh, cache_key, fetch, family)
+
+
+def _refresh(cache_key, fetch, family):
+    token = uuid.uuid4().hex
+    try:
+        # Whoever holds the lock is already refreshing this key somewhere in the cluster
+        if not cache.add(lock_key(cache_key), token, LOCK_TIMEOUT):
+            return
+        try:
+            _timed_fetch(cache_key, fetch, family)
+        finally:
+            if cache.get(lock_key(cache_key)) == token:
+                cache.delete(lock_key(cache_key))
+    except Exception as e:
+        refresh_stats.record(family, "refresh_errors")
+        logging.error(f"Background refresh of {cache_key} failed: {str(e)}")
+
+
+async def aget_or_fetch(cache_key, fetch, family=None):
+    """Async counterpart of ``get_or_fetch``; ``fetch`` is a coroutine function."""
+    family = family or key_family(cache_key)
+    cached = await aread(cache_key, family)
+    if cached is not None:
+        value, stale = unwrap(cached)
+        if stale:
+            logging.info(f"Stale cache hit for {cache_key}, refreshing in background.")
+            refresh_stats.record(family, "stale_hits")
+            _schedule_async_refresh(cache_key, fetch, family)
+        else:
+            logging.info(f"Cache hit for {cache_key}")
+            refresh_stats.record(family, "fresh_hits")
+        return value
+
+    refresh_stats.record(family, "misses")
+
+    loop = asyncio.get_running_loop()
+    inflight_key = (id(loop), cache_key)
+    task = _async_inflight.get(inflight_key)
+
+    if task is None:
+        logging.info(f"Cache miss for {cache_key}, fetching new data.")
+        # The fetch runs as its own task so a cancelled caller never cancels it for the others
+        task = _async_inflight[inflight_key] = loop.create_task(_afetch_locked(cache_key, fetch, family))
+        task.add_done_callback(lambda t: _async_fetch_done(inflight_key, t))
+    else:
+        logging.info(f"Cache miss for {cache_key}, waiting for in-flight fetch.")
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"error": f"Timed out waiting for {cache_key}"}
+
+
+def _async_fetch_done(inflight_key, task):
+    if _async_inflight.get(inflight_key) is task:
+        del _async_inflight[inflight_key]
+    if not task.cancelled():
+        # Mark retrieved so a fetch nobody awaited any more does not log a warning
+        task.exception()
+
+
+async def _afetch_locked(cache_key, fetch, family):
+    token = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WAIT_TIMEOUT
+
+    while not await cache.aadd(lock_key(cache_key), token, LOCK_TIMEOUT):
+        await asyncio.sleep(POLL_INTERVAL)
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            return unwrap(cached)[0]
+        if loop.time() > deadline:
+            return {"error": f"Timed out waiting for {cache_key}"}
+
+    try:
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            return unwrap(cached)[0]
+
+        return await _atimed_fetch(cache_key, fetch, family)
+    finally:
+        if await cache.aget(lock_key(cache_key)) == token:
+            await cache.adelete(lock_key(cache_key))
+
+
+async def _atimed_fetch(cache_key, fetch, family):
+    started = time.monotonic()
+    data = await fetch()
+    if is_error(data):
+        refresh_stats.record(family, "refresh_errors", time.monotonic() - started)
+    else:
+        await astore(cache_key, data, family)
+        refresh_stats.record(family, "refreshes", time.monotonic() - started)
+        logging.info(f"Refreshed {cache_key} ({family}) in {(time.monotonic() - started) * 1000:.0f} ms")
+    return data
+
+
+def _schedule_async_refresh(cache_key, fetch, family):
+    with _refreshing_lock:
+        if cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+    task = asyncio.get_running_loop().create_task(_arefresh(cache_key, fetch, family))
+    # Keep a reference so the task is not garbage collected mid-refresh
+    _async_refresh_tasks.add(task)
+    task.add_done_callback(_async_refresh_tasks.discard)
+
+
+async def _arefresh(cache_key, fetch, family):
+    token = uuid.uuid4().hex
+    try:
+        if not await cache.aadd(lock_key(cache_key), token, LOCK_TIMEOUT):
+            return
+        try:
+            await _atimed_fetch(cache_key, fetch, family)
+        finally:
+            if await cache.aget(lock_key(cache_key)) == token:
+                await cache.adelete(lock_key(cache_key))
+    except Exception as e:
+        refresh_stats.record(family, "refresh_errors")
+        logging.error(f"Background refresh of {cache_key} failed: {str(e)}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(cache_key)
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+import httpx
+from django.conf import settings
+from .metrics import coingecko_request_duration, coingecko_requests, endpoint_label
+from .ratelimit import INTERACTIVE, limiter
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+_client = None
+_client_lock = threading.Lock()
+# httpx.AsyncClient connections are bound to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_options():
+    return {
+        "base_url": settings.COINGECKO_BASE_URL,
+        "http2": settings.COINGECKO_HTTP2 and HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=settings.COINGECKO_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.COINGECKO_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.COINGECKO_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.COINGECKO_TIMEOUT, connect=settings.COINGECKO_CONNECT_TIMEOUT),
+        "headers": {"Accept": "application/json"},
+    }
+
+
+def get_client():
+    """Process-wide keep-alive client for sync callers (views, management commands)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def get_async_client():
+    """Keep-alive client for async callers, one per running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(**_client_options())
+    return client
+
+
+def _close_async_client(loop, client):
+    if loop.is_closed():
+        # Nothing can await on it any more; its sockets are closed when it is collected
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        loop.run_until_complete(client.aclose())
+
+
+def reset_clients():
+    """Close the pooled clients so the next call picks up changed COINGECKO_* settings."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+    for loop, client in list(_async_clients.items()):
+        _close_async_client(loop, client)
+    _async_clients.clear()
+
+
+def _record(path, started, response=None):
+    endpoint = endpoint_label(path)
+    coingecko_request_duration.labels(endpoint).observe(time.perf_counter() - started)
+    coingecko_requests.labels(endpoint, response.status_code if response is not None else "error").inc()
+
+
+def _send(path, params):
+    started = time.perf_counter()
+    try:
+        with usage.track("sync"):
+            response = get_client().get(path, params=params)
+    except httpx.RequestError:
+        _record(path, started)
+        raise
+    _record(path, started, response)
+    return response
+
+
+async def _asend(path, params):
+    started = time.perf_counter()
+    try:
+        with usage.track("async"):
+            response = await get_async_client().get(path, params=params)
+    except httpx.RequestError:
+        _record(path, started)
+        raise
+    _record(path, started, response)
+    return response
+
+
+def get(path, params=None, priority=INTERACTIVE):
+    """GET within the shared rate limit, retrying 429s; raises ratelimit.RateLimited if no quota frees up in time."""
+    for attempt in range(settings.COINGECKO_MAX_RETRIES + 1):
+        limiter.acquire(priority)
+        response = _send(path, params)
+        if response.status_code != 429 or attempt == settings.COINGECKO_MAX_RETRIES:
+            return response
+        # The next acquire waits out the backoff, together with every other worker
+        limiter.throttled(priority, response, attempt)
+        limiter.stats.record(priority, "retries")
+
+
+async def aget(path, params=None, priority=INTERACTIVE):
+    for attempt in range(settings.COINGECKO_MAX_RETRIES + 1):
+        await limiter.aacquire(priority)
+        response = await _asend(path, params)
+        if response.status_code != 429 or attempt == settings.COINGECKO_MAX_RETRIES:
+            return response
+        await limiter.athrottled(priority, response, attempt)
+        limiter.stats.record(priority, "retries")
+
+
+class PoolUsage:
+    """Requests in flight on the sync and the async clients, counted around each send.
+
+    httpx has no public view of its pool, so occupancy is measured from the outside: with
+    HTTP/1.1, requests in flight beyond max_connections are the ones waiting for a connection.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {"sync": 0, "async": 0}
+        self.peak = {"sync": 0, "async": 0}
+
+    @contextmanager
+    def track(self, kind):
+        with self.lock:
+            self.in_flight[kind] += 1
+            self.peak[kind] = max(self.peak[kind], self.in_flight[kind])
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight[kind] -= 1
+
+    def snapshot(self, kind):
+        with self.lock:
+            in_flight, peak = self.in_flight[kind], self.peak[kind]
+        return {
+            "in_flight": in_flight,
+            "peak_in_flight": peak,
+            "waiting": max(in_flight - settings.COINGECKO_MAX_CONNECTIONS, 0),
+            "max_connections": settings.COINGECKO_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.COINGECKO_MAX_KEEPALIVE_CONNECTIONS,
+        }
+
+
+usage = PoolUsage()
+
+
+def pool_stats():
+    """Request concurrency of the sync client and the async clients (one per event loop), for sizing the limits."""
+    return {
+        "http2": settings.COINGECKO_HTTP2 and HTTP2_AVAILABLE,
+        "sync": usage.snapshot("sync"),
+        "async": dict(usage.snapshot("async"), clients=len(_async_clients)),
+    }
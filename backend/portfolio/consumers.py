@@ -1,48 +1,89 @@
 import json
-import asyncio
+import time
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-import requests
-import httpx
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from . import broadcast
+from .alerts import alert_group_name
+from .caching import is_error
+from .downsampling import parse_max_points
+from .encoding import CHART_FORMATS, encode_chart_message
+from .fx import BASE_CURRENCY, ausd_rate, convert_points, parse_currency
+from .metrics import websocket_connections, websocket_message_bytes, websocket_messages, websocket_send_lag
 from .services import getChartDataAsync
 
 VALID_INTERVALS = ["5min", "hourly", "daily"]
+VALID_MODES = ["full", "delta"]
 
 class CryptoConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         # Get cryptocurrency slug from URL
         self.slug = self.scope['url_route']['kwargs']['slug']
         self.interval_type = "daily"  # default value
-        self.running = True
         self.chart_type = "line"
+        # "full" resends the whole series on every update, "delta" only what changed since the last message
+        self.mode = "full"
+        # Wire format of chart messages: JSON rows, JSON columns or a packed binary frame
+        self.format = "json"
+        # Downsampled to at most this many points; None sends the full series
+        self.max_points = None
+        # Prices are converted from USD with the shared FX rate table
+        self.currency = BASE_CURRENCY
+        self.last_timestamp = None
+        self.subscribed = False
 
         await self.accept()
+        websocket_connections.inc()
+        self.counted = True
 
-        # Create background task
-        self.chart_task = asyncio.create_task(self.send_chart_data_loop())
+        await self.join_chart_group()
 
     async def disconnect(self, close_code):
-        self.running = False
-
-        if hasattr(self, 'chart_task'):
-            self.chart_task.cancel()
+        if getattr(self, "counted", False):
+            websocket_connections.dec()
+            self.counted = False
+        await self.leave_chart_group()
 
     async def receive(self, text_data):
         data = json.loads(text_data)
         interval_type = data.get("interval_type")
         chart_type = data.get("chart_type", "line")
+        mode = data.get("mode", self.mode)
+        chart_format = data.get("format", self.format)
+        try:
+            if "max_points" in data or "width" in data:
+                max_points = parse_max_points(data.get("max_points"), data.get("width"))
+            else:
+                max_points = self.max_points
+        except (TypeError, ValueError) as e:
+            await self.send(text_data=json.dumps({"error": f"Invalid max_points: {str(e)}"}))
+            return
+        try:
+            currency = parse_currency(data.get("currency", self.currency))
+            rate = await ausd_rate(currency)
+        except ValueError as e:
+            await self.send(text_data=json.dumps({"error": str(e)}))
+            return
+        if is_error(rate):
+            await self.send(text_data=json.dumps(rate))
+            return
+
+        if (interval_type in VALID_INTERVALS and chart_type in ["line", "candlestick"]
+                and mode in VALID_MODES and chart_format in CHART_FORMATS):
+            await self.leave_chart_group()
 
-        if interval_type in VALID_INTERVALS and chart_type in ["line", "candlestick"]:
             self.interval_type = interval_type
             self.chart_type = chart_type
+            self.mode = mode
+            self.format = chart_format
+            self.max_points = max_points
+            self.currency = currency
 
-            if self.chart_task:
-                self.chart_task.cancel()
-                try:
-                    await self.chart_task
-                except asyncio.CancelledError:
-                    pass
-
-            self.chart_task = asyncio.create_task(self.send_chart_data_loop())
+            # A reconnecting delta client can pass the last timestamp it holds to skip the full snapshot
+            await self.join_chart_group(since=data.get("since") if mode == "delta" and not max_points else None)
 
             await self.send(text_data=json.dumps({
                 "message": f"Interval changed to {interval_type}, chart type changed to {chart_type}"
@@ -50,32 +91,110 @@ class CryptoConsumer(AsyncWebsocketConsumer):
         else:
             await self.send(text_data=json.dumps({"error": "Invalid interval type or chart type."}))
 
-    async def send_chart_data_loop(self):
-        while self.running:
+    async def join_chart_group(self, since=None):
+        # Updates are published once per stream by the shared producer; joining only sends the current snapshot
+        await broadcast.subscribe(
+            self.channel_layer, self.channel_name, self.slug, self.interval_type, self.chart_type, self.currency
+        )
+        self.subscribed = True
+        await self.send_chart_snapshot(since)
+
+    async def leave_chart_group(self):
+        if not self.subscribed:
+            return
+        self.subscribed = False
+        await broadcast.unsubscribe(
+            self.channel_layer, self.channel_name, self.slug, self.interval_type, self.chart_type, self.currency
+        )
+
+    async def send_chart_snapshot(self, since=None):
+        try:
+            chart_data = await getChartDataAsync(self.slug, self.interval_type, self.chart_type, self.max_points)
+            rate = await ausd_rate(self.currency)
+            chart_data = rate if is_error(rate) else convert_points(chart_data, rate, self.chart_type)
+            key = (self.slug, self.interval_type, self.chart_type)
+
+            if isinstance(since, (int, float)) and isinstance(chart_data, list):
+                points = [point for point in chart_data if point["timestamp"] >= since]
+                trim_before = chart_data[0]["timestamp"] if chart_data else None
+                message = broadcast.delta_message(*key, since, points, trim_before)
+            else:
+                message = broadcast.snapshot_message(*key, chart_data)
+
+            self.last_timestamp = broadcast.last_timestamp(chart_data)
+            await self.send_frame(encode_chart_message(message, self.chart_type, [self.format]))
+        except Exception as e:
+            await self.send(text_data=json.dumps({"error": str(e)}))
+
+    async def send_frame(self, frames):
+        frame = frames[self.format]
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+            size = len(frame)
+        else:
+            await self.send(text_data=frame)
+            size = len(frame.encode())
+        websocket_messages.labels(self.format).inc()
+        websocket_message_bytes.labels(self.format).inc(size)
+
+    async def chart_update(self, event):
+        if self.max_points:
+            # A snapshot at this client's resolution, built once per process for every client that shares it
             try:
-                # Get data for the graph
-                chart_data = await getChartDataAsync(self.slug, self.interval_type, self.chart_type)  # Call getChartData from services
-
-                # Send data via WebSocket
-                await self.send(text_data=json.dumps({
-                    "slug": self.slug,
-                    "interval_type": self.interval_type,
-                    "chart_type": self.chart_type,
-                    "chart_data": chart_data
-                }))
-
-                if self.interval_type == "5min":
-                    delay = 5 * 60
-                elif self.interval_type == "hourly":
-                    delay = 60 * 60
-                elif self.interval_type == "daily":
-                    delay = 24 * 60 * 60
-                else:
-                    delay = 60
-
-                await asyncio.sleep(delay)
+                frames, self.last_timestamp = await broadcast.downsampled_frame(
+                    event, self.slug, self.interval_type, self.chart_type, self.currency, self.max_points, self.format
+                )
             except Exception as e:
                 await self.send(text_data=json.dumps({"error": str(e)}))
-                break
+                return
+            await self.send_frame(frames)
+            return
+
+        # Payloads are encoded once by the producer and relayed as-is
+        frames = event["frames"]
+        if self.mode == "delta" and "delta" in frames and event["base_timestamp"] == self.last_timestamp:
+            await self.send_frame(frames["delta"])
+        else:
+            await self.send_frame(frames["full"])
+        self.last_timestamp = event["last_timestamp"]
+        if "published_at" in event:
+            websocket_send_lag.observe(time.time() - event["published_at"])
+
+
+async def scope_user(scope):
+    """The session user of the socket, else the user of a JWT access token passed as ?token=; None if neither."""
+    user = scope.get("user")
+    if user is not None and user.is_authenticated:
+        return user
+    token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+    if not token:
+        return None
+    # Browsers cannot set headers on a WebSocket handshake, so the token travels in the query string
+    authentication = JWTAuthentication()
+    try:
+        return await database_sync_to_async(lambda: authentication.get_user(authentication.get_validated_token(token[0])))()
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+class AlertConsumer(AsyncWebsocketConsumer):
+    """Pushes the user's price alerts as the alert engine fires them."""
 
+    async def connect(self):
+        self.group_name = None
+        user = await scope_user(self.scope)
+        if user is None:
+            await self.close()
+            return
+
+        # Every socket of the user joins the same group, so each fired batch is sent once per user
+        self.group_name = alert_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
+    async def alert_fired(self, event):
+        await self.send(text_data=json.dumps({"type": "alerts", "alerts": event["alerts"]}))
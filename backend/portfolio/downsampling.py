@@ -0,0 +1,88 @@
+import numpy as np
+
+# LTTB keeps the first and last point and needs at least one bucket between them
+MIN_POINTS = 3
+MAX_POINTS = 10000
+
+
+def parse_max_points(max_points=None, width=None):
+    """Resolution a client asked for: max_points, or one point per pixel of width. None means full series."""
+    value = max_points if max_points is not None else width
+    if value is None or value == "":
+        return None
+    value = int(value)
+    if not MIN_POINTS <= value <= MAX_POINTS:
+        raise ValueError(f"max_points must be between {MIN_POINTS} and {MAX_POINTS}")
+    return value
+
+
+def _column(points, field):
+    return np.array([np.nan if point.get(field) is None else point[field] for point in points], dtype=float)
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps out of (x, y)."""
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+
+    # Bucket edges for the n - 2 interior points, split into threshold - 2 buckets
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Third triangle vertex: the mean of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        a = selected[i]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        selected[i + 1] = start + int(np.argmax(areas))
+    return selected
+
+
+def downsample_line(points, max_points):
+    # Gaps carry no shape, and NaN would poison every area they touch
+    points = [point for point in points if point.get("price") is not None]
+    if len(points) <= max_points:
+        return points
+
+    x, y = _column(points, "timestamp"), _column(points, "price")
+    return [points[i] for i in lttb_indices(x, y, max_points)]
+
+
+def downsample_candles(points, max_points):
+    """Merge runs of consecutive candles: first open, highest high, lowest low, last close."""
+    n = len(points)
+    if n <= max_points:
+        return points
+
+    starts = np.floor(np.linspace(0, n, max_points, endpoint=False)).astype(int)
+    ends = np.append(starts[1:], n) - 1
+    timestamps = _column(points, "timestamp")
+    opens, closes = _column(points, "open"), _column(points, "close")
+    # fmax/fmin skip NaN, so one missing value does not blank the whole bucket
+    highs = np.fmax.reduceat(_column(points, "high"), starts)
+    lows = np.fmin.reduceat(_column(points, "low"), starts)
+
+    def value(array, i):
+        return None if np.isnan(array[i]) else float(array[i])
+
+    return [
+        {
+            "timestamp": int(timestamps[start]),
+            "open": value(opens, start),
+            "high": value(highs, i),
+            "low": value(lows, i),
+            "close": value(closes, end),
+        }
+        for i, (start, end) in enumerate(zip(starts, ends))
+    ]
+
+
+def downsample(points, chart_type, max_points):
+    if chart_type == "candlestick":
+        return downsample_candles(points, max_points)
+    return downsample_line(points, max_points)
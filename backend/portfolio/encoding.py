@@ -0,0 +1,97 @@
+import json
+import math
+import struct
+import sys
+from array import array
+
+# Wire formats a chart client can negotiate
+CHART_FORMATS = ["json", "columnar", "binary"]
+
+CHART_FIELDS = {
+    "line": ["timestamp", "price"],
+    "candlestick": ["timestamp", "open", "high", "low", "close"],
+}
+
+
+def to_columns(points, chart_type):
+    """Row dicts -> one list per field, so key names are not repeated for every point."""
+    fields = CHART_FIELDS.get(chart_type, CHART_FIELDS["line"])
+    return {field: [point.get(field) for point in points] for field in fields}
+
+
+def from_columns(columns):
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+
+def dumps_columns(points, chart_type):
+    return json.dumps(to_columns(points, chart_type), separators=(",", ":"))
+
+
+def loads_points(text):
+    """Decode a cached chart series, columnar or (from older cache entries) a list of row dicts."""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        return from_columns(data)
+    return data
+
+
+def _column_bytes(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column.tobytes()
+
+
+def pack_binary(message, chart_type):
+    """Binary frame: uint32 LE header length, JSON header, int64 LE timestamps, then one float64 LE column per field.
+
+    Missing values are sent as NaN.
+    """
+    columns = to_columns(message["chart_data"], chart_type)
+    header = {key: value for key, value in message.items() if key != "chart_data"}
+    header.update({"format": "binary", "count": len(message["chart_data"]), "columns": list(columns)})
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+
+    parts = [struct.pack("<I", len(header_bytes)), header_bytes]
+    for field, values in columns.items():
+        if field == "timestamp":
+            parts.append(_column_bytes("q", [int(value) for value in values]))
+        else:
+            parts.append(_column_bytes("d", [math.nan if value is None else float(value) for value in values]))
+    return b"".join(parts)
+
+
+def unpack_binary(frame):
+    (header_length,) = struct.unpack_from("<I", frame)
+    header = json.loads(frame[4:4 + header_length])
+    offset, count = 4 + header_length, header["count"]
+
+    columns = {}
+    for field in header["columns"]:
+        column = array("q" if field == "timestamp" else "d")
+        column.frombytes(frame[offset:offset + 8 * count])
+        if sys.byteorder != "little":
+            column.byteswap()
+        columns[field] = [None if isinstance(value, float) and math.isnan(value) else value for value in column]
+        offset += 8 * count
+
+    header["chart_data"] = from_columns(columns)
+    return header
+
+
+def encode_chart_message(message, chart_type, formats=CHART_FORMATS):
+    """Encode a chart message in each of `formats`; error payloads are JSON in all of them."""
+    if not isinstance(message.get("chart_data"), list):
+        text = json.dumps(message)
+        return {chart_format: text for chart_format in formats}
+
+    frames = {}
+    if "json" in formats:
+        frames["json"] = json.dumps(message)
+    if "columnar" in formats:
+        columnar = dict(message, format="columnar", chart_data=to_columns(message["chart_data"], chart_type))
+        frames["columnar"] = json.dumps(columnar, separators=(",", ":"))
+    if "binary" in formats:
+        frames["binary"] = pack_binary(message, chart_type)
+    return frames
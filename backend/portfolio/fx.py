@@ -0,0 +1,137 @@
+import re
+from decimal import Decimal
+import httpx
+from . import coingecko
+from .caching import aentry_version, aget_or_fetch, entry_version, get_or_fetch, is_error
+from .encoding import CHART_FIELDS
+
+# Everything upstream is fetched and cached in USD; other fiat currencies are converted on the way out
+BASE_CURRENCY = "usd"
+FX_RATES_KEY = "fx_rates"
+FX_FAMILY = "fx_rates"
+# Market columns quoted in money, as opposed to ranks and percentages
+MONEY_FIELDS = ["current_price", "market_cap", "total_volume"]
+
+re_currency = re.compile(r"^[a-z]{3,4}$")
+
+
+def parse_rates(data):
+    """Units of each fiat currency per USD, from CoinGecko's BTC based /exchange_rates table."""
+    rates = data.get("rates", {})
+    usd = rates.get(BASE_CURRENCY, {}).get("value")
+    if not usd:
+        return {"error": "CoinGecko exchange rates have no USD rate"}
+    return {
+        currency: rate["value"] / usd
+        for currency, rate in rates.items()
+        if rate.get("type") == "fiat" and rate.get("value")
+    }
+
+
+def _parse(response):
+    if response.status_code != 200:
+        return {"error": "Failed to fetch data from CoinGecko"}
+    return parse_rates(response.json())
+
+
+def fetch_fx_rates():
+    try:
+        return _parse(coingecko.get("/exchange_rates"))
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+
+
+async def afetch_fx_rates():
+    try:
+        return _parse(await coingecko.aget("/exchange_rates"))
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+
+
+def get_fx_rates():
+    # One table for every currency, so adding currencies never adds upstream calls or cache keys
+    return get_or_fetch(FX_RATES_KEY, fetch_fx_rates, family=FX_FAMILY)
+
+
+async def aget_fx_rates():
+    return await aget_or_fetch(FX_RATES_KEY, afetch_fx_rates, family=FX_FAMILY)
+
+
+def parse_currency(value):
+    currency = str(value or BASE_CURRENCY).strip().lower()
+    if not re_currency.match(currency):
+        raise ValueError(f"Invalid currency: {value}")
+    return currency
+
+
+def pick_rate(rates, currency):
+    if is_error(rates):
+        return rates
+    if currency not in rates:
+        raise ValueError(f"Unsupported currency: {currency}")
+    return rates[currency]
+
+
+def usd_rate(currency):
+    """Units of `currency` per USD; an error dict if the rate table is unavailable, ValueError if unknown."""
+    if currency == BASE_CURRENCY:
+        return 1.0
+    return pick_rate(get_fx_rates(), currency)
+
+
+async def ausd_rate(currency):
+    if currency == BASE_CURRENCY:
+        return 1.0
+    return pick_rate(await aget_fx_rates(), currency)
+
+
+def fx_version(version, currency):
+    """Version of a response converted to `currency`: it changes with the data and with the rates.
+
+    Like entry_version, read it before the rate.
+    """
+    if currency == BASE_CURRENCY or version is None:
+        return version
+    rates_version = entry_version(FX_RATES_KEY)
+    return None if rates_version is None else max(version, rates_version)
+
+
+async def afx_version(version, currency):
+    if currency == BASE_CURRENCY or version is None:
+        return version
+    rates_version = await aentry_version(FX_RATES_KEY)
+    return None if rates_version is None else max(version, rates_version)
+
+
+def convert(value, rate):
+    if rate == 1 or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return value * rate
+
+
+def convert_decimal(value, rate):
+    return value if rate == 1 else value * Decimal(str(rate))
+
+
+def convert_coins(coins, rate):
+    if rate == 1:
+        return coins
+    return [{**coin, **{field: convert(coin.get(field), rate) for field in MONEY_FIELDS if field in coin}} for coin in coins]
+
+
+def convert_points(points, rate, chart_type):
+    """Chart points with their prices in the target currency; timestamps and error dicts pass through."""
+    if rate == 1 or not isinstance(points, list):
+        return points
+    fields = [field for field in CHART_FIELDS.get(chart_type, CHART_FIELDS["line"]) if field != "timestamp"]
+    return [{**point, **{field: convert(point.get(field), rate) for field in fields if field in point}} for point in points]
+
+
+def usd_bounds(filters, rate):
+    """min_/max_ filters given in the target currency, moved onto the USD columns of the snapshot."""
+    if rate == 1:
+        return filters
+    return {
+        field: tuple(None if bound is None else bound / rate for bound in bounds) if field in MONEY_FIELDS else bounds
+        for field, bounds in filters.items()
+    }
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime, timezone
+import numpy as np
+from django.db.models import Count, Max
+from .caching import aget_or_fetch, get_or_fetch, is_error
+from .models import PortfolioTransaction
+from .services import getChartData, getChartDataAsync
+from .timeseries import DAY_MS, LINE_STEP_MS, SERIES_DAYS, now_ms
+
+HISTORY_FAMILY = "portfolio_history"
+# Ledger timestamps are aware datetimes; numpy only converts their offsets from this epoch
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def ledger_deltas(types, amounts, prices, fees):
+    """Vectorised transaction_deltas: (amount, total_spent) change of every ledger row."""
+    buy, sell = types == "buy", types == "sell"
+    incoming = buy | (types == "transfer_in")
+    amount_delta = np.select([incoming, sell, types == "transfer_out"], [amounts, -amounts, -(amounts + fees)], 0.0)
+    spent_delta = np.select([buy, sell], [amounts * prices + fees, -(amounts * prices - fees)], 0.0)
+    return amount_delta, spent_delta
+
+
+def time_grid(interval_type, now):
+    """Grid of the interval's chart resolution over its window, ending at the last whole step."""
+    step = LINE_STEP_MS[interval_type]
+    end = now - now % step
+    return np.arange(end - SERIES_DAYS[interval_type] * DAY_MS, end + 1, step, dtype=np.int64)
+
+
+def running_total(times, deltas, grid):
+    """Sum of all deltas at or before each grid time."""
+    totals = np.concatenate([[0.0], np.cumsum(deltas)])
+    return totals[np.searchsorted(times, grid, side="right")]
+
+
+def forward_fill(times, values, grid):
+    """Last known value at or before each grid time, NaN before the first one."""
+    index = np.searchsorted(times, grid, side="right") - 1
+    return np.where(index >= 0, values[np.clip(index, 0, None)], np.nan)
+
+
+def ledger_version_key(version):
+    return f"{version['last'] or 0}_{version['count']}"
+
+
+def ledger_version(user):
+    # Changes with every insert, so cached histories are keyed out as soon as the ledger grows
+    return ledger_version_key(PortfolioTransaction.objects.filter(user=user).aggregate(last=Max("id"), count=Count("id")))
+
+
+async def aledger_version(user):
+    return ledger_version_key(await PortfolioTransaction.objects.filter(user=user).aaggregate(last=Max("id"), count=Count("id")))
+
+
+def ledger_rows(user):
+    return (
+        PortfolioTransaction.objects.filter(user=user)
+        .order_by("timestamp", "id")
+        .values_list("coin_id", "type", "amount", "price_usd", "fee", "timestamp")
+    )
+
+
+def group_ledger(rows):
+    """{coin_id: (times in ms, amount deltas, spent deltas)} in ledger order."""
+    if not rows:
+        return {}
+
+    coin_ids, types, amounts, prices, fees, timestamps = zip(*rows)
+    coin_ids = np.array(coin_ids)
+    times = (np.array(timestamps, dtype=object) - EPOCH).astype("timedelta64[ms]").astype(np.int64)
+    amount_delta, spent_delta = ledger_deltas(
+        np.array(types),
+        np.array(amounts, dtype=float),
+        np.array(prices, dtype=float),
+        np.array([fee or 0 for fee in fees], dtype=float),
+    )
+    return {
+        coin_id: (times[coin_ids == coin_id], amount_delta[coin_ids == coin_id], spent_delta[coin_ids == coin_id])
+        for coin_id in dict.fromkeys(coin_ids.tolist())
+    }
+
+
+def load_ledger(user):
+    return group_ledger(list(ledger_rows(user)))
+
+
+async def aload_ledger(user):
+    return group_ledger([row async for row in ledger_rows(user)])
+
+
+def positions(ledger, grid):
+    """(amount held per coin, total spent, coins held at some point of the grid) on the grid."""
+    amounts = {coin_id: running_total(times, deltas, grid) for coin_id, (times, deltas, _) in ledger.items()}
+    spent = sum((running_total(times, deltas, grid) for times, _, deltas in ledger.values()), np.zeros(len(grid)))
+    # Coins sold off before the window contribute nothing and need no price series
+    held = [coin_id for coin_id, amount in amounts.items() if amount.any()]
+    return amounts, spent, held
+
+
+def value_history(interval_type, grid, amounts, spent, held, series):
+    value = np.zeros(len(grid))
+    missing = []
+    for coin_id, chart_data in zip(held, series):
+        if is_error(chart_data) or not chart_data:
+            missing.append(coin_id)
+            continue
+        times = np.array([point["timestamp"] for point in chart_data], dtype=np.int64)
+        prices = np.array([np.nan if point["price"] is None else point["price"] for point in chart_data], dtype=float)
+        held_value = amounts[coin_id] * forward_fill(times, prices, grid)
+        # Held before its first price point: that part of the value is unknown, so the coin counts as missing
+        if np.isnan(held_value[amounts[coin_id] != 0]).any():
+            missing.append(coin_id)
+        value += np.nan_to_num(held_value)
+
+    profit_loss = value - spent
+    return {
+        "interval_type": interval_type,
+        "missing_prices": missing,
+        "history": [
+            {"timestamp": timestamp, "value": v, "total_spent": s, "profit_loss": p}
+            for timestamp, v, s, p in zip(
+                grid.tolist(), np.round(value, 2).tolist(), np.round(spent, 2).tolist(), np.round(profit_loss, 2).tolist()
+            )
+        ],
+    }
+
+
+def build_history(user, interval_type):
+    grid = time_grid(interval_type, now_ms())
+    amounts, spent, held = positions(load_ledger(user), grid)
+    # One coin after another; each series is usually a cache hit
+    series = [getChartData(coin_id, interval_type, "line") for coin_id in held]
+    return value_history(interval_type, grid, amounts, spent, held, series)
+
+
+async def abuild_history(user, interval_type):
+    grid = time_grid(interval_type, now_ms())
+    amounts, spent, held = positions(await aload_ledger(user), grid)
+    series = await asyncio.gather(*[getChartDataAsync(coin_id, interval_type, "line") for coin_id in held])
+    return value_history(interval_type, grid, amounts, spent, held, series)
+
+
+def history_cache_key(user, interval_type, version):
+    return f"{HISTORY_FAMILY}_{user.pk}_{interval_type}_{version}"
+
+
+def get_portfolio_history(user, interval_type="daily"):
+    cache_key = history_cache_key(user, interval_type, ledger_version(user))
+    return get_or_fetch(cache_key, lambda: build_history(user, interval_type), family=HISTORY_FAMILY)
+
+
+async def aget_portfolio_history(user, interval_type="daily"):
+    cache_key = history_cache_key(user, interval_type, await aledger_version(user))
+    return await aget_or_fetch(cache_key, lambda: abuild_history(user, interval_type), family=HISTORY_FAMILY)
@@ -0,0 +1,118 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Min, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import PortfolioTransaction, PortfolioHolding
+
+
+def transaction_deltas(tx_type, amount, price_usd, fee):
+    """Change to (amount, total_spent) of a position caused by one ledger entry."""
+    fee = fee or Decimal(0)
+
+    if tx_type == "buy":
+        return amount, amount * price_usd + fee
+    elif tx_type == "sell":
+        return -amount, -(amount * price_usd - fee)
+    elif tx_type == "transfer_in":
+        return amount, Decimal(0)
+    elif tx_type == "transfer_out":
+        return -(amount + fee), Decimal(0)
+    return Decimal(0), Decimal(0)
+
+
+def apply_deltas(user, coin_id, amount_delta, spent_delta):
+    # F() updates so concurrent inserts for the same coin cannot lose each other's changes
+    holding, _ = PortfolioHolding.objects.get_or_create(user=user, coin_id=coin_id)
+    PortfolioHolding.objects.filter(pk=holding.pk).update(
+        amount=F("amount") + amount_delta,
+        total_spent=F("total_spent") + spent_delta,
+    )
+
+
+def apply_transaction(tx):
+    """Fold a newly saved transaction into its holding; call inside the insert's DB transaction."""
+    amount_delta, spent_delta = transaction_deltas(tx.type, tx.amount, tx.price_usd, tx.fee)
+    apply_deltas(tx.user, tx.coin_id, amount_delta, spent_delta)
+
+
+def aggregate_holdings(transactions):
+    """Fold ledger rows into positions with one grouped query.
+
+    Yields dicts with user_id, coin_id, net_amount and net_spent (Decimal), one per
+    (user, coin), in the order each coin first appeared in the ledger.
+    """
+    decimal = DecimalField(max_digits=40, decimal_places=16)
+    zero = Value(Decimal(0), output_field=decimal)
+    fee = Coalesce(F("fee"), zero, output_field=decimal)
+    cost = F("amount") * F("price_usd")
+
+    return (
+        transactions
+        .order_by()
+        .values("user_id", "coin_id")
+        .annotate(
+            net_amount=Coalesce(Sum(Case(
+                When(type__in=["buy", "transfer_in"], then=F("amount")),
+                When(type="sell", then=-F("amount")),
+                When(type="transfer_out", then=-(F("amount") + fee)),
+                default=zero,
+                output_field=decimal,
+            )), zero),
+            net_spent=Coalesce(Sum(Case(
+                When(type="buy", then=cost + fee),
+                When(type="sell", then=fee - cost),
+                default=zero,
+                output_field=decimal,
+            )), zero),
+            first_id=Min("id"),
+        )
+        .order_by("first_id")
+    )
+
+
+def compute_holdings(transactions):
+    """Positions as {(user_id, coin_id): (amount, total_spent)}, aggregated in the database."""
+    return {
+        (row["user_id"], row["coin_id"]): (row["net_amount"], row["net_spent"])
+        for row in aggregate_holdings(transactions)
+    }
+
+
+def find_mismatches(user=None):
+    """Holdings that disagree with the ledger, as (user_id, coin_id, stored, expected) tuples."""
+    transactions = PortfolioTransaction.objects.all()
+    holdings = PortfolioHolding.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        holdings = holdings.filter(user=user)
+
+    expected = compute_holdings(transactions)
+    stored = {(h.user_id, h.coin_id): (h.amount, h.total_spent) for h in holdings}
+
+    zero = (Decimal(0), Decimal(0))
+    return [
+        (user_id, coin_id, stored.get((user_id, coin_id)), expected.get((user_id, coin_id), zero))
+        for user_id, coin_id in sorted(expected.keys() | stored.keys())
+        if stored.get((user_id, coin_id)) != expected.get((user_id, coin_id), zero)
+    ]
+
+
+def rebuild_holdings(user=None):
+    """Replace holdings with a fresh fold of the ledger. Returns the number of rows written."""
+    transactions = PortfolioTransaction.objects.all()
+    holdings = PortfolioHolding.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        holdings = holdings.filter(user=user)
+
+    with transaction.atomic():
+        positions = compute_holdings(transactions)
+        holdings.delete()
+        PortfolioHolding.objects.bulk_create(
+            [
+                PortfolioHolding(user_id=user_id, coin_id=coin_id, amount=amount, total_spent=total_spent)
+                for (user_id, coin_id), (amount, total_spent) in positions.items()
+            ],
+            batch_size=1000,
+        )
+    return len(positions)
@@ -0,0 +1,122 @@
+import codecs
+import csv
+import json
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .holdings import apply_deltas, transaction_deltas
+from .models import PortfolioTransaction
+from .serializers import PortfolioTransactionImportSerializer
+
+IMPORT_FORMATS = ["csv", "ndjson"]
+IMPORT_BATCH_SIZE = 1000
+# Only the first errors are echoed back so the report stays small for broken files
+MAX_REPORTED_ERRORS = 100
+# A CSV header without these is rejected before any row is read; blank cells still mean "not given".
+# An optional timestamp column keeps the original trade time, otherwise rows are dated at import
+CSV_COLUMNS = ["coin_id", "amount", "price_usd", "fee", "type"]
+
+
+def detect_format(upload, requested=None):
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+    name = (upload.name or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(upload, file_format):
+    """(row_number, data) pairs read one line at a time; data is a dict or an error message.
+
+    Raises ValueError when a CSV file has no readable header or the header lacks a CSV_COLUMNS column.
+    """
+    lines = codecs.iterdecode(upload, "utf-8-sig")
+    if file_format != "csv":
+        return _ndjson_rows(lines)
+
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames or []
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"Unreadable CSV header: {str(e)}")
+    missing = [column for column in CSV_COLUMNS if column not in fieldnames]
+    if missing:
+        raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+    return _csv_rows(reader)
+
+
+def _csv_rows(reader):
+    for row_number, row in enumerate(reader, start=1):
+        # Blank CSV cells mean "not given", e.g. an empty fee column
+        yield row_number, {key: value for key, value in row.items() if key and value not in ("", None)}
+
+
+def _ndjson_rows(lines):
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, f"Invalid JSON: {str(e)}"
+            continue
+        yield row_number, data if isinstance(data, dict) else "Each line must be a JSON object"
+
+
+def _write_batch(user, batch):
+    transactions = [PortfolioTransaction(user=user, **data) for data in batch]
+
+    positions = {}
+    for tx in transactions:
+        amount_delta, spent_delta = transaction_deltas(tx.type, tx.amount, tx.price_usd, tx.fee)
+        amount, spent = positions.get(tx.coin_id, (0, 0))
+        positions[tx.coin_id] = (amount + amount_delta, spent + spent_delta)
+
+    # Ledger rows and the holdings they move commit together, one coin update per batch
+    with transaction.atomic():
+        PortfolioTransaction.objects.bulk_create(transactions, batch_size=IMPORT_BATCH_SIZE)
+        for coin_id, (amount_delta, spent_delta) in positions.items():
+            apply_deltas(user, coin_id, amount_delta, spent_delta)
+
+
+def import_transactions(user, rows):
+    """Validate and insert rows in batches. Returns a report with per-row errors.
+
+    Rows are decoded lazily, so a file that turns out not to be UTF-8 or valid CSV part way
+    through stops the import there: the rows before it are still written, and the report
+    carries an "error" naming the row it stopped at.
+    """
+    validator = PortfolioTransactionImportSerializer()
+    report = {"imported": 0, "failed": 0, "errors": []}
+    batch = []
+    row_number = 0
+
+    def fail(row_number, errors):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "errors": errors})
+
+    try:
+        for row_number, data in rows:
+            if isinstance(data, str):
+                fail(row_number, {"non_field_errors": [data]})
+                continue
+            try:
+                batch.append(validator.run_validation(data))
+            except ValidationError as e:
+                fail(row_number, e.detail)
+                continue
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _write_batch(user, batch)
+                report["imported"] += len(batch)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        report["error"] = f"File could not be read after row {row_number}: {str(e)}"
+        fail(row_number + 1, {"non_field_errors": [str(e)]})
+
+    if batch:
+        _write_batch(user, batch)
+        report["imported"] += len(batch)
+
+    return report
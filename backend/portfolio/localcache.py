@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+
+# Processes tell each other which keys they rewrote; receivers drop their local copy
+INVALIDATION_CHANNEL = "cache_invalidation"
+RECONNECT_DELAY = 1
+
+# Identifies this process so it ignores its own invalidations
+PROCESS_ID = uuid.uuid4().hex
+
+
+class LocalCache:
+    """Size-bounded LRU with per-entry TTLs, held in front of Redis for the hottest keys.
+
+    Values are shared between callers as-is, so they must be treated as read-only.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = settings.LOCAL_CACHE_TTL if ttl is None else ttl
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.LOCAL_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": settings.LOCAL_CACHE_MAX_ENTRIES,
+                "ttl": settings.LOCAL_CACHE_TTL,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+local_cache = LocalCache()
+
+
+def redis_connection():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        # Other cache backends are not shared between processes, so there is nothing to invalidate
+        return None
+
+
+def publish_invalidation(key):
+    connection = redis_connection()
+    if connection is None:
+        return
+    ensure_listener()
+    try:
+        connection.publish(INVALIDATION_CHANNEL, json.dumps({"key": key, "origin": PROCESS_ID}))
+    except Exception as e:
+        logging.error(f"Failed to publish cache invalidation for {key}: {str(e)}")
+
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """Start the invalidation subscriber once per process (again after a fork)."""
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        connection = redis_connection()
+        if connection is None:
+            return
+        _listener_pid = os.getpid()
+        threading.Thread(target=_listen, args=(connection,), name="cache-invalidation", daemon=True).start()
+
+
+def _listen(connection):
+    while True:
+        pubsub = connection.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                handle_invalidation(message["data"])
+        except Exception as e:
+            logging.error(f"Cache invalidation subscriber failed: {str(e)}")
+        finally:
+            pubsub.close()
+        # Invalidations may have been missed while disconnected
+        local_cache.clear()
+        time.sleep(RECONNECT_DELAY)
+
+
+def handle_invalidation(data):
+    message = json.loads(data)
+    if message["origin"] != PROCESS_ID:
+        local_cache.discard(message["key"])
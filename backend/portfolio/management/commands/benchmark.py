@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import platform
+import uuid
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from portfolio import coingecko
+from portfolio.benchmark import runner
+from portfolio.benchmark.stub import CoinGeckoStub
+from portfolio.localcache import local_cache
+
+SCENARIOS = ["views", "summary", "history", "consumer"]
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API views and WebSocket fan-out against a local CoinGecko stub. "
+        "Uses a throwaway test database and its own cache key prefix; point REDIS_* at a non-production Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--latency-ms", type=float, default=50, help="Latency the CoinGecko stub adds to every call")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per view scenario")
+        parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients per view scenario")
+        parser.add_argument("--ledger-sizes", type=int_list, default=[10, 100, 1000], help="Comma-separated transaction counts")
+        parser.add_argument("--subscribers", type=int_list, default=[10, 100], help="Comma-separated WebSocket subscriber counts")
+        parser.add_argument("--publishes", type=int, default=10, help="Chart updates published per fan-out scenario")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Only run these scenarios (repeatable)")
+        parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+        parser.add_argument("--baseline", help="Earlier JSON results to compare against; exits non-zero on a regression")
+        parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p99/throughput change vs the baseline")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as baseline_file:
+                    baseline = json.load(baseline_file)["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read baseline {options['baseline']}: {str(e)}")
+
+        scenarios = options["scenario"] or SCENARIOS
+        if options["verbosity"] < 2:
+            # Per-request cache hit/miss logging would drown the progress lines and skew the timings
+            logging.getLogger().setLevel(logging.WARNING)
+        with CoinGeckoStub(latency_ms=options["latency_ms"]) as stub:
+            results = self.run(stub, scenarios, options)
+
+        report = {
+            "meta": {
+                "latency_ms": options["latency_ms"],
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "async_views": settings.ASYNC_VIEWS,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "results": results,
+        }
+        text = runner.write_results(report, options["output"])
+        if not options["output"]:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            regressions = runner.compare(results, baseline, options["max_regression"])
+            for name, metric, before, after in regressions:
+                self.stdout.write(self.style.ERROR(f"{name}: {metric} {before} -> {after}"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} metrics regressed by more than {options['max_regression']:.0%}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run(self, stub, scenarios, options):
+        # Fresh key prefix so every run starts cold and never reads keys of a live deployment
+        caches = {name: {**config, "KEY_PREFIX": f"benchmark_{uuid.uuid4().hex}"} for name, config in settings.CACHES.items()}
+        overrides = override_settings(
+            CACHES=caches,
+            COINGECKO_BASE_URL=stub.base_url,
+            COINGECKO_HTTP2=False,
+            # The stub has no quota; the limiter must not be what gets measured
+            COINGECKO_RATE_LIMIT_PER_MINUTE=10 ** 6,
+            COINGECKO_RATE_LIMIT_BURST=10 ** 6,
+        )
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with overrides:
+                coingecko.reset_clients()
+                local_cache.clear()
+                return self.run_scenarios(stub, scenarios, options)
+        finally:
+            coingecko.reset_clients()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def measure(self, stub, name, func, *args):
+        calls_before = sum(stub.calls.values())
+        self.stderr.write(f"Running {name}")
+        result = func(*args)
+        result["upstream_calls"] = sum(stub.calls.values()) - calls_before
+        return result
+
+    def run_scenarios(self, stub, scenarios, options):
+        load = (options["requests"], options["concurrency"])
+        results = {}
+
+        if "views" in scenarios:
+            for name, url in runner.view_targets().items():
+                results[name] = self.measure(stub, name, runner.run_load, url, None, *load)
+
+        for size in options["ledger_sizes"] if {"summary", "history"} & set(scenarios) else []:
+            headers = runner.auth_headers(runner.create_ledger(size))
+            if "summary" in scenarios:
+                name = f"portfolio-summary[ledger={size}]"
+                results[name] = self.measure(stub, name, runner.run_load, reverse("portfolio-summary"), headers, *load)
+            if "history" in scenarios:
+                name = f"portfolio-history[ledger={size}]"
+                results[name] = self.measure(stub, name, runner.run_load, reverse("portfolio-history"), headers, *load)
+
+        if "consumer" in scenarios:
+            for subscribers in options["subscribers"]:
+                name = f"consumer-fanout[subscribers={subscribers}]"
+                results[name] = self.measure(
+                    stub, name, lambda: asyncio.run(runner.consumer_fanout(subscribers, options["publishes"]))
+                )
+
+        return results
@@ -0,0 +1,31 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from portfolio.poller import MarketDataPoller
+
+
+class Command(BaseCommand):
+    help = "Poll CoinGecko on a rate-limited schedule and keep the market, detail and price cache keys warm."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run a single poll cycle and exit")
+        parser.add_argument("--top", type=int, help="Number of top coins by market cap to keep details for")
+        parser.add_argument("--calls-per-minute", type=int, help="Upstream call budget for this poller")
+        parser.add_argument("--interval", type=int, help="Minimum seconds between the start of two cycles")
+
+    def handle(self, *args, **options):
+        poller = MarketDataPoller(
+            top_n=options["top"],
+            calls_per_minute=options["calls_per_minute"],
+            interval=options["interval"],
+        )
+
+        if options["once"]:
+            asyncio.run(poller.poll_once())
+            self.stdout.write(self.style.SUCCESS("Poll cycle finished"))
+            return
+
+        self.stdout.write(f"Polling every {poller.interval}s within {poller.calls_per_minute} calls/minute")
+        try:
+            asyncio.run(poller.run())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from portfolio.holdings import find_mismatches, rebuild_holdings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the PortfolioHolding table from the transaction ledger, or check it for drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Email of a single user to rebuild or check")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report holdings that disagree with the ledger; exits non-zero if any do",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(email=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        if options["check"]:
+            mismatches = find_mismatches(user)
+            for user_id, coin_id, stored, expected in mismatches:
+                self.stdout.write(f"user={user_id} coin={coin_id} stored={stored} expected={expected}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} holdings disagree with the ledger")
+            self.stdout.write(self.style.SUCCESS("Holdings match the ledger"))
+            return
+
+        count = rebuild_holdings(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} holdings"))
@@ -0,0 +1,214 @@
+import logging
+import math
+import httpx
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from . import coingecko
+from .caching import aget_or_fetch, astore, get_or_fetch, is_error, store, unwrap
+from .ratelimit import INTERACTIVE
+
+MARKETS_CACHE_KEY = "crypto_list"
+MARKETS_FAMILY = "crypto_list"
+# Largest page /coins/markets serves
+MARKETS_PAGE_SIZE = 250
+MARKETS_PARAMS = {
+    "vs_currency": "usd",
+    "order": "market_cap_desc",
+    "per_page": MARKETS_PAGE_SIZE,
+    "sparkline": False
+}
+
+SORT_FIELDS = ["market_cap_rank", "market_cap", "current_price", "price_change_percentage_24h", "total_volume"]
+# Query parameter stem -> column, used as min_<stem> / max_<stem>
+FILTER_FIELDS = {
+    "price": "current_price",
+    "market_cap": "market_cap",
+    "change": "price_change_percentage_24h",
+    "volume": "total_volume",
+}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 250
+
+
+def snapshot_pages():
+    return range(1, math.ceil(settings.MARKET_SNAPSHOT_SIZE / MARKETS_PAGE_SIZE) + 1)
+
+
+def page_params(page):
+    return {**MARKETS_PARAMS, "page": page}
+
+
+def extend_snapshot(coins, data, page):
+    """(snapshot so far, done) after adding one /coins/markets page.
+
+    A failed first page fails the snapshot; a failed later page keeps the coins
+    already fetched, so the long tail being unavailable never hides the top coins.
+    """
+    if is_error(data):
+        if not coins:
+            return data, True
+        logging.warning(f"Market snapshot stopped at page {page}: {data['error']}")
+        return coins, True
+
+    coins.extend(data[:settings.MARKET_SNAPSHOT_SIZE - len(coins)])
+    return coins, len(data) < MARKETS_PAGE_SIZE or len(coins) >= settings.MARKET_SNAPSHOT_SIZE
+
+
+def _parse(response):
+    if response.status_code != 200:
+        return {"error": "Failed to fetch data from CoinGecko"}
+    return response.json()
+
+
+def fetch_market_snapshot(priority=INTERACTIVE, pages=None):
+    """/coins/markets pages in market cap order, by default every page up to settings.MARKET_SNAPSHOT_SIZE coins."""
+    coins = []
+    for page in pages or snapshot_pages():
+        try:
+            data = _parse(coingecko.get("/coins/markets", params=page_params(page), priority=priority))
+        except httpx.RequestError as e:
+            data = {"error": f"Request failed: {str(e)}"}
+        coins, done = extend_snapshot(coins, data, page)
+        if done:
+            break
+    return coins
+
+
+async def afetch_market_snapshot(priority=INTERACTIVE, pages=None):
+    coins = []
+    for page in pages or snapshot_pages():
+        try:
+            data = _parse(await coingecko.aget("/coins/markets", params=page_params(page), priority=priority))
+        except httpx.RequestError as e:
+            data = {"error": f"Request failed: {str(e)}"}
+        coins, done = extend_snapshot(coins, data, page)
+        if done:
+            break
+    return coins
+
+
+def splice_first_page(data, previous):
+    """A fresh first page in front of the rest of a previous snapshot, so a refresh never shrinks it.
+
+    The rest keeps its older figures until the poller refreshes the whole snapshot.
+    """
+    if is_error(data) or not isinstance(previous, list):
+        return data
+    ids = {coin.get("id") for coin in data}
+    # Coins that fell off the first page come first, as they rank right behind it
+    return (data + [coin for coin in previous if coin.get("id") not in ids])[:settings.MARKET_SNAPSHOT_SIZE]
+
+
+def fetch_first_page():
+    cached = cache.get(MARKETS_CACHE_KEY)
+    return splice_first_page(fetch_market_snapshot(pages=[1]), None if cached is None else unwrap(cached)[0])
+
+
+async def afetch_first_page():
+    cached = await cache.aget(MARKETS_CACHE_KEY)
+    return splice_first_page(await afetch_market_snapshot(pages=[1]), None if cached is None else unwrap(cached)[0])
+
+
+def get_market_snapshot():
+    # The whole snapshot only comes from the poller. Requests refresh just the top page: every page at the
+    # interactive rate limit could outlast caching.WAIT_TIMEOUT and LOCK_TIMEOUT and let waiters stampede
+    return get_or_fetch(MARKETS_CACHE_KEY, fetch_first_page, family=MARKETS_FAMILY)
+
+
+async def aget_market_snapshot():
+    return await aget_or_fetch(MARKETS_CACHE_KEY, afetch_first_page, family=MARKETS_FAMILY)
+
+
+def refresh_market_snapshot():
+    """Refetch the first page now, keeping the rest of the cached snapshot (?refresh=true)."""
+    data = fetch_first_page()
+    if not is_error(data):
+        store(MARKETS_CACHE_KEY, data, MARKETS_FAMILY)
+
+
+async def arefresh_market_snapshot():
+    data = await afetch_first_page()
+    if not is_error(data):
+        await astore(MARKETS_CACHE_KEY, data, MARKETS_FAMILY)
+
+
+def parse_number(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    number = float(value)
+    if math.isnan(number):
+        raise ValueError(f"{name} must be a number")
+    return number
+
+
+def parse_market_query(params):
+    """sort ("-" prefix for descending), min_/max_ filters and page/page_size of a list request."""
+    sort = params.get("sort") or "market_cap_rank"
+    descending = sort.startswith("-")
+    sort = sort.lstrip("-")
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+
+    filters = {}
+    for stem, field in FILTER_FIELDS.items():
+        low, high = parse_number(params, f"min_{stem}"), parse_number(params, f"max_{stem}")
+        if low is not None or high is not None:
+            filters[field] = (low, high)
+
+    page = int(params.get("page") or 1)
+    page_size = int(params.get("page_size") or DEFAULT_PAGE_SIZE)
+    if page < 1:
+        raise ValueError("page must be at least 1")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return {"sort": sort, "descending": descending, "filters": filters, "page": page, "page_size": page_size}
+
+
+def _column(coins, field):
+    return np.array([np.nan if coin.get(field) is None else coin[field] for coin in coins], dtype=float)
+
+
+class MarketIndex:
+    """Numeric columns and every sort order of one market snapshot, so a query is a mask and a slice."""
+
+    def __init__(self, coins):
+        self.coins = coins
+        self.columns = {field: _column(coins, field) for field in SORT_FIELDS}
+        # argsort puts NaN last either way round; stable, so ties keep market cap order
+        self.orders = {}
+        for field, values in self.columns.items():
+            self.orders[(field, False)] = np.argsort(values, kind="stable")
+            self.orders[(field, True)] = np.argsort(-values, kind="stable")
+
+    def query(self, sort="market_cap_rank", descending=False, filters=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """(total matching coins, coins on the page)."""
+        order = self.orders[(sort, descending)]
+        if filters:
+            mask = np.ones(len(self.coins), dtype=bool)
+            for field, (low, high) in filters.items():
+                # Comparisons with NaN are False, so coins missing the field are filtered out
+                if low is not None:
+                    mask &= self.columns[field] >= low
+                if high is not None:
+                    mask &= self.columns[field] <= high
+            order = order[mask[order]]
+
+        start = (page - 1) * page_size
+        return len(order), [self.coins[i] for i in order[start:start + page_size]]
+
+
+# (snapshot version, index); rebuilt once per snapshot refresh, not per request
+_index = None
+
+
+def market_index(coins, version):
+    global _index
+    current = _index
+    if version is not None and current is not None and current[0] == version:
+        return current[1]
+    index = MarketIndex(coins)
+    if version is not None:
+        _index = (version, index)
+    return index
@@ -0,0 +1,73 @@
+import re
+from django.conf import settings
+from prometheus_client import Counter, Gauge, Histogram
+
+# Upstream calls are mostly a few hundred ms; views served from cache are a few ms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, by view",
+    ["view", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+coingecko_requests = Counter(
+    "coingecko_requests_total",
+    "CoinGecko calls by endpoint and response status ('error' when no response arrived)",
+    ["endpoint", "status"],
+)
+coingecko_request_duration = Histogram(
+    "coingecko_request_duration_seconds",
+    "CoinGecko call latency by endpoint",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+
+cache_lookups = Counter(
+    "cache_lookups_total",
+    "get_or_fetch lookups by key family and result (fresh_hit, stale_hit, miss)",
+    ["family", "result"],
+)
+cache_tier_lookups = Counter(
+    "cache_tier_lookups_total",
+    "Reads per cache tier (local, redis) and key family, by result (hit, miss)",
+    ["tier", "family", "result"],
+)
+
+websocket_connections = Gauge(
+    "websocket_connections",
+    "Open CryptoConsumer connections in this process",
+)
+websocket_messages = Counter(
+    "websocket_messages_sent_total",
+    "Chart messages sent to WebSocket clients, by wire format",
+    ["format"],
+)
+websocket_message_bytes = Counter(
+    "websocket_message_bytes_total",
+    "Bytes of chart messages sent to WebSocket clients, by wire format",
+    ["format"],
+)
+websocket_send_lag = Histogram(
+    "websocket_send_lag_seconds",
+    "Time from a producer publishing a chart update to a subscriber sending it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+price_alerts_fired = Counter(
+    "price_alerts_fired_total",
+    "Price alerts fired by the alert engine",
+)
+
+# Coin ids in paths would give every coin its own series
+re_coin_path = re.compile(r"^/coins/(?!markets$|list$)[^/]+")
+
+
+def endpoint_label(path):
+    return re_coin_path.sub("/coins/{id}", path)
+
+
+def family_label(family):
+    # Keys without a configured family fall back to the key itself; those are lumped together
+    return family if family in settings.CACHE_TTLS else "other"
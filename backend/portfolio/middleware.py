@@ -0,0 +1,79 @@
+import re
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import decorator_from_middleware
+from .metrics import http_request_duration
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Middle of brotli's 0-11 range: most of the size win at a fraction of the CPU of 11
+BROTLI_QUALITY = 5
+MIN_LENGTH = 200
+
+re_accepts_br = re.compile(r"\bbr\b(?!\s*;\s*q=0(?:\.0*)?(?![\d.]))")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Brotli when the client accepts it and the brotli package is installed, gzip otherwise."""
+
+    def process_response(self, request, response):
+        accepts_br = re_accepts_br.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if (not BROTLI_AVAILABLE or not accepts_br or response.streaming
+                or len(response.content) < MIN_LENGTH or response.has_header("Content-Encoding")):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+
+        # The encoded body differs byte for byte, so only a weak ETag still holds
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
+
+
+# Applied per view in urls.py: auth responses stay uncompressed, away from BREACH-style attacks
+compress_response = decorator_from_middleware(CompressionMiddleware)
+
+
+class MetricsMiddleware:
+    """Observes every request in http_request_duration_seconds, labelled by URL name rather than path."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Stays on the event loop under ASGI, so async views are not pushed through a thread
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    def observe(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        http_request_duration.labels(view, request.method, response.status_code).observe(time.perf_counter() - started)
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_holdings(apps, schema_editor):
+    PortfolioTransaction = apps.get_model('portfolio', 'PortfolioTransaction')
+    PortfolioHolding = apps.get_model('portfolio', 'PortfolioHolding')
+
+    positions = {}
+    for tx in PortfolioTransaction.objects.iterator(chunk_size=2000):
+        fee = tx.fee or Decimal(0)
+        amount, total_spent = positions.get((tx.user_id, tx.coin_id), (Decimal(0), Decimal(0)))
+        if tx.type == 'buy':
+            amount, total_spent = amount + tx.amount, total_spent + tx.amount * tx.price_usd + fee
+        elif tx.type == 'sell':
+            amount, total_spent = amount - tx.amount, total_spent - (tx.amount * tx.price_usd - fee)
+        elif tx.type == 'transfer_in':
+            amount += tx.amount
+        elif tx.type == 'transfer_out':
+            amount -= tx.amount + fee
+        positions[(tx.user_id, tx.coin_id)] = (amount, total_spent)
+
+    PortfolioHolding.objects.bulk_create(
+        [
+            PortfolioHolding(user_id=user_id, coin_id=coin_id, amount=amount, total_spent=total_spent)
+            for (user_id, coin_id), (amount, total_spent) in positions.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_favoritecoin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioHolding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coin_id', models.CharField(max_length=100)),
+                ('amount', models.DecimalField(decimal_places=8, default=0, max_digits=30)),
+                ('total_spent', models.DecimalField(decimal_places=16, default=0, max_digits=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'coin_id')},
+            },
+        ),
+        migrations.RunPython(backfill_holdings, migrations.RunPython.noop),
+    ]
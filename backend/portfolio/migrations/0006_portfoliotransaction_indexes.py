@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_portfolioholding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='portfoliotransaction',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='portfolio_tx_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='portfoliotransaction',
+            index=models.Index(fields=['user', 'coin_id', '-timestamp'], name='portfolio_tx_user_coin_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_portfoliotransaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coin_id', models.CharField(max_length=100)),
+                ('interval_type', models.CharField(max_length=10)),
+                ('chart_type', models.CharField(choices=[('line', 'Line'), ('candlestick', 'Candlestick')], max_length=11)),
+                ('timestamp', models.BigIntegerField()),
+                ('price', models.FloatField(blank=True, null=True)),
+                ('open', models.FloatField(blank=True, null=True)),
+                ('high', models.FloatField(blank=True, null=True)),
+                ('low', models.FloatField(blank=True, null=True)),
+                ('close', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('coin_id', 'interval_type', 'chart_type', 'timestamp')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_pricealert'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfoliotransaction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class PortfolioTransaction(models.Model):
     TRANSACTION_TYPES = (
@@ -15,12 +16,35 @@ class PortfolioTransaction(models.Model):
     price_usd = models.DecimalField(max_digits=20, decimal_places=8)  # purchase price
     fee = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
     type = models.CharField(max_length=13, choices=TRANSACTION_TYPES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Defaults to the time of recording; imports keep the original trade time
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # History is read newest first per user, optionally narrowed to one coin
+            models.Index(fields=["user", "-timestamp", "-id"], name="portfolio_tx_user_time_idx"),
+            models.Index(fields=["user", "coin_id", "-timestamp"], name="portfolio_tx_user_coin_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.type} {self.amount} {self.coin_id}"
 
 
+class PortfolioHolding(models.Model):
+    # Running position per coin, kept in step with PortfolioTransaction inserts (see portfolio.holdings)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    coin_id = models.CharField(max_length=100)
+    amount = models.DecimalField(max_digits=30, decimal_places=8, default=0)
+    total_spent = models.DecimalField(max_digits=40, decimal_places=16, default=0)  # amount * price_usd keeps 16 places
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "coin_id")
+
+    def __str__(self):
+        return f"{self.user.username} - {self.amount} {self.coin_id}"
+
+
 class FavoriteCoin(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     coin_id = models.CharField(max_length=100)
@@ -32,3 +56,53 @@ class FavoriteCoin(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.coin_id}"
 
+
+class ChartPoint(models.Model):
+    # Local copy of CoinGecko chart series, extended by fetching only the missing tail (see portfolio.timeseries)
+    CHART_TYPES = (
+        ("line", "Line"),
+        ("candlestick", "Candlestick"),
+    )
+
+    coin_id = models.CharField(max_length=100)
+    interval_type = models.CharField(max_length=10)  # "5min", "hourly" or "daily"
+    chart_type = models.CharField(max_length=11, choices=CHART_TYPES)
+    timestamp = models.BigIntegerField()  # ms since epoch, as CoinGecko returns it
+    price = models.FloatField(null=True, blank=True)
+    open = models.FloatField(null=True, blank=True)
+    high = models.FloatField(null=True, blank=True)
+    low = models.FloatField(null=True, blank=True)
+    close = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("coin_id", "interval_type", "chart_type", "timestamp")
+
+    def __str__(self):
+        return f"{self.coin_id} {self.interval_type} {self.chart_type} @ {self.timestamp}"
+
+
+class PriceAlert(models.Model):
+    # Fires once when the USD price reaches price_usd from its side (see portfolio.alerts)
+    DIRECTIONS = (
+        ("above", "Above"),
+        ("below", "Below"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    coin_id = models.CharField(max_length=100)
+    price_usd = models.DecimalField(max_digits=20, decimal_places=8)
+    direction = models.CharField(max_length=5, choices=DIRECTIONS)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_price_usd = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="portfolio_alert_user_idx"),
+            # The alert engine loads active alerts newer than the last one it has seen
+            models.Index(fields=["id"], condition=models.Q(is_active=True), name="portfolio_alert_active_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.coin_id} {self.direction} {self.price_usd}"
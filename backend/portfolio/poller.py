@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from . import coingecko
+from .alerts import AlertEngine
+from .caching import astore, astore_many, is_error
+from .markets import MARKETS_CACHE_KEY, MARKETS_FAMILY, extend_snapshot, page_params, snapshot_pages
+from .models import PortfolioHolding, FavoriteCoin
+from .prices import PRICE_FAMILY, batch_ids, price_cache_key, price_params
+from .ratelimit import BACKGROUND
+
+
+class MarketDataPoller:
+    """Keeps the market, detail and price cache keys warm so user requests never wait on CoinGecko.
+
+    Every price batch it fetches is also checked against the price alerts.
+    Calls are spaced to stay inside ``calls_per_minute``; a cycle that needs more calls
+    than the budget allows simply takes longer.
+    """
+
+    def __init__(self, top_n=None, calls_per_minute=None, interval=None):
+        self.top_n = top_n or settings.POLLER_TOP_N
+        self.calls_per_minute = calls_per_minute or settings.POLLER_CALLS_PER_MINUTE
+        self.interval = interval or settings.POLLER_INTERVAL
+        self.next_call_at = 0.0
+        self.alerts = AlertEngine()
+
+    async def call(self, path, params=None):
+        # Space calls evenly across the minute instead of bursting through the budget
+        loop = asyncio.get_running_loop()
+        delay = self.next_call_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.next_call_at = max(loop.time(), self.next_call_at) + 60 / self.calls_per_minute
+
+        try:
+            # Background priority leaves part of the shared quota to user-facing requests
+            response = await coingecko.aget(path, params=params, priority=BACKGROUND)
+        except httpx.RequestError as e:
+            logging.warning(f"Poller request to {path} failed: {str(e)}")
+            return None
+        if response.status_code != 200:
+            logging.warning(f"Poller request to {path} returned {response.status_code}")
+            return None
+        return response.json()
+
+    async def poll_markets(self):
+        # The whole market snapshot the list endpoint sorts and pages through, refreshed in bulk
+        coins = []
+        for page in snapshot_pages():
+            data = await self.call("/coins/markets", page_params(page))
+            coins, done = extend_snapshot(coins, {"error": "Request failed"} if data is None else data, page)
+            if done:
+                break
+        if is_error(coins):
+            return []
+
+        await astore(MARKETS_CACHE_KEY, coins, MARKETS_FAMILY)
+        return [coin["id"] for coin in coins[:self.top_n]]
+
+    async def tracked_coin_ids(self):
+        # Holdings have a row for every (user, coin) in the ledger, a far smaller table to scan
+        held = [coin_id async for coin_id in PortfolioHolding.objects.values_list("coin_id", flat=True).distinct()]
+        favorites = [coin_id async for coin_id in FavoriteCoin.objects.values_list("coin_id", flat=True).distinct()]
+        # Coins with active alerts come from the in-memory alert book, not a scan of the alerts table
+        alerted = await sync_to_async(self.alerts.coin_ids)()
+        return sorted(set(held) | set(favorites) | set(alerted))
+
+    async def poll_details(self, coin_ids):
+        for coin_id in coin_ids:
+            data = await self.call(f"/coins/{coin_id}")
+            if data is not None:
+                await astore(f"crypto_detail_{coin_id}", data, "crypto_detail")
+
+    async def poll_prices(self, coin_ids):
+        # Prices are cached per coin, so one batched fetch covers every portfolio holding them
+        for batch in batch_ids(coin_ids):
+            data = await self.call("/simple/price", price_params(batch))
+            if data is not None:
+                await astore_many({price_cache_key(coin_id): data[coin_id] for coin_id in batch if coin_id in data}, PRICE_FAMILY)
+                await self.check_alerts({coin_id: data[coin_id].get("usd") for coin_id in batch if coin_id in data})
+
+    async def check_alerts(self, prices):
+        try:
+            await self.alerts.process(prices)
+        except Exception as e:
+            # Alerts are retried on the next batch; the price cache must keep being refreshed
+            logging.error(f"Price alert evaluation failed: {str(e)}")
+
+    async def poll_once(self):
+        started = time.monotonic()
+        top_ids = await self.poll_markets()
+        tracked = await self.tracked_coin_ids()
+
+        await self.poll_prices(tracked)
+        await self.poll_details(sorted(set(top_ids) | set(tracked)))
+        logging.info(f"Market data poll finished in {time.monotonic() - started:.1f} s")
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logging.error(f"Market data poll failed: {str(e)}")
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,147 @@
+import logging
+from urllib.parse import quote
+import httpx
+from django.core.cache import cache
+from . import coingecko
+from .caching import astore_many, is_error, refresh_stats, run_in_background, store_many, unwrap
+from .ratelimit import INTERACTIVE
+
+PRICE_FAMILY = "coingecko_prices"
+# Longest URL encoded ids value per /simple/price call, well inside common 8 kB URL limits
+MAX_IDS_LENGTH = 4000
+# The commas between ids go out as %2C
+SEPARATOR_LENGTH = len(quote(","))
+
+
+def price_cache_key(coin_id):
+    # One key per coin, so every portfolio holding a coin shares its cached price
+    return f"{PRICE_FAMILY}_{coin_id}"
+
+
+def batch_ids(coin_ids, max_length=MAX_IDS_LENGTH):
+    """Split ids into as few comma separated groups as fit in ``max_length`` URL encoded characters each."""
+    batches, batch, length = [], [], 0
+    for coin_id in coin_ids:
+        encoded = len(quote(coin_id, safe=""))
+        added = encoded + (SEPARATOR_LENGTH if batch else 0)
+        if batch and length + added > max_length:
+            batches.append(batch)
+            batch, length = [], 0
+            added = encoded
+        batch.append(coin_id)
+        length += added
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def price_params(coin_ids):
+    return {"ids": ",".join(coin_ids), "vs_currencies": "usd"}
+
+
+def _parse(response, coin_ids):
+    if response.status_code != 200:
+        return {"error": "Failed to fetch data from CoinGecko"}
+    data = response.json()
+    # Ids CoinGecko does not know are simply absent from the response
+    return {coin_id: data[coin_id] for coin_id in coin_ids if coin_id in data}
+
+
+def fetch_prices(coin_ids, priority=INTERACTIVE):
+    try:
+        return _parse(coingecko.get("/simple/price", params=price_params(coin_ids), priority=priority), coin_ids)
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+
+
+async def afetch_prices(coin_ids, priority=INTERACTIVE):
+    try:
+        return _parse(await coingecko.aget("/simple/price", params=price_params(coin_ids), priority=priority), coin_ids)
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+
+
+def split_cached(coin_ids, cached):
+    """(prices, stale ids, missing ids) from a get_many result keyed by price_cache_key."""
+    prices, stale, missing = {}, [], []
+    for coin_id in coin_ids:
+        entry = cached.get(price_cache_key(coin_id))
+        if entry is None:
+            missing.append(coin_id)
+            refresh_stats.record(PRICE_FAMILY, "misses")
+            continue
+        prices[coin_id], is_stale = unwrap(entry)
+        if is_stale:
+            stale.append(coin_id)
+        refresh_stats.record(PRICE_FAMILY, "stale_hits" if is_stale else "fresh_hits")
+    return prices, stale, missing
+
+
+def refresh_prices(coin_ids, priority=INTERACTIVE):
+    prices = {}
+    for batch in batch_ids(coin_ids):
+        data = fetch_prices(batch, priority)
+        if is_error(data):
+            refresh_stats.record(PRICE_FAMILY, "refresh_errors")
+            logging.error(f"Price fetch for {len(batch)} coins failed: {data['error']}")
+            continue
+        store_many({price_cache_key(coin_id): price for coin_id, price in data.items()}, PRICE_FAMILY)
+        refresh_stats.record(PRICE_FAMILY, "refreshes")
+        prices.update(data)
+    return prices
+
+
+async def arefresh_prices(coin_ids, priority=INTERACTIVE):
+    prices = {}
+    for batch in batch_ids(coin_ids):
+        data = await afetch_prices(batch, priority)
+        if is_error(data):
+            refresh_stats.record(PRICE_FAMILY, "refresh_errors")
+            logging.error(f"Price fetch for {len(batch)} coins failed: {data['error']}")
+            continue
+        await astore_many({price_cache_key(coin_id): price for coin_id, price in data.items()}, PRICE_FAMILY)
+        refresh_stats.record(PRICE_FAMILY, "refreshes")
+        prices.update(data)
+    return prices
+
+
+def _ride_along(missing, stale):
+    """Fold stale ids into the missing-id fetch when that costs no extra call."""
+    if missing and len(batch_ids(missing + stale)) == len(batch_ids(missing)):
+        return missing + stale, []
+    return missing, stale
+
+
+def _refresh_in_background(stale):
+    run_in_background(f"{PRICE_FAMILY}:{','.join(sorted(stale))}", refresh_prices, stale)
+
+
+def get_prices(coin_ids):
+    """USD prices keyed by coin id, e.g. {"bitcoin": {"usd": 65000}}.
+
+    Reads every coin with one get_many and fetches only the missing ones. Stale prices are
+    served as they are and refreshed in the background. Coins whose fetch failed are absent.
+    """
+    coin_ids = list(coin_ids)
+    cached = cache.get_many([price_cache_key(coin_id) for coin_id in coin_ids])
+    prices, stale, missing = split_cached(coin_ids, cached)
+
+    fetch, stale = _ride_along(missing, stale)
+    if fetch:
+        prices.update(refresh_prices(fetch))
+    if stale:
+        _refresh_in_background(stale)
+    return prices
+
+
+async def aget_prices(coin_ids):
+    coin_ids = list(coin_ids)
+    cached = await cache.aget_many([price_cache_key(coin_id) for coin_id in coin_ids])
+    prices, stale, missing = split_cached(coin_ids, cached)
+
+    fetch, stale = _ride_along(missing, stale)
+    if fetch:
+        prices.update(await arefresh_prices(fetch))
+    if stale:
+        _refresh_in_background(stale)
+    return prices
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Priority classes: user-blocking requests may drain the bucket, background prefetch
+# (the poller) leaves settings.COINGECKO_RATE_LIMIT_RESERVE tokens for them
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+BUCKET_KEY = "coingecko:ratelimit:bucket"
+# Set after a 429 so every worker pauses until CoinGecko's Retry-After has passed
+BLOCKED_UNTIL_KEY = "coingecko_ratelimit_blocked_until"
+
+# Refill, then take one token if more than `reserve` would remain. Runs atomically in Redis
+# and uses the Redis clock, so every worker in the cluster draws from one quota.
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 + reserve then
+    tokens = tokens - 1
+else
+    wait = (1 + reserve - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return {tostring(wait), tostring(tokens)}
+"""
+
+
+class RateLimited(httpx.RequestError):
+    """No CoinGecko quota became available within the caller's wait budget."""
+
+
+def retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Retry-After if CoinGecko sent one, else exponential backoff, plus full jitter so workers spread out."""
+    base = settings.COINGECKO_BACKOFF_BASE * 2 ** attempt
+    delay = retry_after if retry_after is not None else base
+    return delay + random.uniform(0, base)
+
+
+class TokenBucket:
+    """Cluster-wide token bucket in Redis; falls back to a process-local bucket on other cache backends."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = None
+        self.updated = None
+        self.script = None
+
+    def rate(self):
+        return settings.COINGECKO_RATE_LIMIT_PER_MINUTE / 60
+
+    def capacity(self):
+        return settings.COINGECKO_RATE_LIMIT_BURST
+
+    def redis(self):
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection("default")
+        except (ImportError, NotImplementedError):
+            return None
+
+    def take(self, reserve=0):
+        """Take one token; returns (seconds to wait before trying again or 0 if granted, tokens left)."""
+        connection = self.redis()
+        if connection is None:
+            return self._take_local(reserve)
+        if self.script is None:
+            self.script = connection.register_script(TAKE_TOKEN_SCRIPT)
+        wait, tokens = self.script(keys=[BUCKET_KEY], args=[self.rate(), self.capacity(), reserve])
+        return float(wait), float(tokens)
+
+    def _take_local(self, reserve):
+        with self.lock:
+            now = time.monotonic()
+            if self.tokens is None:
+                self.tokens, self.updated = self.capacity(), now
+            self.tokens = min(self.capacity(), self.tokens + (now - self.updated) * self.rate())
+            self.updated = now
+            if self.tokens >= 1 + reserve:
+                self.tokens -= 1
+                return 0.0, self.tokens
+            return (1 + reserve - self.tokens) / self.rate(), self.tokens
+
+
+class RateLimitStats:
+    """Per priority counters on quota use and queueing, served by the upstream stats endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.priorities = {}
+        self.tokens_left = None
+
+    def _stats(self, priority):
+        return self.priorities.setdefault(priority, {
+            "acquired": 0, "rejected": 0, "waited": 0, "waiting": 0,
+            "wait_ms_total": 0.0, "wait_ms_max": 0.0, "throttled": 0, "retries": 0,
+        })
+
+    def record(self, priority, event, amount=1):
+        with self.lock:
+            self._stats(priority)[event] += amount
+
+    def record_wait(self, priority, duration):
+        with self.lock:
+            stats = self._stats(priority)
+            ms = duration * 1000
+            stats["waited"] += 1
+            stats["wait_ms_total"] += ms
+            stats["wait_ms_max"] = max(stats["wait_ms_max"], ms)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "limit_per_minute": settings.COINGECKO_RATE_LIMIT_PER_MINUTE,
+                "burst": settings.COINGECKO_RATE_LIMIT_BURST,
+                "background_reserve": settings.COINGECKO_RATE_LIMIT_RESERVE,
+                "tokens_left": self.tokens_left,
+                "priorities": {
+                    priority: dict(stats, wait_ms_avg=stats["wait_ms_total"] / stats["waited"] if stats["waited"] else None)
+                    for priority, stats in self.priorities.items()
+                },
+            }
+
+
+class RateLimiter:
+    def __init__(self):
+        self.bucket = TokenBucket()
+        self.stats = RateLimitStats()
+
+    def reserve(self, priority):
+        return settings.COINGECKO_RATE_LIMIT_RESERVE if priority == BACKGROUND else 0
+
+    def max_wait(self, priority):
+        # Background prefetch has nobody waiting on it and can queue for as long as it takes
+        return None if priority == BACKGROUND else settings.COINGECKO_RATE_LIMIT_MAX_WAIT
+
+    def _next_wait(self, priority, blocked_until):
+        if blocked_until and blocked_until > time.time():
+            # Small jitter so paused workers do not all fire the moment the block lifts
+            return blocked_until - time.time() + random.uniform(0, settings.COINGECKO_BACKOFF_BASE)
+        wait, tokens = self.bucket.take(self.reserve(priority))
+        self.stats.tokens_left = tokens
+        return wait
+
+    def _check_budget(self, priority, started, wait):
+        max_wait = self.max_wait(priority)
+        if max_wait is not None and time.monotonic() - started + wait > max_wait:
+            self.stats.record(priority, "rejected")
+            raise RateLimited(f"CoinGecko rate limit: no quota within {max_wait} s")
+
+    def acquire(self, priority=INTERACTIVE):
+        started = time.monotonic()
+        self.stats.record(priority, "waiting")
+        try:
+            while True:
+                wait = self._next_wait(priority, cache.get(BLOCKED_UNTIL_KEY))
+                if not wait:
+                    break
+                self._check_budget(priority, started, wait)
+                time.sleep(wait)
+        finally:
+            self.stats.record(priority, "waiting", -1)
+        self._granted(priority, started)
+
+    async def aacquire(self, priority=INTERACTIVE):
+        started = time.monotonic()
+        self.stats.record(priority, "waiting")
+        try:
+            while True:
+                blocked_until = await cache.aget(BLOCKED_UNTIL_KEY)
+                wait = await sync_to_async(self._next_wait, thread_sensitive=False)(priority, blocked_until)
+                if not wait:
+                    break
+                self._check_budget(priority, started, wait)
+                await asyncio.sleep(wait)
+        finally:
+            self.stats.record(priority, "waiting", -1)
+        self._granted(priority, started)
+
+    def _granted(self, priority, started):
+        self.stats.record(priority, "acquired")
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.stats.record_wait(priority, waited)
+
+    def _throttled(self, priority, response, attempt):
+        retry_after = retry_after_seconds(response)
+        delay = backoff_delay(attempt, retry_after)
+        self.stats.record(priority, "throttled")
+        logging.warning(f"CoinGecko returned 429, pausing upstream calls for {delay:.1f} s")
+        return time.time() + delay, delay
+
+    def throttled(self, priority, response, attempt):
+        """Block the whole cluster until the backoff has passed."""
+        until, delay = self._throttled(priority, response, attempt)
+        cache.set(BLOCKED_UNTIL_KEY, until, timeout=int(delay) + 1)
+
+    async def athrottled(self, priority, response, attempt):
+        until, delay = self._throttled(priority, response, attempt)
+        await cache.aset(BLOCKED_UNTIL_KEY, until, timeout=int(delay) + 1)
+
+
+limiter = RateLimiter()
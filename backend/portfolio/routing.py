@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/crypto/(?P<slug>\w+)/$', consumers.CryptoConsumer.as_asgi()),
+    re_path(r'ws/alerts/$', consumers.AlertConsumer.as_asgi()),
 ]
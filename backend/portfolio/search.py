@@ -0,0 +1,232 @@
+import re
+import time
+from bisect import bisect_left, bisect_right
+import httpx
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from . import coingecko
+from .caching import aentry_version, aget_or_fetch, entry_version, get_or_fetch, is_error
+from .markets import MARKETS_CACHE_KEY, aget_market_snapshot, get_market_snapshot
+
+COIN_LIST_KEY = "coin_list"
+COIN_LIST_FAMILY = "coin_list"
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Queries shorter than this only match prefixes; a trigram needs three characters
+MIN_SUBSTRING_LENGTH = 3
+# Matches up to this many are ranked by sorting, larger ones through a bitmap over all coins
+SMALL_RANGE = 256
+
+re_word_separator = re.compile(r"[\s\-_.]+")
+
+
+def normalize(text):
+    return (text or "").strip().casefold()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fetch_coin_list():
+    try:
+        response = coingecko.get("/coins/list")
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+    if response.status_code != 200:
+        return {"error": "Failed to fetch data from CoinGecko"}
+    return response.json()
+
+
+async def afetch_coin_list():
+    try:
+        response = await coingecko.aget("/coins/list")
+    except httpx.RequestError as e:
+        return {"error": f"Request failed: {str(e)}"}
+    if response.status_code != 200:
+        return {"error": "Failed to fetch data from CoinGecko"}
+    return response.json()
+
+
+def market_cap_ranks(snapshot):
+    if is_error(snapshot):
+        return {}
+    return {coin["id"]: coin["market_cap_rank"] for coin in snapshot if coin.get("market_cap_rank")}
+
+
+class CoinSearchIndex:
+    """Prefix and trigram index over coin ids, symbols and names.
+
+    Coins are numbered in market cap order, so every posting list sorted by number is
+    already ranked, and the best matches are simply the smallest numbers.
+    """
+
+    def __init__(self, coins, ranks=None):
+        ranks = ranks or {}
+        coins = sorted(coins, key=lambda coin: (ranks.get(coin["id"], float("inf")), coin["id"]))
+        self.ids = [coin["id"] for coin in coins]
+        self.symbols = [coin.get("symbol") or "" for coin in coins]
+        self.names = [coin.get("name") or "" for coin in coins]
+        self.ranks = [ranks.get(coin_id) for coin_id in self.ids]
+
+        # Whole id/symbol/name for exact hits, plus every word of the id and name for prefixes
+        exact, prefixes, postings = [], [], {}
+        self.texts = []
+        for position, (coin_id, symbol, name) in enumerate(zip(self.ids, self.symbols, self.names)):
+            fields = {normalize(coin_id), normalize(symbol), normalize(name)} - {""}
+            exact.extend((field, position) for field in fields)
+            words = fields | set(re_word_separator.split(normalize(coin_id))) | set(re_word_separator.split(normalize(name)))
+            prefixes.extend((word, position) for word in words if word)
+
+            text = "\x00".join(sorted(fields))
+            self.texts.append(text)
+            for trigram in trigrams(text):
+                postings.setdefault(trigram, []).append(position)
+
+        self.exact_terms, self.exact_positions = self._sorted_terms(exact)
+        self.prefix_terms, self.prefix_positions = self._sorted_terms(prefixes)
+        self.postings = {trigram: np.array(positions, dtype=np.int32) for trigram, positions in postings.items()}
+
+    @staticmethod
+    def _sorted_terms(pairs):
+        pairs.sort()
+        return [term for term, _ in pairs], np.array([position for _, position in pairs], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _best(self, positions):
+        """Distinct positions in rank order."""
+        if len(positions) <= SMALL_RANGE:
+            return np.unique(positions)
+        # Short prefixes hit thousands of terms; marking a bitmap is linear where sorting is not
+        seen = np.zeros(len(self.ids), dtype=bool)
+        seen[positions] = True
+        return np.flatnonzero(seen)
+
+    def _exact(self, query):
+        lo, hi = bisect_left(self.exact_terms, query), bisect_right(self.exact_terms, query)
+        return self._best(self.exact_positions[lo:hi])
+
+    def _prefix(self, query):
+        lo = bisect_left(self.prefix_terms, query)
+        hi = bisect_left(self.prefix_terms, query + "\U0010ffff")
+        return self._best(self.prefix_positions[lo:hi])
+
+    def _substring(self, query, limit):
+        lists = [self.postings.get(trigram) for trigram in trigrams(query)]
+        if any(postings is None for postings in lists):
+            return []
+        # Narrow the shortest list by the others; the candidates share every trigram but may not be contiguous
+        lists.sort(key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            member = np.zeros(len(self.ids), dtype=bool)
+            member[postings] = True
+            candidates = candidates[member[candidates]]
+        matches = []
+        # Candidates are in rank order, so verifying stops as soon as the page is full
+        for start in range(0, len(candidates), SMALL_RANGE):
+            for position in candidates[start:start + SMALL_RANGE].tolist():
+                if query in self.texts[position]:
+                    matches.append(position)
+                    if len(matches) >= limit:
+                        return matches
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Exact matches, then prefix matches, then substring matches, each in market cap order."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        positions = dict.fromkeys(self._exact(query)[:limit].tolist())
+        if len(positions) < limit:
+            positions.update(dict.fromkeys(self._prefix(query)[:limit].tolist()))
+        if len(positions) < limit and len(query) >= MIN_SUBSTRING_LENGTH:
+            positions.update(dict.fromkeys(self._substring(query, limit)))
+
+        return [
+            {"id": self.ids[i], "symbol": self.symbols[i], "name": self.names[i], "market_cap_rank": self.ranks[i]}
+            for i in list(positions)[:limit]
+        ]
+
+
+# (checked at, (coin list version, snapshot version), index). Within LOCAL_CACHE_TTL a search touches
+# neither Redis nor the database; after it the versions are rechecked and the index rebuilt only if they moved.
+_index = None
+
+
+def _fresh_index():
+    current = _index
+    if current is not None and time.monotonic() - current[0] < settings.LOCAL_CACHE_TTL:
+        return current[2]
+    return None
+
+
+def _reuse(versions):
+    global _index
+    current = _index
+    # Without a coin list version there is nothing to tell an old list from a new one
+    if current is not None and current[1] == versions and versions[0] is not None:
+        _index = (time.monotonic(), versions, current[2])
+        return current[2]
+    return None
+
+
+def _install(versions, index):
+    global _index
+    _index = (time.monotonic(), versions, index)
+    return index
+
+
+def get_search_index():
+    """The current CoinSearchIndex, or an error dict if the coin list cannot be loaded."""
+    index = _fresh_index()
+    if index is not None:
+        return index
+
+    # Versions are read before the values, so a refresh in between costs a rebuild, never a missed one
+    versions = (entry_version(COIN_LIST_KEY), entry_version(MARKETS_CACHE_KEY))
+    coins = get_or_fetch(COIN_LIST_KEY, fetch_coin_list, family=COIN_LIST_FAMILY)
+    snapshot = get_market_snapshot()
+    if is_error(coins):
+        # An index built from an older list beats no search at all
+        return _index[2] if _index is not None else coins
+    if versions[0] is None:
+        # Cold start: the list was only just stored, by this fetch or a concurrent one
+        versions = (entry_version(COIN_LIST_KEY), versions[1])
+
+    return _reuse(versions) or _install(versions, CoinSearchIndex(coins, market_cap_ranks(snapshot)))
+
+
+async def aget_search_index():
+    index = _fresh_index()
+    if index is not None:
+        return index
+
+    versions = (await aentry_version(COIN_LIST_KEY), await aentry_version(MARKETS_CACHE_KEY))
+    coins = await aget_or_fetch(COIN_LIST_KEY, afetch_coin_list, family=COIN_LIST_FAMILY)
+    snapshot = await aget_market_snapshot()
+    if is_error(coins):
+        return _index[2] if _index is not None else coins
+    if versions[0] is None:
+        versions = (await aentry_version(COIN_LIST_KEY), versions[1])
+
+    index = _reuse(versions)
+    if index is None:
+        # Building takes a while for the full coin list; keep it off the event loop
+        index = await sync_to_async(CoinSearchIndex, thread_sensitive=False)(coins, market_cap_ranks(snapshot))
+        _install(versions, index)
+    return index
+
+
+def parse_search_query(params):
+    query = normalize(params.get("q"))
+    if not query:
+        raise ValueError("q is required")
+    limit = int(params.get("limit") or DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return query, limit
@@ -1,5 +1,6 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import PortfolioTransaction, FavoriteCoin
+from .models import PortfolioTransaction, FavoriteCoin, PriceAlert
 
 
 class PortfolioTransactionSerializer(serializers.ModelSerializer):
@@ -8,8 +9,34 @@ class PortfolioTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PortfolioTransaction
         fields = ['id', 'coin_id', 'amount', 'price_usd', 'fee', 'type', 'timestamp']
+        read_only_fields = ['timestamp']
+
+
+class PortfolioTransactionImportSerializer(PortfolioTransactionSerializer):
+    """Imported rows may carry the time of the original trade."""
+    timestamp = serializers.DateTimeField(required=False)
+
+    class Meta(PortfolioTransactionSerializer.Meta):
+        read_only_fields = []
+
+    def validate_timestamp(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("timestamp must not be in the future")
+        return value
 
 class FavoriteCoinSerializer(serializers.ModelSerializer):
     class Meta:
         model = FavoriteCoin
         fields = ["id", "coin_id", "added_at"]
+
+
+class PriceAlertSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceAlert
+        fields = ["id", "coin_id", "price_usd", "direction", "is_active", "created_at", "triggered_at", "triggered_price_usd"]
+        read_only_fields = ["is_active", "created_at", "triggered_at", "triggered_price_usd"]
+
+    def validate_price_usd(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("price_usd must be positive")
+        return value
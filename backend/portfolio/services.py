@@ -1,83 +1,101 @@
-import json
-import httpx
-from django.core.cache import cache
 import logging
+from .caching import aget_or_fetch, get_or_fetch, is_error
+from .downsampling import downsample
+from .encoding import dumps_columns, loads_points
+from .timeseries import aload_series, load_series
 
 logging.basicConfig(level=logging.INFO)
 
-async def getChartDataAsync(slug, interval_type="daily", chart_type="line"):
-    cache_key = f"chart_data_{slug}_{interval_type}_{chart_type}"
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        logging.info(f"Cache hit for {cache_key}")
-        return json.loads(cached_data)
-
-    logging.info(f"Cache miss for {cache_key}, fetching new data.")
-
-    interval_days_map = {
-        "5min": 1,
-        "hourly": 30,
-        "daily": 365
-    }
-
-    days = interval_days_map.get(interval_type, 30)
-
-    if chart_type == "candlestick":
-        url = f"https://api.coingecko.com/api/v3/coins/{slug}/ohlc"
-        params = {
-            "vs_currency": "usd",
-            "days": days
-        }
-    else:
-        url = f"https://api.coingecko.com/api/v3/coins/{slug}/market_chart"
-        params = {
-            "vs_currency": "usd",
-            "days": days
-        }
 
+def chart_cache_key(slug, interval_type, chart_type):
+    return f"chart_data_{slug}_{interval_type}_{chart_type}"
+
+
+def downsampled_cache_key(slug, interval_type, chart_type, max_points, chart_data):
+    # Keyed by the series' last timestamp too, so a resolution is computed once per series version
+    last = chart_data[-1]["timestamp"]
+    return f"chart_data_{slug}_{interval_type}_{chart_type}_{max_points}_{last}"
+
+
+def getChartData(slug, interval_type="daily", chart_type="line", max_points=None):
+    """Sync counterpart of getChartDataAsync for WSGI views, on the pooled sync client."""
+    if max_points:
+        return getDownsampledChartData(slug, interval_type, chart_type, max_points)
+
+    cached_data = get_or_fetch(
+        chart_cache_key(slug, interval_type, chart_type),
+        lambda: fetchChartData(slug, interval_type, chart_type),
+        family=f"chart_data_{interval_type}",
+    )
+
+    if is_error(cached_data):
+        return cached_data
+    return loads_points(cached_data)
+
+
+async def getChartDataAsync(slug, interval_type="daily", chart_type="line", max_points=None):
+    if max_points:
+        return await getDownsampledChartDataAsync(slug, interval_type, chart_type, max_points)
+
+    # Concurrent misses on the same key share one upstream call; TTLs per interval come from settings.CACHE_TTLS
+    cached_data = await aget_or_fetch(
+        chart_cache_key(slug, interval_type, chart_type),
+        lambda: fetchChartDataAsync(slug, interval_type, chart_type),
+        family=f"chart_data_{interval_type}",
+    )
+
+    if is_error(cached_data):
+        return cached_data
+    return loads_points(cached_data)
+
+
+def getDownsampledChartData(slug, interval_type, chart_type, max_points):
+    chart_data = getChartData(slug, interval_type, chart_type)
+    if is_error(chart_data) or len(chart_data) <= max_points:
+        return chart_data
+
+    cached_data = get_or_fetch(
+        downsampled_cache_key(slug, interval_type, chart_type, max_points, chart_data),
+        lambda: dumps_columns(downsample(chart_data, chart_type, max_points), chart_type),
+        family=f"chart_data_{interval_type}",
+    )
+    return loads_points(cached_data)
+
+
+async def getDownsampledChartDataAsync(slug, interval_type, chart_type, max_points):
+    chart_data = await getChartDataAsync(slug, interval_type, chart_type)
+    if is_error(chart_data) or len(chart_data) <= max_points:
+        return chart_data
+
+    async def fetch():
+        return dumps_columns(downsample(chart_data, chart_type, max_points), chart_type)
+
+    cache_key = downsampled_cache_key(slug, interval_type, chart_type, max_points, chart_data)
+    cached_data = await aget_or_fetch(cache_key, fetch, family=f"chart_data_{interval_type}")
+    return loads_points(cached_data)
+
+
+def fetchChartData(slug, interval_type="daily", chart_type="line"):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-
-            if chart_type == "candlestick":
-                formatted_data = [
-                    {
-                        "timestamp": item[0],
-                        "open": item[1],
-                        "high": item[2],
-                        "low": item[3],
-                        "close": item[4],
-                    }
-                    for item in data
-                ]
-            else:
-                prices = data.get("prices", [])
-                formatted_data = [{"timestamp": ts, "price": price} for ts, price in prices]
-
-            # Set cache timeout
-            timeout = {
-                "5min": 5 * 60,     # 5 minutes for 5-minute chart
-                "hourly": 60 * 60,       # 1 hour for the time schedule
-                "daily": 24 * 60 * 60       # 1 day for daily schedule
-            }.get(interval_type, 60 * 60)   # Default 1 hour
-
-            print(f"Caching data for {cache_key}: {formatted_data}")
-            cache.set(cache_key, json.dumps(formatted_data), timeout)
-            logging.info("Fetched new data from API and cached it.")
+        formatted_data = load_series(slug, interval_type, chart_type)
+        if is_error(formatted_data):
             return formatted_data
-        else:
-            return {"error": response.json()}
-
-    except httpx.RequestError as e:
-        return {"error": f"Request failed: {str(e)}"}
+        return dumps_columns(formatted_data, chart_type)
 
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
         return {"error": f"An error occurred: {str(e)}"}
 
 
+async def fetchChartDataAsync(slug, interval_type="daily", chart_type="line"):
+    try:
+        # Served from the local ChartPoint store, which only asks CoinGecko for the missing tail
+        formatted_data = await aload_series(slug, interval_type, chart_type)
+        if is_error(formatted_data):
+            return formatted_data
+        # Cached as columns so field names are stored once, not per point
+        return dumps_columns(formatted_data, chart_type)
 
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return {"error": f"An error occurred: {str(e)}"}
@@ -3,4 +3,31 @@ from rest_framework.test import APIClient
 
 @pytest.fixture
 def api_client():
-    return APIClient()
\ No newline at end of file
+    return APIClient()
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    # Never touch the configured Redis cache or channel layer, and start every test empty
+    from django.core.cache import cache
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    yield
+    cache.clear()
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    # The in-process LRU outlives each test's cache backend
+    from portfolio.localcache import local_cache
+    local_cache.clear()
+    yield
+    local_cache.clear()
+
+@pytest.fixture
+def user(db):
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.create_user(username="trader", email="trader@example.com", password="secret123")
+
+@pytest.fixture
+def auth_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
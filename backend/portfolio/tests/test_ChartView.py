@@ -0,0 +1,36 @@
+from unittest.mock import patch
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from conftest import api_client
+
+CHART_DATA = [{"timestamp": 1, "price": 1.0}, {"timestamp": 2, "price": 2.0}]
+
+
+@pytest.mark.django_db
+class TestChartView:
+    @patch("portfolio.views.getChartData")
+    def test_downsampled_chart(self, mock_chart, api_client):
+        mock_chart.return_value = CHART_DATA
+
+        response = api_client.get(reverse("crypto-chart", args=["bitcoin"]) + "?interval_type=hourly&width=300")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["chart_data"] == CHART_DATA
+        mock_chart.assert_called_once_with("bitcoin", "hourly", "line", 300)
+
+    @patch("portfolio.views.getChartData")
+    def test_invalid_params(self, mock_chart, api_client):
+        url = reverse("crypto-chart", args=["bitcoin"])
+
+        assert api_client.get(url + "?interval_type=weekly").status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(url + "?max_points=abc").status_code == status.HTTP_400_BAD_REQUEST
+        mock_chart.assert_not_called()
+
+    @patch("portfolio.views.getChartData")
+    def test_upstream_error(self, mock_chart, api_client):
+        mock_chart.return_value = {"error": "An error occurred: boom"}
+
+        response = api_client.get(reverse("crypto-chart", args=["bitcoin"]))
+
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
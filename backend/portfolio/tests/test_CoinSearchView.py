@@ -0,0 +1,122 @@
+import json
+from unittest.mock import AsyncMock, patch
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from rest_framework import status
+from conftest import api_client
+from portfolio import search
+from portfolio.async_views import AsyncCoinSearchView
+from portfolio.search import CoinSearchIndex
+
+COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "bitcoin-cash", "symbol": "bch", "name": "Bitcoin Cash"},
+    {"id": "wrapped-bitcoin", "symbol": "wbtc", "name": "Wrapped Bitcoin"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "bitbox", "symbol": "bitb", "name": "BitBox"},
+]
+SNAPSHOT = [
+    {"id": "bitcoin", "market_cap_rank": 1},
+    {"id": "ethereum", "market_cap_rank": 2},
+    {"id": "wrapped-bitcoin", "market_cap_rank": 15},
+    {"id": "bitcoin-cash", "market_cap_rank": 20},
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(search, "_index", None)
+
+
+@pytest.fixture
+def search_url():
+    return reverse("coin-search")
+
+
+class TestCoinSearchIndex:
+    def test_ranks_exact_then_prefix_by_market_cap(self):
+        index = CoinSearchIndex(COINS, search.market_cap_ranks(SNAPSHOT))
+
+        assert [coin["id"] for coin in index.search("bit")] == ["bitcoin", "wrapped-bitcoin", "bitcoin-cash", "bitbox"]
+        # Exact symbol first, then the substring hit in wbtc
+        assert [coin["id"] for coin in index.search("BTC")] == ["bitcoin", "wrapped-bitcoin"]
+        assert [coin["id"] for coin in index.search("wbtc")] == ["wrapped-bitcoin"]
+
+    def test_words_and_substrings(self):
+        index = CoinSearchIndex(COINS, search.market_cap_ranks(SNAPSHOT))
+
+        assert [coin["id"] for coin in index.search("cash")] == ["bitcoin-cash"]
+        assert [coin["id"] for coin in index.search("xyz")] == []
+        assert [coin["id"] for coin in index.search("ther")] == ["ethereum"]
+        assert [coin["id"] for coin in index.search("itcoin", limit=2)] == ["bitcoin", "wrapped-bitcoin"]
+
+    def test_unranked_coins_come_last(self):
+        index = CoinSearchIndex(COINS, {})
+
+        assert index.search("bitbox")[0]["market_cap_rank"] is None
+        assert len(index) == len(COINS)
+
+
+@pytest.mark.django_db
+class TestCoinSearchView:
+    @patch("portfolio.search.get_market_snapshot")
+    @patch("portfolio.search.fetch_coin_list")
+    def test_search(self, mock_fetch_coin_list, mock_get_market_snapshot, api_client, search_url):
+        mock_fetch_coin_list.return_value = COINS
+        mock_get_market_snapshot.return_value = SNAPSHOT
+
+        response = api_client.get(search_url, {"q": "bit", "limit": 2})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "query": "bit",
+            "results": [
+                {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "market_cap_rank": 1},
+                {"id": "wrapped-bitcoin", "symbol": "wbtc", "name": "Wrapped Bitcoin", "market_cap_rank": 15},
+            ],
+        }
+
+    @patch("portfolio.search.get_market_snapshot")
+    @patch("portfolio.search.fetch_coin_list")
+    def test_index_built_once_per_coin_list(self, mock_fetch_coin_list, mock_get_market_snapshot, api_client, search_url, settings):
+        mock_fetch_coin_list.return_value = COINS
+        mock_get_market_snapshot.return_value = SNAPSHOT
+
+        with patch("portfolio.search.CoinSearchIndex", wraps=CoinSearchIndex) as mock_index:
+            api_client.get(search_url, {"q": "b"})
+            # Past the recheck interval the cached coin list is unchanged, so the index is kept
+            settings.LOCAL_CACHE_TTL = 0
+            api_client.get(search_url, {"q": "e"})
+
+        assert mock_index.call_count == 1
+        mock_fetch_coin_list.assert_called_once()
+
+    @patch("portfolio.search.get_market_snapshot")
+    @patch("portfolio.search.fetch_coin_list")
+    def test_upstream_error(self, mock_fetch_coin_list, mock_get_market_snapshot, api_client, search_url):
+        mock_fetch_coin_list.return_value = {"error": "Failed to fetch data from CoinGecko"}
+        mock_get_market_snapshot.return_value = SNAPSHOT
+
+        response = api_client.get(search_url, {"q": "bit"})
+
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+
+    @pytest.mark.parametrize("query", [{}, {"q": "  "}, {"q": "bit", "limit": "0"}, {"q": "bit", "limit": "500"}])
+    def test_invalid_query(self, query, api_client, search_url):
+        response = api_client.get(search_url, query)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "error" in response.data
+
+    @patch("portfolio.search.aget_market_snapshot", new_callable=AsyncMock)
+    @patch("portfolio.search.afetch_coin_list", new_callable=AsyncMock)
+    def test_async_search(self, mock_fetch_coin_list, mock_get_market_snapshot):
+        mock_fetch_coin_list.return_value = COINS
+        mock_get_market_snapshot.return_value = SNAPSHOT
+
+        response = async_to_sync(AsyncCoinSearchView.as_view())(AsyncRequestFactory().get("/search/?q=eth"))
+
+        assert response.status_code == 200
+        assert [coin["id"] for coin in json.loads(response.content)["results"]] == ["ethereum"]
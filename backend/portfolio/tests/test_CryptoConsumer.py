@@ -0,0 +1,273 @@
+import asyncio
+import json
+from unittest.mock import patch, AsyncMock
+import pytest
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from channels.routing import URLRouter
+from django.core.cache import cache
+from portfolio import broadcast
+from portfolio.encoding import unpack_binary
+from portfolio.routing import websocket_urlpatterns
+
+
+CHART_DATA = [{"timestamp": 1687500000000, "price": 28350.21}]
+
+
+def connect(slug="bitcoin"):
+    return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/crypto/{slug}/")
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCryptoConsumer:
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_connect_sends_snapshot(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicator = connect()
+            connected, _ = await communicator.connect()
+            assert connected
+
+            message = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(scenario)()
+
+        assert message["chart_data"] == CHART_DATA
+        assert message["interval_type"] == "daily"
+        mock_chart.assert_awaited_once_with("bitcoin", "daily", "line", None)
+
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_viewers_share_one_producer(self, mock_chart, mock_producer_chart):
+        mock_chart.return_value = CHART_DATA
+        mock_producer_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicators = [connect() for _ in range(3)]
+            for communicator in communicators:
+                await communicator.connect()
+                await communicator.receive_from()
+
+            assert len(broadcast._producers) == 1
+            producer = broadcast._producers[("bitcoin", "daily", "line")]
+            assert producer.subscribers == 3
+
+            mock_producer_chart.reset_mock()
+            await producer.publish()
+            messages = [json.loads(await communicator.receive_from()) for communicator in communicators]
+
+            for communicator in communicators:
+                await communicator.disconnect()
+            return messages
+
+        messages = async_to_sync(scenario)()
+
+        assert all(message["chart_data"] == CHART_DATA for message in messages)
+        mock_producer_chart.assert_awaited_once()
+        assert broadcast._producers == {}
+
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_delta_mode_receives_changes_only(self, mock_chart, mock_producer_chart):
+        before = [{"timestamp": 1, "price": 1.0}, {"timestamp": 2, "price": 2.0}, {"timestamp": 3, "price": 3.0}]
+        after = [{"timestamp": 2, "price": 2.0}, {"timestamp": 3, "price": 3.5}, {"timestamp": 4, "price": 4.0}]
+        mock_chart.return_value = before
+        mock_producer_chart.return_value = before
+
+        async def scenario():
+            full, delta = connect(), connect()
+            for communicator in (full, delta):
+                await communicator.connect()
+                await communicator.receive_from()
+
+            await delta.send_to(text_data=json.dumps({"interval_type": "daily", "mode": "delta"}))
+            snapshot = json.loads(await delta.receive_from())
+            await delta.receive_from()
+
+            producer = broadcast._producers[("bitcoin", "daily", "line")]
+            producer.previous = before
+            mock_producer_chart.return_value = after
+            await producer.publish()
+
+            messages = json.loads(await full.receive_from()), json.loads(await delta.receive_from())
+            for communicator in (full, delta):
+                await communicator.disconnect()
+            return snapshot, messages
+
+        snapshot, (full_message, delta_message) = async_to_sync(scenario)()
+
+        assert snapshot["type"] == "snapshot"
+        assert full_message["type"] == "snapshot"
+        assert full_message["chart_data"] == after
+        assert delta_message["type"] == "delta"
+        assert delta_message["replace_from"] == 3
+        assert delta_message["trim_before"] == 2
+        assert delta_message["chart_data"] == after[1:]
+
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_delta_resume_since(self, mock_chart):
+        mock_chart.return_value = [{"timestamp": 1, "price": 1.0}, {"timestamp": 2, "price": 2.0}]
+
+        async def scenario():
+            communicator = connect()
+            await communicator.connect()
+            await communicator.receive_from()
+
+            await communicator.send_to(text_data=json.dumps({"interval_type": "daily", "mode": "delta", "since": 2}))
+            message = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(scenario)()
+
+        assert message["type"] == "delta"
+        assert message["replace_from"] == 2
+        assert message["chart_data"] == [{"timestamp": 2, "price": 2.0}]
+
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_binary_format(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicator = connect()
+            await communicator.connect()
+            await communicator.receive_from()
+
+            await communicator.send_to(text_data=json.dumps({"interval_type": "daily", "format": "binary"}))
+            frame = await communicator.receive_output()
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+
+        assert unpack_binary(frame["bytes"])["chart_data"] == CHART_DATA
+
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_invalid_interval(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicator = connect()
+            await communicator.connect()
+            await communicator.receive_from()
+
+            await communicator.send_to(text_data=json.dumps({"interval_type": "weekly"}))
+            message = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return message
+
+        assert async_to_sync(scenario)() == {"error": "Invalid interval type or chart type."}
+
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_max_points(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicator = connect()
+            await communicator.connect()
+            await communicator.receive_from()
+
+            await communicator.send_to(text_data=json.dumps({"interval_type": "hourly", "width": 300}))
+            await communicator.receive_from()
+            await communicator.receive_from()
+            await communicator.send_to(text_data=json.dumps({"interval_type": "hourly", "max_points": 1}))
+            message = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(scenario)()
+
+        mock_chart.assert_awaited_with("bitcoin", "hourly", "line", 300)
+        assert message["error"].startswith("Invalid max_points")
+
+
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_downsampled_updates_built_once_per_resolution(self, mock_chart, mock_producer_chart):
+        mock_chart.return_value = mock_producer_chart.return_value = CHART_DATA
+
+        async def scenario():
+            communicators = [connect() for _ in range(3)]
+            for communicator in communicators:
+                await communicator.connect()
+                await communicator.receive_from()
+                await communicator.send_to(text_data=json.dumps({"interval_type": "daily", "width": 300}))
+                await communicator.receive_from()
+                await communicator.receive_from()
+
+            mock_chart.reset_mock()
+            mock_producer_chart.reset_mock()
+            await broadcast._producers[("bitcoin", "daily", "line")].publish()
+            messages = [json.loads(await communicator.receive_from()) for communicator in communicators]
+
+            for communicator in communicators:
+                await communicator.disconnect()
+            return messages
+
+        messages = async_to_sync(scenario)()
+
+        assert all(message["type"] == "snapshot" and message["chart_data"] == CHART_DATA for message in messages)
+        # The sockets only relay: one full series for the publish and one downsampled build for all three
+        mock_chart.assert_not_awaited()
+        assert [call.args for call in mock_producer_chart.await_args_list] == [
+            ("bitcoin", "daily", "line"), ("bitcoin", "daily", "line", 300)
+        ]
+
+class TestChartDelta:
+    def test_appended_points(self):
+        previous = [{"timestamp": 1, "price": 1.0}, {"timestamp": 2, "price": 2.0}]
+        current = previous + [{"timestamp": 3, "price": 3.0}]
+
+        assert broadcast.chart_delta(previous, current) == (3, [{"timestamp": 3, "price": 3.0}])
+
+    def test_replaced_live_point(self):
+        previous = [{"timestamp": 1, "price": 1.0}, {"timestamp": 5, "price": 2.0}]
+        current = [{"timestamp": 1, "price": 1.0}, {"timestamp": 7, "price": 2.5}]
+
+        assert broadcast.chart_delta(previous, current) == (5, [{"timestamp": 7, "price": 2.5}])
+
+    def test_unchanged(self):
+        series = [{"timestamp": 1, "price": 1.0}]
+
+        assert broadcast.chart_delta(series, series) == (None, [])
+
+
+class TestChartProducer:
+    def run_for(self, producer, seconds):
+        async def scenario():
+            producer.start()
+            await asyncio.sleep(seconds)
+            await producer.stop()
+
+        async_to_sync(scenario)()
+
+    @patch("portfolio.broadcast.PRODUCER_LEASE_RENEW", 0.05)
+    @patch.dict("portfolio.broadcast.CHART_REFRESH_INTERVALS", {"daily": 0})
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    def test_follower_polls_lease_once_per_renewal(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+        producer = broadcast.ChartProducer("bitcoin", "daily", "line")
+        cache.set(producer.lease_key, "another-process", 30)
+
+        with patch.object(producer, "hold_lease", wraps=producer.hold_lease) as hold_lease:
+            self.run_for(producer, 0.3)
+
+        # One poll per renewal interval, not a busy loop once the first publish is due
+        assert 1 <= hold_lease.call_count <= 10
+        assert cache.get(producer.lease_key) == "another-process"
+        mock_chart.assert_awaited_once()
+
+    @patch("portfolio.broadcast.PRODUCER_LEASE_RENEW", 0.05)
+    @patch.dict("portfolio.broadcast.CHART_REFRESH_INTERVALS", {"daily": 0})
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    def test_failed_publish_backs_off(self, mock_chart):
+        mock_chart.return_value = CHART_DATA
+        producer = broadcast.ChartProducer("bitcoin", "daily", "line")
+
+        with patch.object(producer, "publish", side_effect=ConnectionError("redis down")) as publish:
+            self.run_for(producer, 0.3)
+
+        assert 1 <= publish.call_count <= 10
@@ -1,20 +1,33 @@
+import gzip
+import json
+import time
 from unittest.mock import patch
 import pytest
 from django.urls import reverse
 from rest_framework import status
 from conftest import api_client
+from portfolio.caching import store
 
 @pytest.fixture
 def crypto_list_url():
     return reverse('crypto-list')
 
 
+MARKET = [
+    {"name": f"Coin {i}", "symbol": f"c{i}", "current_price": price, "market_cap": cap, "market_cap_rank": i + 1,
+     "price_change_percentage_24h": change}
+    for i, (price, cap, change) in enumerate([
+        (100.0, 5000, 1.5), (2.0, 4000, -3.0), (50.0, 3000, None), (0.5, 2000, 10.0), (7.0, None, 0.0),
+    ])
+]
+
+
 @pytest.mark.django_db
 class TestCryptoListView:
 
-    @patch("portfolio.views.get_cached_data")
-    def test_success_response(self, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = [
+    @patch("portfolio.views.get_market_snapshot")
+    def test_success_response(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = [
             {
                 "name": "Bitcoin",
                 "image": "btc.png",
@@ -31,45 +44,45 @@ class TestCryptoListView:
         assert isinstance(response.data, list)
         assert response.data[0]['name'] == "Bitcoin"
 
-    @patch("portfolio.views.get_cached_data")
-    @patch("portfolio.views.cache")
-    def test_refresh_param_deletes_cache(self, mock_cache, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = []
+    @patch("portfolio.views.get_market_snapshot")
+    @patch("portfolio.views.refresh_market_snapshot")
+    def test_refresh_param_refreshes_snapshot(self, mock_refresh, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = []
 
         response = api_client.get(crypto_list_url + "?refresh=true")
         assert response.status_code == status.HTTP_200_OK
-        mock_cache.delete.assert_called_once_with("crypto_list")
+        mock_refresh.assert_called_once_with()
 
-    @patch("portfolio.views.get_cached_data")
-    @patch("portfolio.views.cache")
-    def test_no_cache_delete_without_refresh(self, mock_cache, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = []
+    @patch("portfolio.views.get_market_snapshot")
+    @patch("portfolio.views.refresh_market_snapshot")
+    def test_no_refresh_without_param(self, mock_refresh, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = []
 
         response = api_client.get(crypto_list_url)
         assert response.status_code == status.HTTP_200_OK
-        mock_cache.delete.assert_not_called()
+        mock_refresh.assert_not_called()
 
-    @patch("portfolio.views.get_cached_data")
-    def test_external_api_error(self, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = {"error": "External service unavailable"}
+    @patch("portfolio.views.get_market_snapshot")
+    def test_external_api_error(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = {"error": "External service unavailable"}
 
         response = api_client.get(crypto_list_url)
 
         assert response.status_code == status.HTTP_502_BAD_GATEWAY
         assert "error" in response.data
 
-    @patch("portfolio.views.get_cached_data")
-    def test_empty_response(self, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = []
+    @patch("portfolio.views.get_market_snapshot")
+    def test_empty_response(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = []
 
         response = api_client.get(crypto_list_url)
 
         assert response.status_code == status.HTTP_200_OK
         assert response.data == []
 
-    @patch("portfolio.views.get_cached_data")
-    def test_incomplete_data_in_response(self, mock_get_cached_data, api_client, crypto_list_url):
-        mock_get_cached_data.return_value = [
+    @patch("portfolio.views.get_market_snapshot")
+    def test_incomplete_data_in_response(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = [
             {
                 "name": "Bitcoin",
                 "image": None,
@@ -86,3 +99,87 @@ class TestCryptoListView:
 
         assert response.status_code == status.HTTP_200_OK
         assert set(response.data[0].keys()) == expected_keys
+
+    @patch("portfolio.views.get_market_snapshot")
+    def test_unchanged_entry_returns_304(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = []
+        store("crypto_list", [], "crypto_list")
+
+        first = api_client.get(crypto_list_url)
+        second = api_client.get(crypto_list_url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        assert first.status_code == status.HTTP_200_OK
+        assert first["Last-Modified"]
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+        assert second["ETag"] == first["ETag"]
+
+        time.sleep(0.01)
+        store("crypto_list", [], "crypto_list")
+        third = api_client.get(crypto_list_url, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert third.status_code == status.HTTP_200_OK
+
+    @patch("portfolio.views.get_market_snapshot")
+    def test_gzip_negotiation(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = [{"name": f"Coin {i}", "symbol": "c"} for i in range(50)]
+
+        response = api_client.get(crypto_list_url, HTTP_ACCEPT_ENCODING="gzip")
+
+        assert response["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response["Vary"]
+        assert json.loads(gzip.decompress(response.content))[0]["name"] == "Coin 0"
+
+    @patch("portfolio.views.get_market_snapshot")
+    def test_brotli_preferred_when_available(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        brotli = pytest.importorskip("brotli")
+        mock_get_market_snapshot.return_value = [{"name": f"Coin {i}", "symbol": "c"} for i in range(50)]
+
+        response = api_client.get(crypto_list_url, HTTP_ACCEPT_ENCODING="gzip, br")
+
+        assert response["Content-Encoding"] == "br"
+        assert json.loads(brotli.decompress(response.content))[0]["name"] == "Coin 0"
+
+
+@pytest.mark.django_db
+class TestCryptoListQuery:
+    @patch("portfolio.views.get_market_snapshot")
+    def test_pages_through_snapshot(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = MARKET
+
+        first = api_client.get(crypto_list_url, {"page_size": 2})
+        last = api_client.get(crypto_list_url, {"page_size": 2, "page": 3})
+
+        assert [coin["name"] for coin in first.data] == ["Coin 0", "Coin 1"]
+        assert first["X-Total-Count"] == "5"
+        assert 'page=2' in first["Link"] and 'rel="next"' in first["Link"]
+        assert [coin["name"] for coin in last.data] == ["Coin 4"]
+        assert 'rel="prev"' in last["Link"] and 'rel="next"' not in last["Link"]
+        mock_get_market_snapshot.assert_called()
+
+    @patch("portfolio.views.get_market_snapshot")
+    def test_sort_keeps_missing_values_last(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = MARKET
+
+        ascending = api_client.get(crypto_list_url, {"sort": "market_cap"})
+        descending = api_client.get(crypto_list_url, {"sort": "-current_price"})
+
+        assert [coin["name"] for coin in ascending.data] == ["Coin 3", "Coin 2", "Coin 1", "Coin 0", "Coin 4"]
+        assert [coin["current_price"] for coin in descending.data] == [100.0, 50.0, 7.0, 2.0, 0.5]
+
+    @patch("portfolio.views.get_market_snapshot")
+    def test_filters(self, mock_get_market_snapshot, api_client, crypto_list_url):
+        mock_get_market_snapshot.return_value = MARKET
+
+        response = api_client.get(crypto_list_url, {"min_price": "1", "min_change": "-5", "max_change": "5"})
+
+        # Coin 2 has no 24h change, so a change filter leaves it out
+        assert [coin["name"] for coin in response.data] == ["Coin 0", "Coin 1", "Coin 4"]
+        assert response["X-Total-Count"] == "3"
+
+    @pytest.mark.parametrize("query", [{"sort": "name"}, {"page": "0"}, {"page_size": "1000"}, {"min_price": "cheap"}])
+    @patch("portfolio.views.get_market_snapshot")
+    def test_invalid_query(self, mock_get_market_snapshot, query, api_client, crypto_list_url):
+        response = api_client.get(crypto_list_url, query)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "error" in response.data
+        mock_get_market_snapshot.assert_not_called()
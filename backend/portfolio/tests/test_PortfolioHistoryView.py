@@ -0,0 +1,89 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+import numpy as np
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from conftest import api_client
+from portfolio.history import ledger_deltas
+from portfolio.holdings import transaction_deltas
+from portfolio.models import PortfolioTransaction
+from portfolio.timeseries import DAY_MS, now_ms
+
+def price_series(slug, interval_type, chart_type):
+    start = now_ms() - 400 * DAY_MS
+    return [{"timestamp": start + i * DAY_MS, "price": 150.0} for i in range(401)]
+
+
+def add_transaction(user, days_ago, **fields):
+    tx = PortfolioTransaction.objects.create(user=user, **fields)
+    PortfolioTransaction.objects.filter(pk=tx.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+
+
+@pytest.mark.django_db
+class TestPortfolioHistoryView:
+    def test_ledger_deltas_match_holdings(self):
+        rows = [
+            ("buy", "2", "100", "1"), ("sell", "0.5", "200", "0.5"),
+            ("transfer_in", "3", "0", "0"), ("transfer_out", "1", "0", "0.1"),
+        ]
+        amount_delta, spent_delta = ledger_deltas(
+            np.array([row[0] for row in rows]),
+            *(np.array([float(row[i]) for row in rows]) for i in (1, 2, 3)),
+        )
+
+        for row, amount, spent in zip(rows, amount_delta, spent_delta):
+            expected = transaction_deltas(row[0], *(Decimal(value) for value in row[1:]))
+            assert (amount, spent) == pytest.approx(tuple(float(value) for value in expected))
+
+    @patch("portfolio.history.getChartData")
+    def test_value_over_time(self, mock_chart, auth_client, user):
+        mock_chart.side_effect = price_series
+        add_transaction(user, 10, coin_id="bitcoin", amount=Decimal("2"), price_usd=Decimal("100"), fee=Decimal("1"), type="buy")
+        add_transaction(user, 500, coin_id="dogecoin", amount=Decimal("5"), price_usd=Decimal("1"), type="buy")
+        add_transaction(user, 450, coin_id="dogecoin", amount=Decimal("5"), price_usd=Decimal("2"), type="sell")
+
+        response = auth_client.get(reverse("portfolio-history"))
+
+        assert response.status_code == status.HTTP_200_OK
+        history = response.data["history"]
+        assert len(history) == 366
+        assert history[0] == {"timestamp": history[0]["timestamp"], "value": 0.0, "total_spent": -5.0, "profit_loss": 5.0}
+        assert history[-1]["value"] == 300.0
+        assert history[-1]["total_spent"] == 196.0
+        assert history[-1]["profit_loss"] == 104.0
+        # Dogecoin was sold before the window, so only bitcoin prices are loaded
+        mock_chart.assert_called_once_with("bitcoin", "daily", "line")
+
+    @patch("portfolio.history.getChartData")
+    def test_cached_until_next_transaction(self, mock_chart, auth_client, user):
+        mock_chart.side_effect = price_series
+        add_transaction(user, 10, coin_id="bitcoin", amount=Decimal("1"), price_usd=Decimal("100"), type="buy")
+
+        auth_client.get(reverse("portfolio-history"))
+        auth_client.get(reverse("portfolio-history"))
+        assert mock_chart.call_count == 1
+
+        add_transaction(user, 1, coin_id="bitcoin", amount=Decimal("1"), price_usd=Decimal("100"), type="buy")
+        response = auth_client.get(reverse("portfolio-history"))
+
+        assert mock_chart.call_count == 2
+        assert response.data["history"][-1]["value"] == 300.0
+
+    @patch("portfolio.history.getChartData")
+    def test_held_before_first_price_is_missing(self, mock_chart, auth_client, user):
+        # Prices only start five days ago, the coin was bought ten days ago
+        mock_chart.return_value = [{"timestamp": now_ms() - 5 * DAY_MS, "price": 150.0}]
+        add_transaction(user, 10, coin_id="bitcoin", amount=Decimal("1"), price_usd=Decimal("100"), type="buy")
+
+        response = auth_client.get(reverse("portfolio-history"))
+
+        assert response.data["missing_prices"] == ["bitcoin"]
+        assert response.data["history"][-1]["value"] == 150.0
+
+    def test_invalid_interval(self, auth_client):
+        response = auth_client.get(reverse("portfolio-history") + "?interval_type=weekly")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,112 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import patch
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from conftest import api_client
+from portfolio import imports
+from portfolio.models import PortfolioTransaction, PortfolioHolding
+
+@pytest.fixture
+def import_url():
+    return reverse("portfolio-import")
+
+
+@pytest.mark.django_db
+class TestPortfolioImportView:
+    def test_csv_import(self, auth_client, import_url, user):
+        content = (
+            "coin_id,amount,price_usd,fee,type\n"
+            "bitcoin,2,100,1,buy\n"
+            "bitcoin,0.5,200,,sell\n"
+            "ethereum,3,10,,transfer_in\n"
+        )
+        upload = SimpleUploadedFile("trades.csv", content.encode(), content_type="text/csv")
+
+        response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data == {"imported": 3, "failed": 0, "errors": []}
+        assert PortfolioTransaction.objects.filter(user=user).count() == 3
+        bitcoin = PortfolioHolding.objects.get(user=user, coin_id="bitcoin")
+        assert bitcoin.amount == Decimal("1.5")
+        assert bitcoin.total_spent == Decimal("101")
+
+    def test_ndjson_reports_row_errors(self, auth_client, import_url, user):
+        lines = [
+            json.dumps({"coin_id": "bitcoin", "amount": "1", "price_usd": "100", "type": "buy"}),
+            "{not json",
+            json.dumps({"coin_id": "bitcoin", "amount": "1", "price_usd": "100", "type": "swap"}),
+            "",
+            json.dumps({"coin_id": "bitcoin", "amount": "1", "price_usd": "100", "type": "sell"}),
+        ]
+        upload = SimpleUploadedFile("trades.ndjson", "\n".join(lines).encode())
+
+        response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["imported"] == 2
+        assert response.data["failed"] == 2
+        assert [error["row"] for error in response.data["errors"]] == [2, 3]
+        assert "type" in response.data["errors"][1]["errors"]
+
+    @patch("portfolio.imports.IMPORT_BATCH_SIZE", 2)
+    def test_writes_in_batches(self, auth_client, import_url, user):
+        content = "coin_id,amount,price_usd,fee,type\n" + "bitcoin,1,100,,buy\n" * 5
+        upload = SimpleUploadedFile("trades.csv", content.encode())
+
+        with patch("portfolio.imports._write_batch", wraps=imports._write_batch) as write:
+            response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.data["imported"] == 5
+        assert [len(call.args[1]) for call in write.call_args_list] == [2, 2, 1]
+        assert PortfolioHolding.objects.get(user=user, coin_id="bitcoin").amount == Decimal("5")
+
+    def test_keeps_trade_timestamps(self, auth_client, import_url, user):
+        content = (
+            "coin_id,amount,price_usd,fee,type,timestamp\n"
+            "bitcoin,1,100,,buy,2021-03-01T12:00:00Z\n"
+            "bitcoin,1,100,,buy,\n"
+            "bitcoin,1,100,,buy,2999-01-01T00:00:00Z\n"
+        )
+        upload = SimpleUploadedFile("trades.csv", content.encode())
+
+        response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.data["imported"] == 2
+        assert [(error["row"], list(error["errors"])) for error in response.data["errors"]] == [(3, ["timestamp"])]
+        timestamps = sorted(PortfolioTransaction.objects.filter(user=user).values_list("timestamp", flat=True))
+        assert timestamps[0] == datetime(2021, 3, 1, 12, tzinfo=dt_timezone.utc)
+        assert timestamps[1] > timezone.now() - timedelta(minutes=1)
+
+    def test_csv_header_missing_columns(self, auth_client, import_url, user):
+        upload = SimpleUploadedFile("trades.csv", b"coin_id,amount,type\nbitcoin,1,buy\n")
+
+        response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {"error": "CSV header is missing columns: price_usd, fee"}
+        assert not PortfolioTransaction.objects.filter(user=user).exists()
+
+    @patch("portfolio.imports.IMPORT_BATCH_SIZE", 2)
+    def test_undecodable_file_stops_with_report(self, auth_client, import_url, user):
+        content = b"coin_id,amount,price_usd,fee,type\n" + b"bitcoin,1,100,,buy\n" * 2 + b"bitcoin,\xff,100,,buy\n"
+        upload = SimpleUploadedFile("trades.csv", content)
+
+        response = auth_client.post(import_url, {"file": upload}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["imported"] == 2
+        assert response.data["errors"][0]["row"] == 3
+        assert "error" in response.data
+        assert PortfolioTransaction.objects.filter(user=user).count() == 2
+
+    def test_missing_file(self, auth_client, import_url):
+        response = auth_client.post(import_url, {}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "error" in response.data
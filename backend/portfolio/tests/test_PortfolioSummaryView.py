@@ -0,0 +1,94 @@
+from decimal import Decimal
+from unittest.mock import patch
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework import status
+from conftest import api_client
+from portfolio.models import PortfolioTransaction, PortfolioHolding
+
+@pytest.fixture
+def add_transaction(auth_client):
+    def _add(**data):
+        response = auth_client.post(reverse("portfolio-transaction"), data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        return response
+    return _add
+
+
+@pytest.mark.django_db
+class TestPortfolioSummaryView:
+    def test_post_updates_holding(self, add_transaction, user):
+        add_transaction(coin_id="bitcoin", amount="2", price_usd="100", fee="1", type="buy")
+        add_transaction(coin_id="bitcoin", amount="0.5", price_usd="200", type="sell")
+        add_transaction(coin_id="bitcoin", amount="1", price_usd="0", fee="0.1", type="transfer_out")
+
+        holding = PortfolioHolding.objects.get(user=user, coin_id="bitcoin")
+        assert holding.amount == Decimal("0.4")
+        assert holding.total_spent == Decimal("101")
+
+    @patch("portfolio.views.get_prices")
+    def test_summary_reads_holdings(self, mock_get_prices, auth_client, add_transaction):
+        mock_get_prices.return_value = {"bitcoin": {"usd": 150}, "ethereum": {"usd": 10}}
+        add_transaction(coin_id="bitcoin", amount="2", price_usd="100", fee="1", type="buy")
+        add_transaction(coin_id="ethereum", amount="3", price_usd="0", type="transfer_in")
+
+        response = auth_client.get(reverse("portfolio-summary"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {
+                "coin_id": "bitcoin",
+                "amount": 2.0,
+                "total_spent": 201.0,
+                "current_price": 150,
+                "current_value": 300.0,
+                "profit_loss": 99.0,
+            },
+            {
+                "coin_id": "ethereum",
+                "amount": 3.0,
+                "total_spent": 0.0,
+                "current_price": 10,
+                "current_value": 30.0,
+                "profit_loss": 30.0,
+            },
+        ]
+
+    @patch("portfolio.views.get_prices")
+    def test_ledger_source_matches_holdings(self, mock_get_prices, auth_client, add_transaction):
+        mock_get_prices.return_value = {"bitcoin": {"usd": 150.5}}
+        add_transaction(coin_id="bitcoin", amount="2.5", price_usd="100.1", fee="1", type="buy")
+        add_transaction(coin_id="bitcoin", amount="0.5", price_usd="200", fee="0.5", type="sell")
+        add_transaction(coin_id="bitcoin", amount="1", price_usd="0", fee="0.01", type="transfer_out")
+
+        from_holdings = auth_client.get(reverse("portfolio-summary"))
+        from_ledger = auth_client.get(reverse("portfolio-summary") + "?source=ledger")
+
+        assert from_ledger.status_code == status.HTTP_200_OK
+        assert from_ledger.data == from_holdings.data
+        assert from_ledger.data[0]["amount"] == Decimal("0.99")
+        assert from_ledger.data[0]["total_spent"] == Decimal("151.75")
+
+    def test_summary_requires_authentication(self, api_client):
+        response = api_client.get(reverse("portfolio-summary"))
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestRebuildHoldingsCommand:
+    def test_rebuild_from_ledger(self, user):
+        PortfolioTransaction.objects.create(user=user, coin_id="bitcoin", amount="1", price_usd="100", type="buy")
+        PortfolioTransaction.objects.create(user=user, coin_id="bitcoin", amount="1", price_usd="0", type="transfer_in")
+
+        with pytest.raises(CommandError):
+            call_command("rebuild_holdings", "--check")
+
+        call_command("rebuild_holdings")
+        call_command("rebuild_holdings", "--check")
+
+        holding = PortfolioHolding.objects.get(user=user, coin_id="bitcoin")
+        assert holding.amount == Decimal("2")
+        assert holding.total_spent == Decimal("100")
@@ -0,0 +1,69 @@
+from datetime import timedelta
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from conftest import api_client
+from portfolio.models import PortfolioTransaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def transactions_url():
+    return reverse("portfolio-transaction")
+
+
+@pytest.fixture
+def ledger(user):
+    now = timezone.now()
+    for i in range(7):
+        tx = PortfolioTransaction.objects.create(
+            user=user,
+            coin_id="bitcoin" if i % 2 else "ethereum",
+            amount="1",
+            price_usd="100",
+            type="buy" if i < 5 else "sell",
+        )
+        # auto_now_add ignores explicit values, so backdate after insert
+        PortfolioTransaction.objects.filter(pk=tx.pk).update(timestamp=now - timedelta(days=i))
+    return PortfolioTransaction.objects.filter(user=user).order_by("-timestamp", "-id")
+
+
+@pytest.mark.django_db
+class TestPortfolioTransactionView:
+    def test_cursor_pages_cover_ledger_in_order(self, auth_client, transactions_url, ledger):
+        ids = []
+        url = transactions_url + "?page_size=3"
+        while url:
+            response = auth_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data["results"]) <= 3
+            ids += [tx["id"] for tx in response.data["results"]]
+            url = response.data["next"]
+
+        assert ids == [tx.id for tx in ledger]
+
+    def test_filters(self, auth_client, transactions_url, ledger):
+        date_from = (timezone.now() - timedelta(days=3, hours=1)).isoformat()
+
+        response = auth_client.get(transactions_url, {"coin_id": "bitcoin", "type": "buy", "date_from": date_from})
+
+        assert response.status_code == status.HTTP_200_OK
+        expected = ledger.filter(coin_id="bitcoin", type="buy", timestamp__gte=date_from)
+        assert [tx["id"] for tx in response.data["results"]] == [tx.id for tx in expected]
+        assert len(response.data["results"]) == 2
+
+    def test_invalid_filters(self, auth_client, transactions_url):
+        assert auth_client.get(transactions_url, {"type": "swap"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert auth_client.get(transactions_url, {"date_to": "yesterday"}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_only_own_transactions(self, api_client, transactions_url, ledger):
+        other = User.objects.create_user(username="other", email="other@example.com", password="secret123")
+        api_client.force_authenticate(user=other)
+
+        response = api_client.get(transactions_url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == []
@@ -0,0 +1,167 @@
+import json
+from unittest.mock import AsyncMock, patch
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from conftest import api_client
+from portfolio.alerts import AlertBook, AlertEngine
+from portfolio.models import PriceAlert
+from portfolio.poller import MarketDataPoller
+from portfolio.routing import websocket_urlpatterns
+
+class TestAlertBook:
+    def test_only_crossed_alerts_leave_the_book(self):
+        book = AlertBook()
+        book.add([
+            (1, 10, "bitcoin", "above", 70000),
+            (2, 10, "bitcoin", "above", 60000),
+            (3, 11, "bitcoin", "above", 65000),
+            (4, 11, "bitcoin", "below", 50000),
+            (5, 10, "bitcoin", "below", 55000),
+            (6, 10, "ethereum", "above", 1000),
+        ])
+
+        crossed = book.cross({"bitcoin": 65000.0, "solana": 1.0})
+
+        assert [(coin_id, direction, ids.tolist()) for coin_id, direction, _, (_, ids, _) in crossed] == [
+            ("bitcoin", "above", [2, 3])
+        ]
+        assert len(book) == 4
+        crossed = book.cross({"bitcoin": 55000.0})
+        assert [ids.tolist() for _, _, _, (_, ids, _) in crossed] == [[5]]
+
+    def test_merged_alerts_stay_sorted(self):
+        book = AlertBook()
+        book.add([(1, 10, "bitcoin", "below", 100), (2, 10, "bitcoin", "below", 300)])
+        book.add([(3, 10, "bitcoin", "below", 200), (4, 10, "bitcoin", "below", 50)])
+
+        assert book.thresholds[("bitcoin", "below")].prices.tolist() == [50, 100, 200, 300]
+        assert book.max_id == 4
+        assert [ids.tolist() for _, _, _, (_, ids, _) in book.cross({"bitcoin": 150})] == [[3, 2]]
+
+    def test_missing_prices_cross_nothing(self):
+        book = AlertBook()
+        book.add([(1, 10, "bitcoin", "above", 100)])
+
+        assert book.cross({"bitcoin": None}) == []
+        assert book.cross({"bitcoin": float("nan")}) == []
+        assert len(book) == 1
+
+
+@pytest.mark.django_db
+class TestAlertEngine:
+    def test_fires_once_and_marks_triggered(self, user):
+        above = PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=60000, direction="above")
+        below = PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=50000, direction="below")
+        engine = AlertEngine()
+
+        fired = engine.evaluate({"bitcoin": 61000.0})
+
+        assert [(alert["id"], alert["user_id"], alert["price_usd"]) for alert in fired] == [(above.id, user.id, 60000.0)]
+        above.refresh_from_db()
+        assert not above.is_active
+        assert above.triggered_price_usd == 61000.0
+        assert engine.evaluate({"bitcoin": 62000.0}) == []
+        assert PriceAlert.objects.get(id=below.id).is_active
+
+    def test_picks_up_new_alerts_and_skips_deleted_ones(self, user):
+        engine = AlertEngine()
+        deleted = PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=100, direction="above")
+        engine.sync()
+        deleted.delete()
+        added = PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=200, direction="above")
+
+        fired = engine.evaluate({"bitcoin": 300.0})
+
+        assert [alert["id"] for alert in fired] == [added.id]
+        assert engine.coin_ids() == []
+
+    def test_locked_alerts_go_back_into_the_book(self, user):
+        alert = PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=100, direction="above")
+        engine = AlertEngine()
+
+        # Another transaction holds the row, so select_for_update(skip_locked=True) returns nothing
+        with patch.object(AlertEngine, "confirm", return_value=([], timezone.now())):
+            assert engine.evaluate({"bitcoin": 150.0}) == []
+
+        assert engine.coin_ids() == ["bitcoin"]
+        assert [fired["id"] for fired in engine.evaluate({"bitcoin": 150.0})] == [alert.id]
+
+    @patch("portfolio.poller.coingecko.aget", new_callable=AsyncMock)
+    def test_poller_checks_every_price_batch(self, mock_aget, user):
+        mock_aget.return_value = httpx.Response(200, json={"dogecoin": {"usd": 0.5}})
+        alert = PriceAlert.objects.create(user=user, coin_id="dogecoin", price_usd="0.4", direction="above")
+        poller = MarketDataPoller(calls_per_minute=6000)
+
+        tracked = async_to_sync(poller.tracked_coin_ids)()
+        async_to_sync(poller.poll_prices)(tracked)
+
+        assert tracked == ["dogecoin"]
+        alert.refresh_from_db()
+        assert not alert.is_active
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAlertConsumer:
+    def test_notify_reaches_the_users_sockets(self, user):
+        PriceAlert.objects.create(user=user, coin_id="bitcoin", price_usd=100, direction="below")
+        engine = AlertEngine()
+        token = RefreshToken.for_user(user).access_token
+
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/alerts/?token={token}")
+            connected, _ = await communicator.connect()
+            assert connected
+            await engine.process({"bitcoin": 90.0})
+            message = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(scenario)()
+
+        assert message["type"] == "alerts"
+        assert [(alert["coin_id"], alert["direction"], alert["triggered_price_usd"]) for alert in message["alerts"]] == [
+            ("bitcoin", "below", 90.0)
+        ]
+
+    def test_socket_requires_authentication(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/alerts/?token=invalid")
+            connected, _ = await communicator.connect()
+            return connected
+
+        assert not async_to_sync(scenario)()
+
+
+@pytest.mark.django_db
+class TestPriceAlertView:
+    def test_create_list_delete(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        url = reverse("price-alerts")
+
+        created = api_client.post(url, {"coin_id": "bitcoin", "price_usd": "70000", "direction": "above"}, format="json")
+        assert created.status_code == status.HTTP_201_CREATED
+        assert created.data["is_active"] is True
+
+        assert [alert["coin_id"] for alert in api_client.get(url, {"active": "true"}).data] == ["bitcoin"]
+        assert api_client.delete(url, {"id": created.data["id"]}, format="json").status_code == status.HTTP_204_NO_CONTENT
+        assert api_client.get(url).data == []
+
+    @pytest.mark.parametrize("data", [
+        {"coin_id": "bitcoin", "price_usd": "-1", "direction": "above"},
+        {"coin_id": "bitcoin", "price_usd": "100", "direction": "sideways"},
+        {"price_usd": "100", "direction": "above"},
+    ])
+    def test_invalid_alert(self, data, api_client, user):
+        api_client.force_authenticate(user=user)
+
+        assert api_client.post(reverse("price-alerts"), data, format="json").status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_requires_authentication(self, api_client):
+        assert api_client.get(reverse("price-alerts")).status_code == status.HTTP_401_UNAUTHORIZED
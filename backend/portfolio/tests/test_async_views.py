@@ -0,0 +1,117 @@
+import asyncio
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from portfolio.caching import store, unwrap
+from portfolio.async_views import AsyncCryptoListView, AsyncCryptoDetailView, AsyncPortfolioHistoryView, AsyncPortfolioSummaryView
+from portfolio.models import PortfolioHolding, PortfolioTransaction
+from portfolio.timeseries import DAY_MS, now_ms
+
+User = get_user_model()
+
+
+def call(view, request, **kwargs):
+    response = async_to_sync(view.as_view())(request, **kwargs)
+    return response.status_code, json.loads(response.content)
+
+
+class TestAsyncMarketViews:
+    @patch("portfolio.async_views.aget_market_snapshot", new_callable=AsyncMock)
+    def test_list(self, mock_get_cached_data):
+        mock_get_cached_data.return_value = [{"name": "Bitcoin", "symbol": "btc", "current_price": 100000, "id": "bitcoin"}]
+
+        status_code, data = call(AsyncCryptoListView, AsyncRequestFactory().get("/api/crypto/"))
+
+        assert status_code == 200
+        assert data == [{
+            "name": "Bitcoin", "image": None, "symbol": "btc",
+            "current_price": 100000, "market_cap": None, "market_cap_rank": None,
+        }]
+
+    @patch("portfolio.markets.coingecko.aget", new_callable=AsyncMock)
+    def test_refresh_keeps_the_snapshot_tail(self, mock_aget):
+        mock_aget.return_value = httpx.Response(200, json=[{"id": "bitcoin", "name": "Bitcoin", "symbol": "btc", "current_price": 2}])
+        store("crypto_list", [{"id": "bitcoin", "current_price": 1}, {"id": "ethereum", "current_price": 1}], "crypto_list")
+
+        call(AsyncCryptoListView, AsyncRequestFactory().get("/api/crypto/?refresh=true"))
+
+        assert [(coin["id"], coin["current_price"]) for coin in unwrap(cache.get("crypto_list"))[0]] == [("bitcoin", 2), ("ethereum", 1)]
+
+    @patch("portfolio.async_views.get_cached_data_async", new_callable=AsyncMock)
+    def test_detail_error(self, mock_get_cached_data):
+        mock_get_cached_data.return_value = {"error": "Failed to fetch data from CoinGecko"}
+
+        status_code, data = call(AsyncCryptoDetailView, AsyncRequestFactory().get("/api/crypto/details/bitcoin/"), slug="bitcoin")
+
+        assert status_code == 502
+        assert mock_get_cached_data.await_args.args == ("crypto_detail_bitcoin", "/coins/bitcoin")
+
+    @patch("portfolio.coingecko.aget", new_callable=AsyncMock)
+    def test_concurrent_misses_share_one_upstream_call(self, mock_aget):
+        mock_aget.return_value = MagicMock(status_code=200)
+        mock_aget.return_value.json.return_value = {"name": "Bitcoin", "market_data": {"current_price": {"usd": 5}}}
+
+        async def scenario():
+            view = AsyncCryptoDetailView.as_view()
+            request = AsyncRequestFactory().get("/api/crypto/details/bitcoin/")
+            return await asyncio.gather(*[view(request, slug="bitcoin") for _ in range(10)])
+
+        responses = async_to_sync(scenario)()
+
+        assert mock_aget.await_count == 1
+        assert {json.loads(response.content)["current_price"] for response in responses} == {5}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncPortfolioSummaryView:
+    @pytest.fixture
+    def user(self):
+        user = User.objects.create_user(username="trader", email="trader@example.com", password="secret123")
+        PortfolioHolding.objects.create(user=user, coin_id="bitcoin", amount=Decimal("2"), total_spent=Decimal("201"))
+        return user
+
+    def test_requires_token(self, user):
+        status_code, _ = call(AsyncPortfolioSummaryView, AsyncRequestFactory().get("/api/crypto/portfolio/summary/"))
+
+        assert status_code == 401
+
+    @patch("portfolio.async_views.aget_prices", new_callable=AsyncMock)
+    def test_summary(self, mock_get_prices, user):
+        mock_get_prices.return_value = {"bitcoin": {"usd": 150}}
+        token = RefreshToken.for_user(user).access_token
+        request = AsyncRequestFactory().get("/api/crypto/portfolio/summary/", headers={"Authorization": f"Bearer {token}"})
+
+        status_code, data = call(AsyncPortfolioSummaryView, request)
+
+        assert status_code == 200
+        assert data == [{
+            "coin_id": "bitcoin", "amount": 2.0, "total_spent": 201.0,
+            "current_price": 150.0, "current_value": 300.0, "profit_loss": 99.0,
+        }]
+        assert list(mock_get_prices.await_args.args[0]) == ["bitcoin"]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncPortfolioHistoryView:
+    @patch("portfolio.history.getChartDataAsync", new_callable=AsyncMock)
+    def test_history(self, mock_chart, user):
+        mock_chart.return_value = [{"timestamp": now_ms() - 400 * DAY_MS, "price": 150.0}]
+        tx = PortfolioTransaction.objects.create(user=user, coin_id="bitcoin", amount=Decimal("2"), price_usd=Decimal("100"), type="buy")
+        PortfolioTransaction.objects.filter(pk=tx.pk).update(timestamp=timezone.now() - timedelta(days=10))
+        token = RefreshToken.for_user(user).access_token
+        request = AsyncRequestFactory().get("/api/crypto/portfolio/history/", headers={"Authorization": f"Bearer {token}"})
+
+        status_code, data = call(AsyncPortfolioHistoryView, request)
+
+        assert status_code == 200
+        assert data["history"][-1]["value"] == 300.0
+        mock_chart.assert_awaited_once_with("bitcoin", "daily", "line")
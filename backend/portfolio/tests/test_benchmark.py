@@ -0,0 +1,66 @@
+import httpx
+import pytest
+from portfolio.benchmark.runner import compare, summarize
+from portfolio.benchmark.stub import CoinGeckoStub, respond
+
+
+@pytest.fixture
+def stub():
+    with CoinGeckoStub() as server:
+        yield server
+
+
+class TestCoinGeckoStub:
+    def test_serves_endpoints_over_http(self, stub):
+        with httpx.Client(base_url=stub.base_url) as client:
+            markets = client.get("/coins/markets", params={"vs_currency": "usd", "per_page": 5, "page": 2})
+            prices = client.get("/simple/price", params={"ids": "bitcoin,ethereum", "vs_currencies": "usd"})
+            missing = client.get("/unknown")
+
+        assert [coin["market_cap_rank"] for coin in markets.json()] == [6, 7, 8, 9, 10]
+        assert set(prices.json()) == {"bitcoin", "ethereum"}
+        assert missing.status_code == 404
+        assert stub.calls == {"markets": 1, "simple_price": 1, "unknown": 1}
+
+    def test_series_are_deterministic(self):
+        params = {"vs_currency": "usd", "from": "1700000000", "to": "1700086400"}
+        status, first = respond("/coins/bitcoin/market_chart/range", params)
+        _, second = respond("/coins/bitcoin/market_chart/range", params)
+
+        assert status == 200
+        assert first == second
+        assert len(first["prices"]) == 288  # one day of 5-minute points
+
+    def test_ohlc_rows_are_candles(self):
+        status, candles = respond("/coins/bitcoin/ohlc", {"vs_currency": "usd", "days": "1"})
+
+        assert status == 200
+        assert all(len(candle) == 5 for candle in candles)
+
+
+class TestResults:
+    def test_summarize_percentiles(self):
+        result = summarize([0.001 * i for i in range(1, 101)], elapsed=2.0, errors=1)
+
+        assert result["requests"] == 100
+        assert result["errors"] == 1
+        assert result["throughput_rps"] == 50.0
+        assert result["p50_ms"] == pytest.approx(50.5)
+        assert result["p99_ms"] == pytest.approx(99.01)
+
+    def test_compare_flags_regressions_only(self):
+        baseline = {
+            "crypto-list": {"p99_ms": 10.0, "throughput_rps": 100.0},
+            "crypto-details": {"p99_ms": 10.0, "throughput_rps": 100.0},
+            "dropped": {"p99_ms": 1.0, "throughput_rps": 1.0},
+        }
+        results = {
+            "crypto-list": {"p99_ms": 13.0, "throughput_rps": 70.0},
+            "crypto-details": {"p99_ms": 11.0, "throughput_rps": 90.0},
+            "added": {"p99_ms": 100.0, "throughput_rps": 1.0},
+        }
+
+        assert compare(results, baseline, max_regression=0.2) == [
+            ("crypto-list", "p99_ms", 10.0, 13.0),
+            ("crypto-list", "throughput_rps", 100.0, 70.0),
+        ]
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from portfolio import caching, localcache
+from portfolio.caching import get_or_fetch, aget_or_fetch, lock_key, key_family, make_entry, unwrap
+from portfolio.localcache import PROCESS_ID, handle_invalidation
+
+
+class TestGetOrFetch:
+    def test_concurrent_threads_fetch_once(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return ["bitcoin"]
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_fetch("crypto_list", fetch)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [["bitcoin"]] * 10
+        assert unwrap(cache.get("crypto_list")) == (["bitcoin"], False)
+        assert cache.get(lock_key("crypto_list")) is None
+
+    def test_errors_are_not_cached(self):
+        result = get_or_fetch("crypto_list", lambda: {"error": "Failed"})
+
+        assert result == {"error": "Failed"}
+        assert cache.get("crypto_list") is None
+
+    def test_waits_for_lock_held_by_other_worker(self):
+        cache.add(lock_key("crypto_list"), "other-worker", 30)
+        threading.Timer(0.1, lambda: cache.set("crypto_list", ["ethereum"], 60)).start()
+
+        result = get_or_fetch("crypto_list", lambda: pytest.fail("should not fetch"))
+
+        assert result == ["ethereum"]
+
+
+class TestAsyncGetOrFetch:
+    def test_concurrent_coroutines_fetch_once(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "[1, 2, 3]"
+
+        async def scenario():
+            return await asyncio.gather(*[aget_or_fetch("chart_data_bitcoin_5min_line", fetch, "chart_data_5min") for _ in range(20)])
+
+        results = async_to_sync(scenario)()
+
+        assert len(calls) == 1
+        assert results == ["[1, 2, 3]"] * 20
+        assert unwrap(cache.get("chart_data_bitcoin_5min_line")) == ("[1, 2, 3]", False)
+
+
+def wait_for_refreshes():
+    deadline = time.monotonic() + 2
+    while caching._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def stale_entry(value, family):
+    entry = make_entry(value, family)
+    entry["stale_at"] = entry["fetched_at"] - 1
+    return entry
+
+
+class TestStaleWhileRevalidate:
+    def test_key_family(self):
+        assert key_family("crypto_detail_bitcoin") == "crypto_detail"
+        assert key_family("crypto_list") == "crypto_list"
+
+    def test_fresh_entry_is_not_refreshed(self):
+        cache.set("crypto_list", make_entry(["bitcoin"], "crypto_list"))
+
+        assert get_or_fetch("crypto_list", lambda: pytest.fail("should not fetch")) == ["bitcoin"]
+
+    def test_stale_entry_served_while_refreshing(self):
+        cache.set("crypto_list", stale_entry(["old"], "crypto_list"))
+        refreshed = threading.Event()
+
+        def fetch():
+            refreshed.set()
+            return ["new"]
+
+        assert get_or_fetch("crypto_list", fetch) == ["old"]
+        assert refreshed.wait(2)
+        wait_for_refreshes()
+
+        assert unwrap(cache.get("crypto_list")) == (["new"], False)
+        assert caching.refresh_stats.snapshot()["crypto_list"]["stale_hits"] >= 1
+
+    def test_failed_refresh_keeps_stale_value(self):
+        cache.set("crypto_list", stale_entry(["old"], "crypto_list"))
+
+        get_or_fetch("crypto_list", lambda: {"error": "Failed"})
+        wait_for_refreshes()
+
+        assert unwrap(cache.get("crypto_list"))[0] == ["old"]
+
+    def test_async_stale_entry_served_while_refreshing(self):
+        cache.set("chart_data_bitcoin_5min_line", stale_entry("[1]", "chart_data_5min"))
+
+        async def fetch():
+            return "[1, 2]"
+
+        async def scenario():
+            stale = await aget_or_fetch("chart_data_bitcoin_5min_line", fetch, "chart_data_5min")
+            await asyncio.gather(*caching._async_refresh_tasks)
+            return stale
+
+        assert async_to_sync(scenario)() == "[1]"
+        assert unwrap(cache.get("chart_data_bitcoin_5min_line")) == ("[1, 2]", False)
+
+
+class TestLocalTier:
+    def test_hot_key_served_from_process_memory(self):
+        get_or_fetch("crypto_list", lambda: ["bitcoin"])
+        cache.delete("crypto_list")
+
+        assert get_or_fetch("crypto_list", lambda: pytest.fail("should not fetch")) == ["bitcoin"]
+        assert caching.tier_stats.snapshot()["local"]["crypto_list"]["hits"] >= 1
+
+    def test_other_families_always_read_redis(self):
+        get_or_fetch("coingecko_prices_bitcoin", lambda: {"bitcoin": {"usd": 1}})
+
+        assert localcache.local_cache.get("coingecko_prices_bitcoin") is None
+
+    def test_lru_eviction_and_ttl(self, settings):
+        settings.LOCAL_CACHE_MAX_ENTRIES = 2
+        localcache.local_cache.set("crypto_detail_a", 1)
+        localcache.local_cache.set("crypto_detail_b", 2)
+        localcache.local_cache.get("crypto_detail_a")
+        localcache.local_cache.set("crypto_detail_c", 3)
+
+        assert localcache.local_cache.get("crypto_detail_b") is None
+        assert localcache.local_cache.get("crypto_detail_a") == 1
+
+        localcache.local_cache.set("crypto_detail_d", 4, ttl=0)
+        assert localcache.local_cache.get("crypto_detail_d") is None
+
+    def test_invalidation_from_other_process(self):
+        localcache.local_cache.set("crypto_list", ["old"])
+        handle_invalidation(json.dumps({"key": "crypto_list", "origin": PROCESS_ID}))
+        assert localcache.local_cache.get("crypto_list") == ["old"]
+
+        handle_invalidation(json.dumps({"key": "crypto_list", "origin": "other-worker"}))
+        assert localcache.local_cache.get("crypto_list") is None
+
+    def test_invalidate_drops_local_copy(self):
+        get_or_fetch("crypto_list", lambda: [])
+        caching.invalidate("crypto_list")
+
+        assert localcache.local_cache.get("crypto_list") is None
@@ -0,0 +1,69 @@
+from unittest.mock import AsyncMock, patch
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from portfolio.downsampling import downsample_candles, downsample_line, lttb_indices, parse_max_points
+from portfolio.services import getChartDataAsync
+
+
+class TestDownsampling:
+    def test_lttb_keeps_endpoints_and_spike(self):
+        y = np.zeros(1000)
+        y[537] = 100.0
+        indices = lttb_indices(np.arange(1000, dtype=float), y, 50)
+
+        assert len(indices) == 50
+        assert indices[0] == 0 and indices[-1] == 999
+        assert 537 in indices
+        assert list(indices) == sorted(indices)
+
+    def test_short_line_untouched(self):
+        points = [{"timestamp": i, "price": float(i)} for i in range(5)]
+
+        assert downsample_line(points, 10) == points
+
+    def test_line_skips_gaps(self):
+        points = [{"timestamp": i, "price": None if i % 2 else float(i)} for i in range(100)]
+
+        assert all(point["price"] is not None for point in downsample_line(points, 10))
+
+    def test_candle_buckets(self):
+        points = [
+            {"timestamp": t, "open": float(t), "high": t + 10.0, "low": t - 10.0, "close": t + 1.0}
+            for t in range(6)
+        ]
+
+        assert downsample_candles(points, 2) == [
+            {"timestamp": 0, "open": 0.0, "high": 12.0, "low": -10.0, "close": 3.0},
+            {"timestamp": 3, "open": 3.0, "high": 15.0, "low": -7.0, "close": 6.0},
+        ]
+
+    def test_parse_max_points(self):
+        assert parse_max_points() is None
+        assert parse_max_points(None, "300") == 300
+        assert parse_max_points("50", "300") == 50
+        with pytest.raises(ValueError):
+            parse_max_points("2")
+
+
+class TestDownsampledSeries:
+    @patch("portfolio.services.fetchChartDataAsync", new_callable=AsyncMock)
+    def test_cached_per_series_and_resolution(self, mock_fetch):
+        mock_fetch.return_value = '{"timestamp":[%s],"price":[%s]}' % (
+            ",".join(str(i) for i in range(500)), ",".join(str(float(i % 7)) for i in range(500)),
+        )
+
+        def load(max_points):
+            return async_to_sync(getChartDataAsync)("bitcoin", "daily", "line", max_points)
+
+        small = load(100)
+        with patch("portfolio.services.downsample") as mock_downsample:
+            assert load(100) == small
+            mock_downsample.assert_not_called()
+
+        assert len(small) == 100
+        assert len(load(250)) == 250
+        assert len(load(None)) == 500
+        assert mock_fetch.await_count == 1
+        assert cache.get("chart_data_bitcoin_daily_line_100_499") is not None
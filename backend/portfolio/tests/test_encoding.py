@@ -0,0 +1,35 @@
+import json
+from portfolio.encoding import (
+    dumps_columns, loads_points, pack_binary, unpack_binary, encode_chart_message, to_columns
+)
+
+CANDLES = [
+    {"timestamp": 1687500000000, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5},
+    {"timestamp": 1687501800000, "open": 1.5, "high": 2.5, "low": None, "close": 2.0},
+]
+
+
+class TestChartEncoding:
+    def test_columns_round_trip(self):
+        assert to_columns(CANDLES, "candlestick")["close"] == [1.5, 2.0]
+        assert loads_points(dumps_columns(CANDLES, "candlestick")) == CANDLES
+
+    def test_loads_legacy_row_cache(self):
+        assert loads_points(json.dumps(CANDLES)) == CANDLES
+
+    def test_binary_round_trip(self):
+        message = {"type": "snapshot", "slug": "bitcoin", "chart_data": CANDLES}
+
+        frame = pack_binary(message, "candlestick")
+        decoded = unpack_binary(frame)
+
+        assert decoded["chart_data"] == CANDLES
+        assert decoded["count"] == 2
+        assert decoded["slug"] == "bitcoin"
+        assert len(frame) < len(json.dumps(message))
+
+    def test_errors_stay_json(self):
+        frames = encode_chart_message({"chart_data": {"error": "Request failed"}}, "line")
+
+        assert set(frames) == {"json", "columnar", "binary"}
+        assert all(json.loads(frame) == {"chart_data": {"error": "Request failed"}} for frame in frames.values())
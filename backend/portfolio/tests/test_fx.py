@@ -0,0 +1,182 @@
+import json
+from unittest.mock import AsyncMock, patch
+import pytest
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+from django.urls import reverse
+from rest_framework import status
+from conftest import api_client
+from portfolio import broadcast, markets
+from portfolio.async_views import AsyncCryptoListView
+from portfolio.caching import invalidate
+from portfolio.fx import parse_rates, usd_bounds
+from portfolio.routing import websocket_urlpatterns
+
+RATES = {"usd": 1.0, "eur": 0.5, "jpy": 150.0}
+SNAPSHOT = [
+    {"id": "bitcoin", "name": "Bitcoin", "symbol": "btc", "current_price": 60000, "market_cap": 1200, "market_cap_rank": 1},
+    {"id": "ethereum", "name": "Ethereum", "symbol": "eth", "current_price": 3000, "market_cap": 400, "market_cap_rank": 2},
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(markets, "_index", None)
+
+
+class TestRates:
+    def test_btc_based_table_becomes_usd_based(self):
+        rates = parse_rates({"rates": {
+            "btc": {"value": 1.0, "type": "crypto"},
+            "usd": {"value": 60000.0, "type": "fiat"},
+            "eur": {"value": 30000.0, "type": "fiat"},
+        }})
+
+        assert rates == {"usd": 1.0, "eur": 0.5}
+
+    def test_filter_bounds_move_to_usd(self):
+        filters = {"current_price": (50.0, None), "price_change_percentage_24h": (1.0, 2.0)}
+
+        assert usd_bounds(filters, 0.5) == {"current_price": (100.0, None), "price_change_percentage_24h": (1.0, 2.0)}
+
+
+@pytest.mark.django_db
+class TestCurrencyParameter:
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_market_snapshot")
+    def test_list_converted_and_filtered_in_currency(self, mock_get_market_snapshot, mock_fetch_fx_rates, api_client):
+        mock_get_market_snapshot.return_value = SNAPSHOT
+        mock_fetch_fx_rates.return_value = RATES
+
+        response = api_client.get(reverse("crypto-list"), {"currency": "EUR", "min_price": 10000})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(coin["symbol"], coin["current_price"], coin["market_cap"]) for coin in response.data] == [("btc", 30000, 600)]
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_market_snapshot")
+    def test_usd_needs_no_rates(self, mock_get_market_snapshot, mock_fetch_fx_rates, api_client):
+        mock_get_market_snapshot.return_value = SNAPSHOT
+
+        response = api_client.get(reverse("crypto-list"))
+
+        assert response.data[0]["current_price"] == 60000
+        mock_fetch_fx_rates.assert_not_called()
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_market_snapshot")
+    def test_rate_refresh_changes_etag(self, mock_get_market_snapshot, mock_fetch_fx_rates, api_client):
+        mock_get_market_snapshot.return_value = SNAPSHOT
+        mock_fetch_fx_rates.return_value = RATES
+        cache.set("crypto_list", {"value": SNAPSHOT, "fetched_at": 1700000000.0, "stale_at": 1e12})
+        url = reverse("crypto-list")
+
+        # Untagged until the rate table is cached
+        assert "ETag" not in api_client.get(url, {"currency": "eur"})
+        first = api_client.get(url, {"currency": "eur"})
+        assert api_client.get(url, {"currency": "eur"}, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == status.HTTP_304_NOT_MODIFIED
+        cache.delete("fx_rates")
+        invalidate("fx_rates")
+        api_client.get(url, {"currency": "eur"})
+        second = api_client.get(url, {"currency": "eur"}, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        assert second.status_code == status.HTTP_200_OK
+        assert second["ETag"] != first["ETag"]
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_cached_data")
+    def test_detail_unknown_currency(self, mock_get_cached_data, mock_fetch_fx_rates, api_client):
+        mock_get_cached_data.return_value = {"name": "Bitcoin", "market_data": {"current_price": {"usd": 60000}}}
+        mock_fetch_fx_rates.return_value = RATES
+        url = reverse("crypto-details", kwargs={"slug": "bitcoin"})
+
+        assert api_client.get(url, {"currency": "jpy"}).data["current_price"] == 9000000
+        assert api_client.get(url, {"currency": "xyz"}).status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(url, {"currency": "dollars!"}).status_code == status.HTTP_400_BAD_REQUEST
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.getChartData")
+    def test_chart_converted(self, mock_chart, mock_fetch_fx_rates, api_client):
+        mock_chart.return_value = [{"timestamp": 1, "open": 2.0, "high": 4.0, "low": 1.0, "close": 3.0}]
+        mock_fetch_fx_rates.return_value = RATES
+
+        response = api_client.get(reverse("crypto-chart", args=["bitcoin"]), {"chart_type": "candlestick", "currency": "eur"})
+
+        assert response.data["chart_data"] == [{"timestamp": 1, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5}]
+        # The cached series itself stays in USD
+        mock_chart.assert_called_once_with("bitcoin", "daily", "candlestick", None)
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_prices")
+    def test_summary_converted(self, mock_get_prices, mock_fetch_fx_rates, api_client):
+        mock_get_prices.return_value = {"bitcoin": {"usd": 150}}
+        mock_fetch_fx_rates.return_value = RATES
+        user = get_user_model().objects.create_user(username="trader", email="trader@example.com", password="secret123")
+        api_client.force_authenticate(user=user)
+        api_client.post(reverse("portfolio-transaction"), {"coin_id": "bitcoin", "amount": "2", "price_usd": "100", "type": "buy"}, format="json")
+
+        response = api_client.get(reverse("portfolio-summary"), {"currency": "eur"})
+
+        assert response.data[0]["current_price"] == 75
+        assert response.data[0]["total_spent"] == 100
+        assert response.data[0]["profit_loss"] == 50
+
+    @patch("portfolio.fx.fetch_fx_rates")
+    @patch("portfolio.views.get_market_snapshot")
+    def test_rates_unavailable(self, mock_get_market_snapshot, mock_fetch_fx_rates, api_client):
+        mock_get_market_snapshot.return_value = SNAPSHOT
+        mock_fetch_fx_rates.return_value = {"error": "Failed to fetch data from CoinGecko"}
+
+        assert api_client.get(reverse("crypto-list"), {"currency": "eur"}).status_code == status.HTTP_502_BAD_GATEWAY
+        assert api_client.get(reverse("crypto-list")).status_code == status.HTTP_200_OK
+
+    @patch("portfolio.fx.afetch_fx_rates", new_callable=AsyncMock)
+    @patch("portfolio.async_views.aget_market_snapshot", new_callable=AsyncMock)
+    def test_async_list(self, mock_get_market_snapshot, mock_fetch_fx_rates):
+        mock_get_market_snapshot.return_value = SNAPSHOT
+        mock_fetch_fx_rates.return_value = RATES
+
+        request = AsyncRequestFactory().get("/crypto/", {"currency": "jpy", "max_market_cap": 100000})
+        response = async_to_sync(AsyncCryptoListView.as_view())(request)
+
+        assert [coin["current_price"] for coin in json.loads(response.content)] == [450000]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConsumerCurrency:
+    @patch("portfolio.fx.afetch_fx_rates", new_callable=AsyncMock)
+    @patch("portfolio.broadcast.getChartDataAsync", new_callable=AsyncMock)
+    @patch("portfolio.consumers.getChartDataAsync", new_callable=AsyncMock)
+    def test_one_stream_per_currency(self, mock_chart, mock_producer_chart, mock_fetch_fx_rates):
+        mock_chart.return_value = mock_producer_chart.return_value = [{"timestamp": 1, "price": 100.0}]
+        mock_fetch_fx_rates.return_value = RATES
+
+        async def scenario():
+            usd, eur = [WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/crypto/bitcoin/") for _ in range(2)]
+            for communicator in (usd, eur):
+                await communicator.connect()
+                await communicator.receive_from()
+            await eur.send_to(text_data=json.dumps({"interval_type": "daily", "currency": "eur"}))
+            snapshot = json.loads(await eur.receive_from())
+            await eur.receive_from()
+            await eur.send_to(text_data=json.dumps({"interval_type": "daily", "currency": "xyz"}))
+            invalid = json.loads(await eur.receive_from())
+
+            producer = broadcast._producers[("bitcoin", "daily", "line")]
+            await producer.publish()
+            updates = [json.loads(await communicator.receive_from()) for communicator in (usd, eur)]
+
+            for communicator in (usd, eur):
+                await communicator.disconnect()
+            return snapshot, invalid, updates
+
+        snapshot, invalid, updates = async_to_sync(scenario)()
+
+        assert snapshot["chart_data"] == [{"timestamp": 1, "price": 50.0}]
+        assert invalid == {"error": "Unsupported currency: xyz"}
+        assert [update["chart_data"][0]["price"] for update in updates] == [100.0, 50.0]
+        mock_producer_chart.assert_awaited()
@@ -0,0 +1,96 @@
+import time
+from unittest.mock import patch
+import httpx
+import pytest
+from django.core.cache import cache
+from portfolio import caching, markets
+from portfolio.caching import unwrap
+from portfolio.markets import MARKETS_PAGE_SIZE, MarketIndex, fetch_market_snapshot, get_market_snapshot, market_index
+
+
+@pytest.fixture(autouse=True)
+def snapshot_size(settings):
+    settings.MARKET_SNAPSHOT_SIZE = 600
+
+
+def coins(count, start=0):
+    return [{"id": f"coin{i}", "market_cap_rank": i + 1} for i in range(start, start + count)]
+
+
+class TestMarketSnapshot:
+    @patch("portfolio.markets.coingecko.get")
+    def test_fetches_pages_up_to_snapshot_size(self, mock_get):
+        mock_get.side_effect = lambda path, params, priority: httpx.Response(
+            200, json=coins(MARKETS_PAGE_SIZE, (params["page"] - 1) * MARKETS_PAGE_SIZE)
+        )
+
+        snapshot = fetch_market_snapshot()
+
+        assert len(snapshot) == 600
+        assert snapshot[-1]["id"] == "coin599"
+        assert [call.kwargs["params"]["page"] for call in mock_get.call_args_list] == [1, 2, 3]
+
+    @patch("portfolio.markets.coingecko.get")
+    def test_cold_miss_fetches_first_page_only(self, mock_get):
+        mock_get.side_effect = lambda path, params, priority: httpx.Response(
+            200, json=coins(MARKETS_PAGE_SIZE, (params["page"] - 1) * MARKETS_PAGE_SIZE)
+        )
+
+        assert len(get_market_snapshot()) == MARKETS_PAGE_SIZE
+        assert [call.kwargs["params"]["page"] for call in mock_get.call_args_list] == [1]
+        assert len(unwrap(cache.get("crypto_list"))[0]) == MARKETS_PAGE_SIZE
+
+    @patch("portfolio.markets.coingecko.get")
+    def test_stale_refresh_keeps_the_poller_snapshot(self, mock_get):
+        mock_get.return_value = httpx.Response(200, json=coins(MARKETS_PAGE_SIZE, 1))
+        cache.set("crypto_list", {"value": coins(600), "fetched_at": 1700000000.0, "stale_at": 0})
+
+        assert len(get_market_snapshot()) == 600
+        deadline = time.monotonic() + 2
+        while caching._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        snapshot = unwrap(cache.get("crypto_list"))[0]
+        assert len(snapshot) == 600
+        # The refetched first page leads; coin0 fell off it and now ranks right behind
+        assert [coin["id"] for coin in snapshot[249:252]] == ["coin250", "coin0", "coin251"]
+
+    @patch("portfolio.markets.coingecko.get")
+    def test_short_page_ends_snapshot(self, mock_get):
+        mock_get.side_effect = [httpx.Response(200, json=coins(MARKETS_PAGE_SIZE)), httpx.Response(200, json=coins(10, 250))]
+
+        assert len(fetch_market_snapshot()) == 260
+        assert mock_get.call_count == 2
+
+    @patch("portfolio.markets.coingecko.get")
+    def test_failed_tail_keeps_top_coins(self, mock_get):
+        mock_get.side_effect = [httpx.Response(200, json=coins(MARKETS_PAGE_SIZE)), httpx.Response(429)]
+
+        assert len(fetch_market_snapshot()) == MARKETS_PAGE_SIZE
+
+    @patch("portfolio.markets.coingecko.get")
+    def test_failed_first_page_is_an_error(self, mock_get):
+        mock_get.side_effect = httpx.ConnectError("down")
+
+        assert "error" in fetch_market_snapshot()
+        assert cache.get("crypto_list") is None
+
+
+class TestMarketIndex:
+    def test_index_is_reused_per_snapshot_version(self, monkeypatch):
+        monkeypatch.setattr(markets, "_index", None)
+        version = 1700000000.5
+
+        first = market_index(coins(3), version)
+
+        assert market_index(coins(3), version) is first
+        assert market_index(coins(3), version + 1) is not first
+        assert market_index(coins(3), None) is not market_index(coins(3), None)
+
+    def test_query_pages_filtered_order(self):
+        index = MarketIndex([{"id": "a", "current_price": 3}, {"id": "b", "current_price": 1}, {"id": "c", "current_price": 2}])
+
+        total, page = index.query(sort="current_price", descending=True, filters={"current_price": (1.5, None)}, page_size=1)
+
+        assert total == 2
+        assert [coin["id"] for coin in page] == ["a"]
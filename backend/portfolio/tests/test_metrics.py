@@ -0,0 +1,138 @@
+import asyncio
+from unittest.mock import patch
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from conftest import api_client
+from portfolio import coingecko
+from portfolio.caching import get_or_fetch
+from portfolio.metrics import endpoint_label
+from portfolio.ratelimit import RateLimiter
+from portfolio.routing import websocket_urlpatterns
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+class TestMetricsView:
+    @patch("portfolio.views.get_market_snapshot")
+    def test_exposes_view_latency(self, mock_get_market_snapshot, api_client):
+        mock_get_market_snapshot.return_value = []
+        labels = {"view": "crypto-list", "method": "GET", "status": "200"}
+        before = sample("http_request_duration_seconds_count", **labels)
+
+        api_client.get(reverse("crypto-list"))
+        response = api_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain")
+        assert b"http_request_duration_seconds_bucket" in response.content
+        assert sample("http_request_duration_seconds_count", **labels) == before + 1
+
+    def test_token_is_required_when_configured(self, api_client, settings):
+        settings.METRICS_TOKEN = "scrape-me"
+
+        assert api_client.get("/metrics").status_code == 401
+        assert api_client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code == 401
+        assert api_client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-me").status_code == 200
+
+
+class TestUpstreamMetrics:
+    @pytest.fixture(autouse=True)
+    def fresh_limiter(self, monkeypatch):
+        monkeypatch.setattr(coingecko, "limiter", RateLimiter())
+
+    def test_endpoint_label_hides_coin_ids(self):
+        assert endpoint_label("/coins/bitcoin/market_chart/range") == "/coins/{id}/market_chart/range"
+        assert endpoint_label("/coins/ethereum") == "/coins/{id}"
+        assert endpoint_label("/coins/markets") == "/coins/markets"
+        assert endpoint_label("/simple/price") == "/simple/price"
+
+    @patch("portfolio.coingecko.get_client")
+    def test_calls_counted_by_endpoint_and_status(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = [httpx.Response(200, json={}), httpx.ConnectError("down")]
+        labels = {"endpoint": "/coins/{id}"}
+        ok, failed = sample("coingecko_requests_total", status="200", **labels), sample("coingecko_requests_total", status="error", **labels)
+
+        coingecko.get("/coins/bitcoin")
+        with pytest.raises(httpx.ConnectError):
+            coingecko.get("/coins/bitcoin")
+
+        assert sample("coingecko_requests_total", status="200", **labels) == ok + 1
+        assert sample("coingecko_requests_total", status="error", **labels) == failed + 1
+        assert sample("coingecko_request_duration_seconds_count", **labels) >= 2
+
+    @patch("portfolio.coingecko.get_client")
+    def test_pool_usage_counts_requests_in_flight(self, mock_get_client, monkeypatch):
+        monkeypatch.setattr(coingecko, "usage", coingecko.PoolUsage())
+
+        def send(path, params=None):
+            assert coingecko.pool_stats()["sync"]["in_flight"] == 1
+            return httpx.Response(200, json={})
+
+        mock_get_client.return_value.get.side_effect = send
+        coingecko.get("/coins/bitcoin")
+
+        stats = coingecko.pool_stats()["sync"]
+        assert (stats["in_flight"], stats["peak_in_flight"], stats["waiting"]) == (0, 1, 0)
+
+    def test_reset_closes_async_clients(self):
+        async def open_client():
+            return coingecko.get_async_client()
+
+        loop = asyncio.new_event_loop()
+        try:
+            client = loop.run_until_complete(open_client())
+            coingecko.reset_clients()
+            assert client.is_closed
+        finally:
+            loop.close()
+
+
+class TestCacheMetrics:
+    def test_lookups_counted_per_family(self):
+        before = {result: sample("cache_lookups_total", family="crypto_detail", result=result) for result in ("miss", "fresh_hit")}
+
+        get_or_fetch("crypto_detail_bitcoin", lambda: {"id": "bitcoin"})
+        get_or_fetch("crypto_detail_bitcoin", lambda: {"id": "bitcoin"})
+
+        assert sample("cache_lookups_total", family="crypto_detail", result="miss") == before["miss"] + 1
+        assert sample("cache_lookups_total", family="crypto_detail", result="fresh_hit") == before["fresh_hit"] + 1
+
+    def test_unknown_families_are_lumped(self):
+        before = sample("cache_lookups_total", family="other", result="miss")
+
+        get_or_fetch("one_off_key_123", lambda: 1)
+
+        assert sample("cache_lookups_total", family="other", result="miss") == before + 1
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWebSocketMetrics:
+    @patch("portfolio.broadcast.getChartDataAsync")
+    @patch("portfolio.consumers.getChartDataAsync")
+    def test_connections_and_bytes(self, mock_chart, mock_producer_chart):
+        mock_chart.return_value = mock_producer_chart.return_value = [{"timestamp": 1, "price": 1.0}]
+
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/crypto/bitcoin/")
+            await communicator.connect()
+            snapshot = await communicator.receive_from()
+            connected = sample("websocket_connections")
+            await communicator.disconnect()
+            return snapshot, connected
+
+        open_before = sample("websocket_connections")
+        bytes_before = sample("websocket_message_bytes_total", format="json")
+
+        snapshot, connected = async_to_sync(scenario)()
+
+        assert connected == open_before + 1
+        assert sample("websocket_connections") == open_before
+        assert sample("websocket_message_bytes_total", format="json") == bytes_before + len(snapshot.encode())
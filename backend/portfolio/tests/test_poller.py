@@ -0,0 +1,55 @@
+from unittest.mock import patch, AsyncMock
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from portfolio.caching import unwrap
+from portfolio.models import PortfolioHolding, FavoriteCoin
+from portfolio.poller import MarketDataPoller
+
+User = get_user_model()
+
+MARKETS = [{"id": f"coin{i}", "name": f"Coin {i}"} for i in range(30)]
+
+
+def upstream(path, params=None, priority=None):
+    if path == "/coins/markets":
+        return httpx.Response(200, json=MARKETS[:params["per_page"]])
+    if path == "/simple/price":
+        return httpx.Response(200, json={coin_id: {"usd": 1.0} for coin_id in params["ids"].split(",")})
+    return httpx.Response(200, json={"id": path.rsplit("/", 1)[-1]})
+
+
+@pytest.mark.django_db
+class TestMarketDataPoller:
+    @patch("portfolio.poller.coingecko.aget", new_callable=AsyncMock)
+    def test_poll_once_warms_cache_keys(self, mock_aget):
+        mock_aget.side_effect = upstream
+        user = User.objects.create_user(username="trader", email="trader@example.com", password="secret123")
+        PortfolioHolding.objects.create(user=user, coin_id="bitcoin", amount=1)
+        PortfolioHolding.objects.create(user=user, coin_id="ethereum", amount=1)
+        FavoriteCoin.objects.create(user=user, coin_id="solana")
+
+        poller = MarketDataPoller(top_n=3, calls_per_minute=60000, interval=1)
+        async_to_sync(poller.poll_once)()
+
+        assert len(unwrap(cache.get("crypto_list"))[0]) == 30
+        for coin_id in ["bitcoin", "ethereum", "solana"]:
+            assert unwrap(cache.get(f"coingecko_prices_{coin_id}"))[0] == {"usd": 1.0}
+        for coin_id in ["coin0", "coin2", "bitcoin", "ethereum", "solana"]:
+            assert unwrap(cache.get(f"crypto_detail_{coin_id}"))[0] == {"id": coin_id}
+        assert cache.get("crypto_detail_coin3") is None
+
+        paths = [call.args[0] for call in mock_aget.await_args_list]
+        assert paths.count("/simple/price") == 1
+        assert {call.kwargs["priority"] for call in mock_aget.await_args_list} == {"background"}
+
+    @patch("portfolio.poller.coingecko.aget", new_callable=AsyncMock)
+    def test_failed_call_leaves_cache_untouched(self, mock_aget):
+        mock_aget.return_value = httpx.Response(429, json={})
+
+        poller = MarketDataPoller(top_n=3, calls_per_minute=60000, interval=1)
+        async_to_sync(poller.poll_once)()
+
+        assert cache.get("crypto_list") is None
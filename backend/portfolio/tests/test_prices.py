@@ -0,0 +1,56 @@
+from unittest.mock import patch
+import httpx
+from django.core.cache import cache
+from portfolio import caching
+from portfolio.caching import make_entry, store_many, unwrap
+from portfolio.prices import PRICE_FAMILY, batch_ids, get_prices, price_cache_key
+
+
+def simple_price(path, params=None, priority=None):
+    return httpx.Response(200, json={coin_id: {"usd": 2.0} for coin_id in params["ids"].split(",")})
+
+
+class TestGetPrices:
+    def test_batches_fit_url_length(self):
+        # "aaaa%2Cbbbb" is 11 characters once the comma is encoded
+        assert batch_ids(["aaaa", "bbbb", "cccc"], max_length=11) == [["aaaa", "bbbb"], ["cccc"]]
+        assert batch_ids(["aaaa", "bbbb", "cccc"], max_length=10) == [["aaaa"], ["bbbb"], ["cccc"]]
+        assert batch_ids([]) == []
+
+    @patch("portfolio.prices.coingecko.get")
+    def test_fetches_only_missing_coins(self, mock_get):
+        mock_get.side_effect = simple_price
+        store_many({price_cache_key("bitcoin"): {"usd": 1.0}}, PRICE_FAMILY)
+
+        prices = get_prices(["bitcoin", "ethereum", "solana"])
+
+        assert prices == {"bitcoin": {"usd": 1.0}, "ethereum": {"usd": 2.0}, "solana": {"usd": 2.0}}
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.kwargs["params"]["ids"] == "ethereum,solana"
+        assert unwrap(cache.get(price_cache_key("solana")))[0] == {"usd": 2.0}
+
+    @patch("portfolio.prices.coingecko.get")
+    def test_shared_across_portfolios(self, mock_get):
+        mock_get.side_effect = simple_price
+        get_prices(["bitcoin", "ethereum"])
+
+        assert get_prices(["ethereum"]) == {"ethereum": {"usd": 2.0}}
+        assert mock_get.call_count == 1
+
+    @patch("portfolio.prices.coingecko.get")
+    def test_stale_prices_ride_along_with_missing(self, mock_get):
+        mock_get.side_effect = simple_price
+        entry = make_entry({"usd": 1.0}, PRICE_FAMILY)
+        entry["stale_at"] = entry["fetched_at"] - 1
+        cache.set(price_cache_key("bitcoin"), entry)
+
+        assert get_prices(["bitcoin", "ethereum"])["bitcoin"] == {"usd": 2.0}
+        assert mock_get.call_args.kwargs["params"]["ids"] == "ethereum,bitcoin"
+        assert not caching._refreshing
+
+    @patch("portfolio.prices.coingecko.get")
+    def test_failed_fetch_leaves_coins_out(self, mock_get):
+        mock_get.return_value = httpx.Response(429)
+
+        assert get_prices(["bitcoin"]) == {}
+        assert cache.get(price_cache_key("bitcoin")) is None
@@ -0,0 +1,88 @@
+from unittest.mock import patch
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from portfolio import coingecko
+from portfolio.ratelimit import (
+    BACKGROUND, BLOCKED_UNTIL_KEY, INTERACTIVE, RateLimited, RateLimiter, retry_after_seconds,
+)
+
+
+@pytest.fixture(autouse=True)
+def rate_limits(settings):
+    settings.COINGECKO_RATE_LIMIT_PER_MINUTE = 60
+    settings.COINGECKO_RATE_LIMIT_BURST = 3
+    settings.COINGECKO_RATE_LIMIT_RESERVE = 2
+    settings.COINGECKO_RATE_LIMIT_MAX_WAIT = 0.05
+    settings.COINGECKO_BACKOFF_BASE = 0.01
+
+
+class TestRateLimiter:
+    def test_background_leaves_reserve_for_interactive(self):
+        rate_limiter = RateLimiter()
+        rate_limiter.acquire(BACKGROUND)
+
+        # One token left for background is inside the reserve, so it has to queue
+        wait, tokens = rate_limiter.bucket.take(rate_limiter.reserve(BACKGROUND))
+        assert wait > 0
+        rate_limiter.acquire(INTERACTIVE)
+        rate_limiter.acquire(INTERACTIVE)
+
+        with pytest.raises(RateLimited):
+            rate_limiter.acquire(INTERACTIVE)
+        assert rate_limiter.stats.snapshot()["priorities"][INTERACTIVE]["rejected"] == 1
+
+    def test_async_acquire_waits_for_refill(self, settings):
+        settings.COINGECKO_RATE_LIMIT_PER_MINUTE = 600
+        settings.COINGECKO_RATE_LIMIT_MAX_WAIT = 1
+        rate_limiter = RateLimiter()
+
+        async def scenario():
+            for _ in range(5):
+                await rate_limiter.aacquire(INTERACTIVE)
+
+        async_to_sync(scenario)()
+
+        stats = rate_limiter.stats.snapshot()["priorities"][INTERACTIVE]
+        assert stats["acquired"] == 5
+        assert stats["waited"] >= 1
+        assert stats["waiting"] == 0
+
+    def test_retry_after_header(self):
+        assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "7"})) == 7
+        assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+        assert retry_after_seconds(httpx.Response(429)) is None
+
+
+class TestRateLimitedClient:
+    @pytest.fixture(autouse=True)
+    def fresh_limiter(self, monkeypatch):
+        monkeypatch.setattr(coingecko, "limiter", RateLimiter())
+
+    @patch("portfolio.coingecko.get_client")
+    def test_429_is_retried_after_backoff(self, mock_get_client):
+        mock_get_client.return_value.get.side_effect = [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json=["bitcoin"]),
+        ]
+
+        response = coingecko.get("/coins/markets")
+
+        assert response.json() == ["bitcoin"]
+        assert coingecko.limiter.stats.snapshot()["priorities"][INTERACTIVE]["throttled"] == 1
+        assert cache.get(BLOCKED_UNTIL_KEY) is not None
+
+    @patch("portfolio.coingecko.get_client")
+    def test_gives_up_after_max_retries(self, mock_get_client, settings):
+        settings.COINGECKO_MAX_RETRIES = 1
+        mock_get_client.return_value.get.return_value = httpx.Response(429, headers={"Retry-After": "0"})
+
+        assert coingecko.get("/coins/markets").status_code == 429
+        assert mock_get_client.return_value.get.call_count == 2
+
+    def test_long_retry_after_fails_fast_for_interactive(self):
+        cache.set(BLOCKED_UNTIL_KEY, 2e9)
+
+        with pytest.raises(httpx.RequestError):
+            coingecko.get("/coins/markets")
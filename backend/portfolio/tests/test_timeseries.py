@@ -0,0 +1,104 @@
+from unittest.mock import patch, AsyncMock
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from portfolio import timeseries
+from portfolio.models import ChartPoint
+
+HOUR = 60 * 60 * 1000
+NOW = 1_700_000_000_000
+
+
+def load(*args):
+    return async_to_sync(timeseries.aload_series)(*args)
+
+
+@pytest.fixture(autouse=True)
+def frozen_now():
+    with patch("portfolio.timeseries.now_ms", return_value=NOW):
+        yield
+
+
+@pytest.mark.django_db
+class TestLoadSeries:
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_first_load_fetches_full_window(self, mock_aget):
+        prices = [[NOW - 3 * HOUR, 1.0], [NOW - 2 * HOUR, 2.0], [NOW - HOUR, 3.0]]
+        mock_aget.return_value = httpx.Response(200, json={"prices": prices})
+
+        data = load("bitcoin", "hourly", "line")
+
+        assert data == [{"timestamp": ts, "price": price} for ts, price in prices]
+        assert mock_aget.await_args.args[0] == "/coins/bitcoin/market_chart"
+        assert ChartPoint.objects.count() == 3
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_fetches_only_missing_tail(self, mock_aget):
+        for ts, price in [(NOW - 3 * HOUR, 1.0), (NOW - 2 * HOUR + 10, 2.0)]:
+            ChartPoint.objects.create(coin_id="bitcoin", interval_type="hourly", chart_type="line", timestamp=ts, price=price)
+
+        # The range endpoint returns 5-minute points for short ranges
+        tail = [[NOW - 2 * HOUR + 5 * 60 * 1000 * i, 10.0 + i] for i in range(1, 24)]
+        mock_aget.return_value = httpx.Response(200, json={"prices": tail})
+
+        data = load("bitcoin", "hourly", "line")
+
+        path, params = mock_aget.await_args.args[0], mock_aget.await_args.kwargs["params"]
+        assert path == "/coins/bitcoin/market_chart/range"
+        assert params["from"] == (NOW - 2 * HOUR + 10) // 1000
+        # One point per hour bucket: the stored live sample is superseded within its hour
+        buckets = [point["timestamp"] // HOUR for point in data]
+        assert buckets == sorted(set(buckets))
+        assert data[0] == {"timestamp": NOW - 3 * HOUR, "price": 1.0}
+        assert data[-1] == {"timestamp": tail[-1][0], "price": tail[-1][1]}
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_fresh_series_served_locally(self, mock_aget):
+        ChartPoint.objects.create(coin_id="bitcoin", interval_type="hourly", chart_type="line", timestamp=NOW - 60_000, price=5.0)
+
+        data = load("bitcoin", "hourly", "line")
+
+        mock_aget.assert_not_awaited()
+        assert data == [{"timestamp": NOW - 60_000, "price": 5.0}]
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_upstream_error_serves_stored_points(self, mock_aget):
+        ChartPoint.objects.create(coin_id="bitcoin", interval_type="daily", chart_type="candlestick",
+                                  timestamp=NOW - 10 * 24 * HOUR, open=1, high=2, low=0.5, close=1.5)
+        mock_aget.return_value = httpx.Response(429, json={"status": {"error_code": 429}})
+
+        data = load("bitcoin", "daily", "candlestick")
+
+        assert data == [{"timestamp": NOW - 10 * 24 * HOUR, "open": 1, "high": 2, "low": 0.5, "close": 1.5}]
+        assert mock_aget.await_args.kwargs["params"]["days"] == 90
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_upstream_error_without_history(self, mock_aget):
+        mock_aget.return_value = httpx.Response(404, json={"error": "coin not found"})
+
+        assert load("bitcoinz", "daily", "line") == {"error": {"error": "coin not found"}}
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    @patch("portfolio.timeseries.coingecko.get")
+    def test_sync_load_uses_sync_client(self, mock_get, mock_aget):
+        ChartPoint.objects.create(coin_id="bitcoin", interval_type="hourly", chart_type="line", timestamp=NOW - 2 * HOUR, price=1.0)
+        mock_get.return_value = httpx.Response(200, json={"prices": [[NOW - HOUR, 2.0]]})
+
+        data = timeseries.load_series("bitcoin", "hourly", "line")
+
+        assert data == [{"timestamp": NOW - 2 * HOUR, "price": 1.0}, {"timestamp": NOW - HOUR, "price": 2.0}]
+        assert mock_get.call_args.args[0] == "/coins/bitcoin/market_chart/range"
+        mock_aget.assert_not_awaited()
+
+    @patch("portfolio.timeseries.coingecko.aget", new_callable=AsyncMock)
+    def test_non_json_error_serves_stored_points(self, mock_aget):
+        ChartPoint.objects.create(coin_id="bitcoin", interval_type="hourly", chart_type="line", timestamp=NOW - 2 * HOUR, price=1.0)
+        mock_aget.return_value = httpx.Response(502, text="<html>Bad Gateway</html>")
+
+        assert load("bitcoin", "hourly", "line") == [{"timestamp": NOW - 2 * HOUR, "price": 1.0}]
+
+    @patch("portfolio.timeseries.coingecko.get")
+    def test_non_json_success_without_history(self, mock_get):
+        mock_get.return_value = httpx.Response(200, text="not json")
+
+        assert "error" in timeseries.load_series("bitcoin", "daily", "candlestick")
@@ -0,0 +1,245 @@
+import logging
+import time
+import httpx
+from . import coingecko
+from .models import ChartPoint
+
+# Days of history each series covers, as requested from CoinGecko
+SERIES_DAYS = {
+    "5min": 1,
+    "hourly": 30,
+    "daily": 365,
+}
+
+# Spacing of line points CoinGecko returns for each window
+LINE_STEP_MS = {
+    "5min": 5 * 60 * 1000,
+    "hourly": 60 * 60 * 1000,
+    "daily": 24 * 60 * 60 * 1000,
+}
+
+# /ohlc picks the candle width from `days` (1-2: 30 minutes, 3-30: 4 hours, 31+: 4 days),
+# so tails are fetched with the smallest `days` that keeps the width of the stored series
+CANDLE_STEP_MS = {
+    "5min": 30 * 60 * 1000,
+    "hourly": 4 * 60 * 60 * 1000,
+    "daily": 4 * 24 * 60 * 60 * 1000,
+}
+CANDLE_TAIL_DAYS = {
+    "5min": [1],
+    "hourly": [7, 14, 30],
+    "daily": [90, 180, 365],
+}
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def series_queryset(slug, interval_type, chart_type):
+    return ChartPoint.objects.filter(coin_id=slug, interval_type=interval_type, chart_type=chart_type)
+
+
+def format_points(points, chart_type):
+    if chart_type == "candlestick":
+        return [
+            {"timestamp": p.timestamp, "open": p.open, "high": p.high, "low": p.low, "close": p.close}
+            for p in points
+        ]
+    return [{"timestamp": p.timestamp, "price": p.price} for p in points]
+
+
+def bucket_line_points(prices, step):
+    """Keep the latest sample per step-wide bucket, so a finer-grained tail matches the stored resolution."""
+    buckets = {}
+    for ts, price in prices:
+        buckets[int(ts) // step] = (int(ts), price)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def upstream_error(response):
+    # Error bodies are not always JSON, e.g. a proxy's HTML page
+    try:
+        return {"error": response.json()}
+    except ValueError:
+        return {"error": f"CoinGecko returned {response.status_code}"}
+
+
+def line_request(slug, interval_type, since):
+    """(path, params) for the line points newer than `since` (ms), or the whole window when `since` is None."""
+    if since is None:
+        return f"/coins/{slug}/market_chart", {"vs_currency": "usd", "days": SERIES_DAYS.get(interval_type, 30)}
+    return f"/coins/{slug}/market_chart/range", {"vs_currency": "usd", "from": since // 1000, "to": now_ms() // 1000}
+
+
+def parse_line(response, interval_type, since):
+    if response.status_code != 200:
+        return upstream_error(response)
+
+    prices = [(int(ts), price) for ts, price in response.json().get("prices", []) if since is None or ts > since]
+    if since is not None:
+        prices = bucket_line_points(prices, LINE_STEP_MS.get(interval_type, LINE_STEP_MS["hourly"]))
+    return prices
+
+
+def fetch_line(slug, interval_type, since):
+    path, params = line_request(slug, interval_type, since)
+    return parse_line(coingecko.get(path, params=params), interval_type, since)
+
+
+async def afetch_line(slug, interval_type, since):
+    path, params = line_request(slug, interval_type, since)
+    return parse_line(await coingecko.aget(path, params=params), interval_type, since)
+
+
+def candle_request(slug, interval_type, since):
+    days = SERIES_DAYS.get(interval_type, 30)
+    if since is not None:
+        gap_days = (now_ms() - since) / DAY_MS
+        days = next((d for d in CANDLE_TAIL_DAYS.get(interval_type, [days]) if d >= gap_days), days)
+    return f"/coins/{slug}/ohlc", {"vs_currency": "usd", "days": days}
+
+
+def parse_candles(response, since):
+    if response.status_code != 200:
+        return upstream_error(response)
+
+    # The last stored candle may still have been open, so it is fetched again and revised
+    return [item for item in response.json() if since is None or item[0] >= since]
+
+
+def fetch_candles(slug, interval_type, since):
+    path, params = candle_request(slug, interval_type, since)
+    return parse_candles(coingecko.get(path, params=params), since)
+
+
+async def afetch_candles(slug, interval_type, since):
+    path, params = candle_request(slug, interval_type, since)
+    return parse_candles(await coingecko.aget(path, params=params), since)
+
+
+def series_step(interval_type, chart_type):
+    return (CANDLE_STEP_MS if chart_type == "candlestick" else LINE_STEP_MS).get(interval_type, LINE_STEP_MS["hourly"])
+
+
+def superseded_points(series, interval_type, chart_type, rows, since):
+    """Stored points a fetched line tail replaces, or None."""
+    if chart_type == "candlestick" or since is None or not rows:
+        return None
+    # A stored point in the first new bucket was a live sample that the tail supersedes
+    step = LINE_STEP_MS.get(interval_type, LINE_STEP_MS["hourly"])
+    return series.filter(timestamp__gte=rows[0][0] // step * step, timestamp__lt=rows[0][0])
+
+
+def build_points(slug, interval_type, chart_type, rows):
+    """(ChartPoint objects, fields a stored point takes over from a refetched one)."""
+    if chart_type == "candlestick":
+        points = [
+            ChartPoint(coin_id=slug, interval_type=interval_type, chart_type=chart_type,
+                       timestamp=int(item[0]), open=item[1], high=item[2], low=item[3], close=item[4])
+            for item in rows
+        ]
+        return points, ["open", "high", "low", "close"]
+    points = [
+        ChartPoint(coin_id=slug, interval_type=interval_type, chart_type=chart_type, timestamp=ts, price=price)
+        for ts, price in rows
+    ]
+    return points, ["price"]
+
+
+UPSERT_OPTIONS = {
+    "batch_size": 1000,
+    "update_conflicts": True,
+    "unique_fields": ["coin_id", "interval_type", "chart_type", "timestamp"],
+}
+
+
+def store_points(slug, interval_type, chart_type, rows, since):
+    superseded = superseded_points(series_queryset(slug, interval_type, chart_type), interval_type, chart_type, rows, since)
+    if superseded is not None:
+        superseded.delete()
+    points, update_fields = build_points(slug, interval_type, chart_type, rows)
+    if points:
+        ChartPoint.objects.bulk_create(points, update_fields=update_fields, **UPSERT_OPTIONS)
+
+
+async def astore_points(slug, interval_type, chart_type, rows, since):
+    superseded = superseded_points(series_queryset(slug, interval_type, chart_type), interval_type, chart_type, rows, since)
+    if superseded is not None:
+        await superseded.adelete()
+    points, update_fields = build_points(slug, interval_type, chart_type, rows)
+    if points:
+        await ChartPoint.objects.abulk_create(points, update_fields=update_fields, **UPSERT_OPTIONS)
+
+
+def series_since(last, window_start):
+    """Timestamp (ms) to fetch newer points from, or None to fetch the whole window."""
+    return last.timestamp if last is not None and last.timestamp >= window_start else None
+
+
+def load_series(slug, interval_type="daily", chart_type="line"):
+    """Chart series served from the local store, topped up with only the points CoinGecko has added since.
+
+    Falls back to the stored points if the upstream call fails.
+    """
+    series = series_queryset(slug, interval_type, chart_type)
+    now = now_ms()
+    window_start = now - SERIES_DAYS.get(interval_type, 30) * DAY_MS
+    step = series_step(interval_type, chart_type)
+
+    last = series.order_by("-timestamp").first()
+    since = series_since(last, window_start)
+
+    if since is None or now - since >= step:
+        fetch = fetch_candles if chart_type == "candlestick" else fetch_line
+        try:
+            rows = fetch(slug, interval_type, since)
+        except httpx.RequestError as e:
+            rows = {"error": f"Request failed: {str(e)}"}
+        except ValueError as e:
+            rows = {"error": f"Invalid response: {str(e)}"}
+
+        if isinstance(rows, dict):
+            if last is None:
+                return rows
+            logging.warning(f"Serving stored {slug} {interval_type} {chart_type} chart: {rows['error']}")
+        else:
+            logging.info(f"Fetched {len(rows)} new points for {slug} ({interval_type}, {chart_type}).")
+            store_points(slug, interval_type, chart_type, rows, since)
+            # Points that slid out of the window are no longer served
+            series.filter(timestamp__lt=window_start - step).delete()
+
+    return format_points(series.filter(timestamp__gte=window_start).order_by("timestamp"), chart_type)
+
+
+async def aload_series(slug, interval_type="daily", chart_type="line"):
+    series = series_queryset(slug, interval_type, chart_type)
+    now = now_ms()
+    window_start = now - SERIES_DAYS.get(interval_type, 30) * DAY_MS
+    step = series_step(interval_type, chart_type)
+
+    last = await series.order_by("-timestamp").afirst()
+    since = series_since(last, window_start)
+
+    if since is None or now - since >= step:
+        fetch = afetch_candles if chart_type == "candlestick" else afetch_line
+        try:
+            rows = await fetch(slug, interval_type, since)
+        except httpx.RequestError as e:
+            rows = {"error": f"Request failed: {str(e)}"}
+        except ValueError as e:
+            rows = {"error": f"Invalid response: {str(e)}"}
+
+        if isinstance(rows, dict):
+            if last is None:
+                return rows
+            logging.warning(f"Serving stored {slug} {interval_type} {chart_type} chart: {rows['error']}")
+        else:
+            logging.info(f"Fetched {len(rows)} new points for {slug} ({interval_type}, {chart_type}).")
+            await astore_points(slug, interval_type, chart_type, rows, since)
+            await series.filter(timestamp__lt=window_start - step).adelete()
+
+    points = [point async for point in series.filter(timestamp__gte=window_start).order_by("timestamp")]
+    return format_points(points, chart_type)
@@ -1,10 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from .views import CryptoListView, CryptoDetailView, PortfolioTransactionView, PortfolioSummaryView, FavoriteCoinView
+from .middleware import compress_response
+from .views import CryptoListView, CryptoDetailView, ChartView, CoinSearchView, PortfolioTransactionView, PortfolioSummaryView, PortfolioHistoryView, PortfolioImportView, FavoriteCoinView, PriceAlertView, UpstreamPoolStatsView, metrics_view
+
+if settings.ASYNC_VIEWS:
+    # Served natively under ASGI without a sync_to_async thread per request
+    from .async_views import AsyncCryptoListView as CryptoListView, AsyncCryptoDetailView as CryptoDetailView, AsyncChartView as ChartView, AsyncCoinSearchView as CoinSearchView, AsyncPortfolioSummaryView as PortfolioSummaryView, AsyncPortfolioHistoryView as PortfolioHistoryView
 
 urlpatterns = [
-    path('', CryptoListView.as_view(), name='crypto-list'),
-    path('details/<slug:slug>/', CryptoDetailView.as_view(), name='crypto-details'),
+    path('', compress_response(CryptoListView.as_view()), name='crypto-list'),
+    path('details/<slug:slug>/', compress_response(CryptoDetailView.as_view()), name='crypto-details'),
+    path('charts/<slug:slug>/', compress_response(ChartView.as_view()), name='crypto-chart'),
+    path('search/', CoinSearchView.as_view(), name='coin-search'),
     path("portfolio/transactions/", PortfolioTransactionView.as_view(), name="portfolio-transaction"),
+    path("portfolio/transactions/import/", PortfolioImportView.as_view(), name="portfolio-import"),
     path("portfolio/summary/", PortfolioSummaryView.as_view(), name="portfolio-summary"),
+    path("portfolio/history/", PortfolioHistoryView.as_view(), name="portfolio-history"),
     path("favorites/", FavoriteCoinView.as_view(), name="favorite-coins"),
+    path("alerts/", PriceAlertView.as_view(), name="price-alerts"),
+    path("upstream/stats/", UpstreamPoolStatsView.as_view(), name="upstream-stats"),
+    path("metrics", metrics_view, name="metrics"),
 ]
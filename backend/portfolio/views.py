@@ -1,172 +1,376 @@
-import logging
-import requests
-from django.core.cache import cache
-from django.db import IntegrityError
+import secrets
+from datetime import datetime, time
+from decimal import Decimal
+import httpx
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .models import PortfolioTransaction, FavoriteCoin
-from .serializers import PortfolioTransactionSerializer, FavoriteCoinSerializer
+from rest_framework.utils.urls import replace_query_param
+from . import coingecko
+from .broadcast import CHART_REFRESH_INTERVALS, snapshot_message
+from .caching import entry_version, get_or_fetch, is_error, refresh_stats, tier_stats
+from .downsampling import parse_max_points
+from .encoding import CHART_FIELDS
+from .fx import convert, convert_coins, convert_decimal, convert_points, fx_version, parse_currency, usd_bounds, usd_rate
+from .history import get_portfolio_history
+from .holdings import aggregate_holdings, apply_transaction
+from .imports import IMPORT_FORMATS, detect_format, import_transactions, read_rows
+from .markets import MARKETS_CACHE_KEY, get_market_snapshot, market_index, parse_market_query, refresh_market_snapshot
+from .models import PortfolioTransaction, PortfolioHolding, FavoriteCoin, PriceAlert
+from .pagination import TransactionCursorPagination
+from .prices import get_prices
+from .ratelimit import limiter
+from .search import get_search_index, parse_search_query
+from .serializers import PortfolioTransactionSerializer, FavoriteCoinSerializer, PriceAlertSerializer
+from .services import getChartData
 
 
 def get_cached_data(cache_key, url, params=None):
-    cached_data = cache.get(cache_key)
+    def fetch():
+        try:
+            response = coingecko.get(url, params=params)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": "Failed to fetch data from CoinGecko"}
+        except httpx.RequestError as e:
+            return {"error": f"Request failed: {str(e)}"}
 
-    if cached_data:
-        logging.info(f"Cache hit for {cache_key}")
-        return cached_data
+    # Concurrent misses on the same key share one upstream call; TTLs come from settings.CACHE_TTLS
+    return get_or_fetch(cache_key, fetch)
 
-    logging.info(f"Cache miss for {cache_key}. Fetching from API.")
 
+def parse_query_datetime(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter; a bare date_to covers the whole day."""
     try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            cache.set(cache_key, data, timeout=60 * 60)  # Cash for 60 minutes
-            return data
-        else:
-            return {"error": "Failed to fetch data from CoinGecko"}
-    except requests.RequestException as e:
-        return {"error": f"Request failed: {str(e)}"}
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        return None
+    if moment is None:
+        if day is None:
+            return None
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+# Market responses are versioned by the fetch time of the cache entry behind them
+def version_etag(version):
+    return quote_etag(format(int(version * 1000), "x"))
+
+
+def not_modified(request, version):
+    """A 304 response if the client already holds this version, else None."""
+    if version is None:
+        return None
+    response = get_conditional_response(request, etag=version_etag(version), last_modified=int(version))
+    return add_version_headers(response, version) if response is not None else None
+
+
+def add_version_headers(response, version):
+    if version is not None:
+        response["ETag"] = version_etag(version)
+        response["Last-Modified"] = http_date(version)
+    # Pollers revalidate every time instead of trusting a heuristic freshness lifetime
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def add_page_headers(response, request, total, page, page_size):
+    # The body stays a plain list of coins; the total and neighbouring pages travel in headers
+    response["X-Total-Count"] = str(total)
+    url = request.build_absolute_uri()
+    links = []
+    if page > 1:
+        links.append(f'<{replace_query_param(url, "page", page - 1)}>; rel="prev"')
+    if page * page_size < total:
+        links.append(f'<{replace_query_param(url, "page", page + 1)}>; rel="next"')
+    if links:
+        response["Link"] = ", ".join(links)
+    return response
+
+
+# Response shaping is shared by the DRF views and their async counterparts in async_views
+def format_crypto_list(data, rate=1):
+    return [
+        {
+            "name": coin.get("name"),
+            "image": coin.get("image"),
+            "symbol": coin.get("symbol"),
+            "current_price": coin.get("current_price"),
+            "market_cap": coin.get("market_cap"),
+            "market_cap_rank": coin.get("market_cap_rank")
+        }
+        for coin in convert_coins(data, rate)
+    ]
+
+
+def format_crypto_detail(data, rate=1):
+    return {
+        "name": data.get("name"),
+        "image": data.get("image", {}).get("thumb"),
+        "symbol": data.get("symbol"),
+        "current_price": convert(data.get("market_data", {}).get("current_price", {}).get("usd", "N/A"), rate),
+        "rank": data.get("market_cap_rank", "N/A"),  # Rating on CoinGecko
+        "price_change_percentage_24h": data.get("market_data", {}).get("price_change_percentage_24h", "N/A"), # Change in 24 hours
+        "market_cap": convert(data.get("market_data", {}).get("market_cap", {}).get("usd", "N/A"), rate),
+        "total_volume": convert(data.get("market_data", {}).get("total_volume", {}).get("usd", "N/A"), rate),
+        "total_supply": data.get("market_data", {}).get("total_supply", "N/A"),  # may be none
+        "max_supply": data.get("market_data", {}).get("max_supply", "N/A"),  # may be none
+        "circulating_supply": data.get("market_data", {}).get("circulating_supply", "N/A"),  # may be none
+        "fdv": convert(data.get("market_data", {}).get("fully_diluted_valuation", {}).get("usd", "N/A"), rate),
+        "high_24h": convert(data.get("market_data", {}).get("high_24h", {}).get("usd", "N/A"), rate),  # Lowest
+        "low_24h": convert(data.get("market_data", {}).get("low_24h", {}).get("usd", "N/A"), rate),  # And Highest price in 24h
+        "ath": convert(data.get("market_data", {}).get("ath", {}).get("usd", "N/A"), rate),  # The Highest price of all time
+    }
+
+
+def parse_chart_query(params):
+    """(interval_type, chart_type, max_points) from chart query parameters; raises ValueError."""
+    interval_type = params.get("interval_type", "daily")
+    chart_type = params.get("chart_type", "line")
+    if interval_type not in CHART_REFRESH_INTERVALS or chart_type not in CHART_FIELDS:
+        raise ValueError("Invalid interval type or chart type.")
+    try:
+        max_points = parse_max_points(params.get("max_points"), params.get("width"))
+    except ValueError as e:
+        raise ValueError(f"Invalid max_points: {str(e)}")
+    return interval_type, chart_type, max_points
+
+
+def summary_from_holdings(holdings):
+    return {holding.coin_id: {"amount": holding.amount, "total_spent": holding.total_spent} for holding in holdings}
+
+
+def summary_from_ledger(rows):
+    return {row["coin_id"]: {"amount": row["net_amount"], "total_spent": row["net_spent"]} for row in rows}
+
+
+def summarize_portfolio(summary, prices, rate=1):
+    portfolio_data = []
+    for coin_id, data in summary.items():
+        # Stay in Decimal so large balances do not pick up float drift
+        current_price = convert_decimal(Decimal(str(prices.get(coin_id, {}).get("usd", 0))), rate)
+        current_value = current_price * data["amount"]
+        # The ledger is in USD; the cost basis is converted at today's rate like everything else
+        total_spent = convert_decimal(data["total_spent"], rate)
+        profit_loss = current_value - total_spent
+
+        portfolio_data.append({
+            "coin_id": coin_id,
+            "amount": round(data["amount"], 8),
+            "total_spent": round(total_spent, 2),
+            "current_price": round(current_price, 2),
+            "current_value": round(current_value, 2),
+            "profit_loss": round(profit_loss, 2)
+        })
+    return portfolio_data
 
 
 class CryptoListView(APIView):
     def get(self, request):
-        cache_key = "crypto_list"
+        try:
+            query = parse_market_query(request.query_params)
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         if request.query_params.get("refresh") == "true":
-            cache.delete(cache_key)
-            cached_data = None
-
-        url = "https://api.coingecko.com/api/v3/coins/markets"
-        params = {
-            "vs_currency": "usd",
-            "order": "market_cap_desc",
-            "per_page": 20,
-            "page": 1,
-            "sparkline": False
-        }
+            refresh_market_snapshot()
 
-        data = get_cached_data(cache_key, url, params)
+        snapshot_version = entry_version(MARKETS_CACHE_KEY)
+        version = fx_version(snapshot_version, currency)
+        data = get_market_snapshot()
 
         if "error" in data:
             return Response(data, status=status.HTTP_502_BAD_GATEWAY)
 
-        result = [
-            {
-                "name": coin.get("name"),
-                "image": coin.get("image"),
-                "symbol": coin.get("symbol"),
-                "current_price": coin.get("current_price"),
-                "market_cap": coin.get("market_cap"),
-                "market_cap_rank": coin.get("market_cap_rank")
-            }
-            for coin in data
-        ]
-
-        return Response(result)
+        try:
+            rate = usd_rate(currency)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return Response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        # Still read through the cache first so a stale snapshot gets its background refresh
+        response = not_modified(request, version)
+        if response is not None:
+            return response
+
+        # Sorting, filtering and paging run in memory over the whole USD snapshot, never upstream
+        query["filters"] = usd_bounds(query["filters"], rate)
+        total, coins = market_index(data, snapshot_version).query(**query)
+        response = add_version_headers(Response(format_crypto_list(coins, rate)), version)
+        return add_page_headers(response, request, total, query["page"], query["page_size"])
 
 class CryptoDetailView(APIView):
     def get(self, request, slug):
+        try:
+            currency = parse_currency(request.query_params.get("currency"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         cache_key = f"crypto_detail_{slug}"
-        url = f"https://api.coingecko.com/api/v3/coins/{slug}"
+        url = f"/coins/{slug}"
+        version = fx_version(entry_version(cache_key), currency)
         data = get_cached_data(cache_key, url)
 
         if "error" in data:
             return Response(data, status=status.HTTP_502_BAD_GATEWAY)
 
-        result = {
-            "name": data.get("name"),
-            "image": data.get("image", {}).get("thumb"),
-            "symbol": data.get("symbol"),
-            "current_price": data.get("market_data", {}).get("current_price", {}).get("usd", "N/A"),
-            "rank": data.get("market_cap_rank", "N/A"),  # Rating on CoinGecko
-            "price_change_percentage_24h": data.get("market_data", {}).get("price_change_percentage_24h", "N/A"), # Change in 24 hours
-            "market_cap": data.get("market_data", {}).get("market_cap", {}).get("usd", "N/A"),
-            "total_volume": data.get("market_data", {}).get("total_volume", {}).get("usd", "N/A"),
-            "total_supply": data.get("market_data", {}).get("total_supply", "N/A"),  # may be none
-            "max_supply": data.get("market_data", {}).get("max_supply", "N/A"),  # may be none
-            "circulating_supply": data.get("market_data", {}).get("circulating_supply", "N/A"),  # may be none
-            "fdv": data.get("market_data", {}).get("fully_diluted_valuation", {}).get("usd", "N/A"),
-            "high_24h": data.get("market_data", {}).get("high_24h", {}).get("usd", "N/A"),  # Lowest
-            "low_24h": data.get("market_data", {}).get("low_24h", {}).get("usd", "N/A"),  # And Highest price in 24h
-            "ath": data.get("market_data", {}).get("ath", {}).get("usd", "N/A"),  # The Highest price of all time
-        }
+        try:
+            rate = usd_rate(currency)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return Response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        return not_modified(request, version) or add_version_headers(Response(format_crypto_detail(data, rate)), version)
+
+class ChartView(APIView):
+    def get(self, request, slug):
+        try:
+            interval_type, chart_type, max_points = parse_chart_query(request.query_params)
+            currency = parse_currency(request.query_params.get("currency"))
+            rate = usd_rate(currency)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return Response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        # Same cached USD series (and downsampled resolutions) the chart WebSocket serves
+        chart_data = getChartData(slug, interval_type, chart_type, max_points)
+
+        if is_error(chart_data):
+            return Response(chart_data, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response(snapshot_message(slug, interval_type, chart_type, convert_points(chart_data, rate, chart_type)))
 
-        return Response(result)
+class CoinSearchView(APIView):
+    def get(self, request):
+        try:
+            query, limit = parse_search_query(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Answered from the in-process index; the coin list behind it is only reread when it changes
+        index = get_search_index()
+        if is_error(index):
+            return Response(index, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response({"query": query, "results": index.search(query, limit)})
 
 class PortfolioSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        transactions = PortfolioTransaction.objects.filter(user=request.user)
-        summary = {}
-
-        for tx in transactions:
-            if tx.coin_id not in summary:
-                summary[tx.coin_id] = {
-                    "amount": 0,
-                    "total_spent": 0,
-                }
-
-            fee = float(tx.fee) if tx.fee else 0
-            amount = float(tx.amount)
-            price = float(tx.price_usd)
-
-            if tx.type == "buy":
-                summary[tx.coin_id]["amount"] += amount
-                summary[tx.coin_id]["total_spent"] += amount * price + fee
-            elif tx.type == "sell":
-                summary[tx.coin_id]["amount"] -= amount
-                summary[tx.coin_id]["total_spent"] -= amount * price - fee
-            elif tx.type == "transfer_in":
-                summary[tx.coin_id]["amount"] += amount
-            elif tx.type == "transfer_out":
-                summary[tx.coin_id]["amount"] -= amount + fee
-
-        coin_ids = ",".join(summary.keys())
-        url = "https://api.coingecko.com/api/v3/simple/price"
-        params = {
-            "ids": coin_ids,
-            "vs_currencies": "usd"
-        }
+        try:
+            rate = usd_rate(parse_currency(request.query_params.get("currency")))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if is_error(rate):
+            return Response(rate, status=status.HTTP_502_BAD_GATEWAY)
+
+        if request.query_params.get("source") == "ledger":
+            # Recompute straight from the ledger in one grouped query, e.g. to cross-check holdings
+            summary = summary_from_ledger(aggregate_holdings(PortfolioTransaction.objects.filter(user=request.user)))
+        else:
+            # Positions are maintained on every insert, so this is one row per coin regardless of history length
+            summary = summary_from_holdings(PortfolioHolding.objects.filter(user=request.user).order_by("id"))
 
-        cache_key = f"coingecko_prices_{coin_ids.replace(',', '_')}"
-        prices = get_cached_data(cache_key, url, params=params)
+        # Per coin cache keys, so only coins no other portfolio has asked for recently hit CoinGecko
+        prices = get_prices(summary.keys())
 
-        portfolio_data = []
-        for coin_id, data in summary.items():
-            current_price = prices.get(coin_id, {}).get("usd", 0)
-            current_value = current_price * data["amount"]
-            profit_loss = current_value - data["total_spent"]
+        return Response(summarize_portfolio(summary, prices, rate))
 
-            portfolio_data.append({
-                "coin_id": coin_id,
-                "amount": round(data["amount"], 8),
-                "total_spent": round(data["total_spent"], 2),
-                "current_price": round(current_price, 2),
-                "current_value": round(current_value, 2),
-                "profit_loss": round(profit_loss, 2)
-            })
+class PortfolioHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        return Response(portfolio_data)
+    def get(self, request):
+        interval_type = request.query_params.get("interval_type", "daily")
+        if interval_type not in CHART_REFRESH_INTERVALS:
+            return Response({"error": f"Invalid interval_type: {interval_type}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Value and P&L on the interval's chart grid, cached until the next transaction
+        return Response(get_portfolio_history(request.user, interval_type))
 
 class PortfolioTransactionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        transactions = PortfolioTransaction.objects.filter(user=request.user).order_by("-timestamp")
-        serializer = PortfolioTransactionSerializer(transactions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        transactions = PortfolioTransaction.objects.filter(user=request.user)
+
+        coin_id = request.query_params.get("coin_id")
+        if coin_id:
+            transactions = transactions.filter(coin_id=coin_id)
+
+        tx_type = request.query_params.get("type")
+        if tx_type:
+            if tx_type not in dict(PortfolioTransaction.TRANSACTION_TYPES):
+                return Response({"error": f"Invalid type: {tx_type}"}, status=status.HTTP_400_BAD_REQUEST)
+            transactions = transactions.filter(type=tx_type)
+
+        for param, lookup in (("date_from", "timestamp__gte"), ("date_to", "timestamp__lte")):
+            value = request.query_params.get(param)
+            if value:
+                moment = parse_query_datetime(value, end_of_day=param == "date_to")
+                if moment is None:
+                    return Response({"error": f"Invalid {param}: {value}"}, status=status.HTTP_400_BAD_REQUEST)
+                transactions = transactions.filter(**{lookup: moment})
+
+        paginator = TransactionCursorPagination()
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = PortfolioTransactionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = PortfolioTransactionSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            with transaction.atomic():
+                tx = serializer.save(user=request.user)
+                apply_transaction(tx)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PortfolioImportView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"error": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = detect_format(upload, request.data.get("format"))
+        if file_format is None:
+            return Response({"error": f"format must be one of {', '.join(IMPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows = read_rows(upload, file_format)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Rows are streamed from the uploaded file and written in batches, never held in memory at once
+        report = import_transactions(request.user, rows)
+        if is_error(report) or (report["failed"] and not report["imported"]):
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
 class FavoriteCoinView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -195,4 +399,53 @@ class FavoriteCoinView(APIView):
             if deleted:
                 return Response({"message": "Deleted from favorites"}, status=status.HTTP_204_NO_CONTENT)
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
-        return Response({"error": "coin_id required"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({"error": "coin_id required"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PriceAlertView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        alerts = PriceAlert.objects.filter(user=request.user).order_by("-created_at")
+        if request.query_params.get("active") == "true":
+            alerts = alerts.filter(is_active=True)
+        serializer = PriceAlertSerializer(alerts, many=True)
+        return Response(serializer.data)
+
+    def post(self, request):
+        # Evaluated by the poller's alert engine on every price batch; fired alerts arrive on ws/alerts/
+        serializer = PriceAlertSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request):
+        alert_id = request.data.get("id")
+        if alert_id:
+            deleted, _ = PriceAlert.objects.filter(user=request.user, id=alert_id).delete()
+            if deleted:
+                return Response({"message": "Alert deleted"}, status=status.HTTP_204_NO_CONTENT)
+            return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"error": "id required"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UpstreamPoolStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "pool": coingecko.pool_stats(),
+            "cache": refresh_stats.snapshot(),
+            "cache_tiers": tier_stats.snapshot(),
+            "rate_limit": limiter.stats.snapshot(),
+        })
+
+
+@require_GET
+def metrics_view(request):
+    # A plain view: scrapers hold a static token, not a JWT
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if settings.METRICS_TOKEN and not secrets.compare_digest(request.headers.get("Authorization", ""), expected):
+        return HttpResponse(status=401)
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)